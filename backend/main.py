@@ -1,12 +1,67 @@
+import os
 import uuid
-import json
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Header, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from backend.models.schemas import ChatRequest, ChatResponse, SSEEvent, SSEEventType
 from backend.services.openai_service import OpenAIService
+from backend.services.backend_pool import backend_urls
+from backend.services.conversation_store import create_conversation_store
+from backend.services.admission import AdmissionRejected, create_admission_controller
+from backend.services.tracing import METRICS, Trace
+from backend.services.memory_profile import memory_report, start_tracing
+from backend.services.sse import coalesce_content
+from backend.services.resumable_stream import ResumableStream, StreamRegistry, parse_last_event_id
 
-app = FastAPI(title="AI Chat System", version="1.0.0")
+async def warm_up(service: OpenAIService):
+    """在后台线程中导入上游 SDK 并创建客户端，启动 LLM 后端的健康检查，然后预热模型并启动保活"""
+    await asyncio.to_thread(service.preload)
+    service.backend_pool.start()
+    await service.model_keeper.warm_up()
+    if service.model_keeper.last_error:
+        print(f"模型预热失败: {service.model_keeper.last_error}")
+    service.model_keeper.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MEMORY_TRACE 开启时从启动开始跟踪分配，/api/memory 中按代码行汇总
+    start_tracing()
+    # 服务对象创建很快（SDK 在 warm_up 中导入），启动后立即可以响应 /health
+    service = get_openai_service()
+    warm_up_task = asyncio.create_task(warm_up(service)) if service is not None else None
+    # 定期清理过期的流，没有新请求时也释放已完成的流的缓冲
+    registry = stream_registry
+    registry.start_sweeper()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+        try:
+            await warm_up_task
+        except asyncio.CancelledError:
+            pass
+    if openai_service is not None:
+        await openai_service.model_keeper.stop()
+        await openai_service.backend_pool.stop()
+    await registry.stop_sweeper()
+    await stream_registry.close()
+    # aiosqlite 的连接运行在非守护线程上，不关闭时进程无法退出
+    if openai_service is not None:
+        if openai_service.tavily_service.cache is not None:
+            await openai_service.tavily_service.cache.close()
+        if openai_service.response_cache is not None:
+            await openai_service.response_cache.close()
+    # 生成任务结束后关闭共享的上游连接池
+    if openai_service is not None:
+        await openai_service.http_clients.aclose()
+    # 关闭前提交缓冲中的对话写入
+    await conversation_store.close()
+
+app = FastAPI(title="AI Chat System", version="1.0.0", lifespan=lifespan)
 
 # CORS 配置
 app.add_middleware(
@@ -17,12 +72,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化服务
-try:
-    openai_service = OpenAIService()
-except Exception as e:
-    print(f"服务初始化失败: {e}")
-    openai_service = None
+# 服务在 lifespan 启动时（或第一次请求时）创建，导入本模块不连接上游也不导入上游 SDK
+openai_service: Optional[OpenAIService] = None
+service_error: Optional[str] = None
+_service_lock = threading.Lock()
+
+def get_openai_service() -> Optional[OpenAIService]:
+    """返回服务实例，第一次调用时创建；创建失败时返回 None，之后不再重试"""
+    global openai_service, service_error
+    if openai_service is None and service_error is None:
+        with _service_lock:
+            if openai_service is None and service_error is None:
+                try:
+                    openai_service = OpenAIService()
+                except Exception as e:
+                    service_error = f"{type(e).__name__}: {str(e)}"
+                    print(f"服务初始化失败: {e}")
+    return openai_service
+
+def require_service() -> OpenAIService:
+    service = get_openai_service()
+    if service is None:
+        raise HTTPException(status_code=503, detail="服务未正确初始化")
+    return service
+
+# 对话历史存储
+conversation_store = create_conversation_store()
+
+# 可断点续传的流式生成
+stream_registry = StreamRegistry()
+
+# 是否在流式响应的 done 之前发送 timing 事件（各阶段耗时）
+SSE_TIMING_EVENT = os.environ.get("SSE_TIMING_EVENT", "").lower() in ("1", "true", "yes")
+
+# 准入控制：限制同时进行的生成数，超出的请求排队；节点数直接从环境变量读取，不需要先创建服务，
+# 第一次接纳请求时按服务的后端池收缩到当前可用节点的容量
+admission = create_admission_controller(len(backend_urls()))
+
+def admit_request(service: OpenAIService):
+    """申请准入，不可用或队列已满时立即拒绝并带上 Retry-After"""
+    pool = service.backend_pool
+    if not pool.any_available():
+        raise HTTPException(
+            status_code=503,
+            detail="所有 LLM 后端都不可用",
+            headers={"Retry-After": str(max(1, int(pool.recovery_timeout)))}
+        )
+    # 上限跟随这个服务的后端池：节点熔断时不会把全部请求压到剩下的节点上
+    admission.capacity = pool.capacity
+    try:
+        return admission.enter()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
 
 @app.get("/")
 def root():
@@ -30,72 +131,208 @@ def root():
 
 @app.get("/health")
 def health_check():
-    """健康检查端点"""
-    if openai_service is None:
-        raise HTTPException(status_code=503, detail="服务未正确初始化")
-    return {"status": "healthy", "message": "All services are running"}
+    """健康检查端点
+
+    up 表示有可用的 LLM 后端；warm 表示模型已加载，第一个请求不需要等待模型加载
+    """
+    service = require_service()
+    pool = service.backend_pool
+    up = pool.any_available()
+    return {
+        "status": "healthy" if up else "degraded",
+        "message": "All services are running" if up else "所有 LLM 后端都不可用",
+        "up": up,
+        "warm": service.model_keeper.is_warm(),
+        "backends": pool.status(),
+        "models": service.model_keeper.status()
+    }
+
+@app.get("/api/stats")
+def get_stats():
+    """运行统计（缓存命中率等）"""
+    service = require_service()
+    return {
+        "search_cache": service.tavily_service.cache_stats(),
+        "semantic_cache": service.tavily_service.semantic_cache_stats(),
+        "response_cache": service.response_cache.stats() if service.response_cache is not None else None,
+        "search_single_flight": service.tavily_service.single_flight.stats(),
+        "planning_single_flight": service.planning_flight.stats(),
+        "context": service.context_manager.stats(),
+        "prompt_prefix": service.prefix_tracker.stats(),
+        "admission": admission.stats(),
+        "streams": stream_registry.stats(),
+        "http": service.http_clients.stats()
+    }
+
+@app.get("/api/memory")
+def get_memory(limit: int = Query(20, ge=1, le=200)):
+    """内存报告：RSS、内存预算，以及 MEMORY_TRACE 开启时分配最多的代码行"""
+    return memory_report(limit)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 文本格式的指标"""
+    stats = admission.stats()
+    METRICS.set_gauge("admission_in_flight", stats["in_flight"])
+    METRICS.set_gauge("admission_queued", stats["queued"])
+    service = get_openai_service()
+    if service is not None:
+        for backend in service.backend_pool.status():
+            METRICS.set_gauge("llm_backend_in_flight", backend["in_flight"], backend=backend["url"])
+            METRICS.set_gauge("llm_backend_up", 1 if backend["healthy"] and backend["state"] != "open" else 0, backend=backend["url"])
+        service.http_clients.update_metrics()
+        service.model_keeper.update_metrics()
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/api/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, x_request_id: Optional[str] = Header(None)):
     """非流式聊天端点"""
-    if openai_service is None:
-        raise HTTPException(status_code=503, detail="OpenAI 服务未初始化")
+    service = require_service()
+    ticket = admit_request(service)
+    try:
+        await ticket.wait()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    except BaseException:
+        # 排队期间被取消（客户端断开），让出队列位置；已获得的槽位同样归还
+        ticket.release()
+        raise
     
     try:
         # 生成对话 ID
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
-        # 调用 OpenAI 服务
-        result = openai_service.chat_completion(request.message)
+        history = await conversation_store.get_messages(conversation_id)
+        
+        trace = Trace(x_request_id, mode="chat")
+        response.headers["X-Request-Id"] = trace.request_id
+        
+        # 调用 OpenAI 服务（同步客户端，放到线程池中执行）
+        include_reasoning = request.include_reasoning if request.include_reasoning is not None else service.include_reasoning
+        result = await run_in_threadpool(
+            service.chat_completion, request.message, history, trace, request.fast, include_reasoning
+        )
         
         if result["success"]:
+            await conversation_store.append(conversation_id, result["messages"])
             return ChatResponse(
                 response=result["response"],
                 conversation_id=conversation_id,
-                tool_calls_made=result.get("tool_calls_made", [])
+                tool_calls_made=result.get("tool_calls_made", []),
+                reasoning=result.get("reasoning")
             )
         else:
             raise HTTPException(status_code=500, detail=result["error"])
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
+
+def stream_response(stream: ResumableStream, after_seq: int = 0, request_id: Optional[str] = None) -> StreamingResponse:
+    """将可续传的流作为 SSE 响应返回，从 after_seq 之后开始发送"""
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Expose-Headers": "X-Conversation-Id, X-Request-Id, X-Stream-Id",
+        "X-Stream-Id": stream.stream_id,
+        "X-Conversation-Id": stream.conversation_id or "",
+    }
+    if request_id:
+        headers["X-Request-Id"] = request_id
+    return StreamingResponse(stream.subscribe(after_seq), media_type="text/event-stream", headers=headers)
 
 @app.post("/api/chat/stream")
-def chat_stream(request: ChatRequest):
-    """流式聊天端点"""
-    if openai_service is None:
-        raise HTTPException(status_code=503, detail="OpenAI 服务未初始化")
+async def chat_stream(
+    request: ChatRequest,
+    x_request_id: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None)
+):
+    """流式聊天端点
+
+    生成在后台任务中进行，与连接解耦。断线后带 Last-Event-ID 重新请求时，
+    如果对应的生成仍在缓冲中，则重放缺失的事件并继续接收，不会重新提问。
+    """
+    service = require_service()
+    
+    resume = parse_last_event_id(last_event_id)
+    if resume is not None:
+        stream = stream_registry.get(resume[0])
+        if stream is not None:
+            return stream_response(stream, resume[1])
+    
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    ticket = admit_request(service)
+    # 请求 ID 可由客户端通过 X-Request-Id 传入，用于关联日志和指标
+    trace = Trace(x_request_id)
     
     async def generate():
         try:
-            async for event in openai_service.chat_completion_stream(request.message):
-                # 格式化为 SSE 格式
-                sse_data = json.dumps(event, ensure_ascii=False)
-                yield f"data: {sse_data}\n\n"
+            # 排队期间推送当前位置
+            async for position in ticket.positions():
+                yield {
+                    "type": "status",
+                    "content": f"排队中，前面还有 {position} 个请求",
+                    "queue_position": position
+                }
+            
+            history = await conversation_store.get_messages(conversation_id)
+            turn_messages = []
+            events = service.chat_completion_stream(
+                request.message, history, turn_messages, trace, request.fast, request.include_reasoning
+            )
+            # 时间窗口内的内容增量合并为一帧，减少每个 token 一次的写入
+            async for event in coalesce_content(events, request.coalesce_ms):
+                if event["type"] == "done":
+                    # 在发送 done 之前保存本轮消息，整轮只写一次
+                    if turn_messages:
+                        await conversation_store.append(conversation_id, turn_messages)
+                    if SSE_TIMING_EVENT:
+                        yield {"type": "timing", "request_id": trace.request_id, "timing": trace.summary()}
+                yield event
         except Exception as e:
-            error_event = {
+            yield {
                 "type": "error",
                 "content": f"{type(e).__name__}: {str(e)}"
             }
-            sse_data = json.dumps(error_event, ensure_ascii=False)
-            yield f"data: {sse_data}\n\n"
+        finally:
+            ticket.release()
     
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-        }
-    )
+    stream = stream_registry.start(uuid.uuid4().hex, generate(), conversation_id)
+    return stream_response(stream, request_id=trace.request_id)
+
+@app.get("/api/chat/stream/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[int] = Query(None, ge=0)
+):
+    """重新连接到进行中或最近完成的流（兼容 EventSource 的自动重连）"""
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="流不存在或已过期")
+    resume = parse_last_event_id(last_event_id)
+    after_seq = after if after is not None else (resume[1] if resume and resume[0] == stream_id else 0)
+    return stream_response(stream, after_seq)
 
 @app.get("/api/conversations/{conversation_id}")
-def get_conversation(conversation_id: str):
-    """获取对话历史（暂时返回空实现）"""
+async def get_conversation(
+    conversation_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """获取对话历史（分页）"""
+    messages = await conversation_store.get_messages(conversation_id, offset, limit)
+    total = await conversation_store.count(conversation_id)
     return {
         "conversation_id": conversation_id,
-        "messages": []
+        "messages": messages,
+        "total": total,
+        "offset": offset,
+        "limit": limit
     }
 
 if __name__ == "__main__":
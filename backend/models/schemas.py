@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from enum import Enum
 
@@ -27,6 +27,14 @@ class SSEEventType(str, Enum):
     CONTENT = "content"
     ERROR = "error"
     DONE = "done"
+    TIMING = "timing"
+    REASONING = "reasoning"  # 模型的推理过程（<think> 块），请求 include_reasoning 时才发送
+
+# 快速模式：在指定的调用上关闭 qwen3 的推理
+class FastMode(str, Enum):
+    PLANNING = "planning"  # 第一次调用（决定是否搜索；不搜索时也是最终回答）
+    FINAL = "final"  # 工具调用之后生成回答的调用
+    ALL = "all"
 
 # SSE 事件
 class SSEEvent(BaseModel):
@@ -34,13 +42,26 @@ class SSEEvent(BaseModel):
     content: Optional[str] = None
     tool_name: Optional[str] = None
     tool_args: Optional[Dict[str, Any]] = None
+    tool_call_id: Optional[str] = None
+    tool_status: Optional[str] = None  # started / completed / failed
+    queue_position: Optional[int] = None  # 排队时前面的请求数
+    round: Optional[int] = None  # 多轮工具调用中的轮次（从 1 开始）
+    request_id: Optional[str] = None
+    timing: Optional[Dict[str, Any]] = None  # 各阶段耗时，见 Trace.summary
 
 # API 请求响应
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    # 流式接口合并内容增量的时间窗口（毫秒），0 表示逐 token 发送，未指定时使用 SSE_COALESCE_MS
+    coalesce_ms: Optional[float] = Field(None, ge=0, le=1000)
+    # 关闭推理的调用，未指定时正常推理
+    fast: Optional[FastMode] = None
+    # 是否返回推理过程（流式为 reasoning 事件），未指定时使用 STREAM_REASONING
+    include_reasoning: Optional[bool] = None
 
 class ChatResponse(BaseModel):
     response: str
     conversation_id: str
-    tool_calls_made: Optional[List[str]] = None
\ No newline at end of file
+    tool_calls_made: Optional[List[str]] = None
+    reasoning: Optional[str] = None
\ No newline at end of file
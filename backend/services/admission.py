@@ -0,0 +1,226 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Dict, Any, Optional, AsyncIterator
+
+from backend.services.memory_profile import setting
+
+# 上限随可用后端变化时，排队的请求每隔这么久（秒）重新检查一次
+CAPACITY_POLL_INTERVAL = 1.0
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：队列已满（429）或排队超时（503）"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+
+class AdmissionTicket:
+    """一个请求的准入凭证；排队期间可以查询位置，结束后必须 release"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._admitted = asyncio.get_running_loop().create_future()
+        self._moved = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self._admitted.done()
+
+    @property
+    def position(self) -> int:
+        """排在前面的请求数，0 表示已经获得执行槽位或排在队首"""
+        return self.controller._position(self)
+
+    async def wait(self):
+        """等待获得执行槽位，超过 queue_timeout 时抛出 AdmissionRejected"""
+        async for _ in self.positions():
+            pass
+
+    async def positions(self) -> AsyncIterator[int]:
+        """排队期间每当位置变化时产出当前位置，获得槽位后结束"""
+        timeout = self.controller.queue_timeout
+        deadline = self.enqueued_at + timeout if timeout > 0 else None
+        last = None
+        while not self.admitted:
+            self._moved.clear()
+            # 后端恢复后上限变大，不必等到有请求结束才放行
+            self.controller._pump()
+            if self.admitted:
+                break
+            position = self.position
+            if position != last:
+                last = position
+                yield position
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self.release()
+                raise self.controller._rejection(503, "排队超时，服务繁忙")
+            if self.controller.capacity is not None:
+                remaining = CAPACITY_POLL_INTERVAL if remaining is None else min(remaining, CAPACITY_POLL_INTERVAL)
+            waiter = asyncio.ensure_future(self._moved.wait())
+            try:
+                await asyncio.wait({waiter, self._admitted}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """聊天请求的准入控制
+
+    - 同时执行的生成数不超过 max_in_flight（每个后端的并发上限 × 后端数）；设置 capacity 时
+      还不超过当前可用后端的容量（见 BackendPool.capacity），节点熔断时多出的请求留在队列中
+    - 超出的请求按到达顺序（FIFO）排队，队列长度不超过 max_queue
+    - 队列已满时立即拒绝（429），排队超过 queue_timeout 时拒绝（503），都带 Retry-After
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 2,
+        max_queue: int = 16,
+        queue_timeout: float = 60,
+        capacity: Optional[Callable[[], Optional[int]]] = None
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight 至少为 1")
+        self.max_in_flight = max_in_flight
+        # 返回当前可用后端能承担的请求数，None 表示不限
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._queue: Deque[AdmissionTicket] = deque()
+        # 单次生成耗时的滑动平均，用于估算 Retry-After
+        self.ewma_service_time: Optional[float] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def limit(self) -> int:
+        """当前同时执行的生成数上限"""
+        available = self.capacity() if self.capacity is not None else None
+        return self.max_in_flight if available is None else min(self.max_in_flight, available)
+
+    def enter(self) -> AdmissionTicket:
+        """申请准入；有空闲槽位时立即获得，否则排队，队列已满时抛出 AdmissionRejected"""
+        ticket = AdmissionTicket(self)
+        if self.in_flight < self.limit and not self._queue:
+            self._admit(ticket)
+            return ticket
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise self._rejection(429, "请求过多，队列已满")
+        self._queue.append(ticket)
+        return ticket
+
+    def _admit(self, ticket: AdmissionTicket):
+        self.in_flight += 1
+        self.admitted += 1
+        ticket.admitted_at = time.monotonic()
+        ticket._admitted.set_result(None)
+
+    def _position(self, ticket: AdmissionTicket) -> int:
+        if ticket.admitted:
+            return 0
+        try:
+            return self._queue.index(ticket)
+        except ValueError:
+            return 0
+
+    def _release(self, ticket: AdmissionTicket):
+        if not ticket.admitted:
+            # 排队中放弃（客户端断开或超时），后面的请求位置前移
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+            self._notify_moved()
+            return
+
+        self.in_flight -= 1
+        elapsed = time.monotonic() - ticket.admitted_at
+        if self.ewma_service_time is None:
+            self.ewma_service_time = elapsed
+        else:
+            self.ewma_service_time += 0.2 * (elapsed - self.ewma_service_time)
+
+        self._pump()
+
+    def _pump(self):
+        """按当前上限放行队首的请求"""
+        admitted = False
+        limit = self.limit
+        while self._queue and self.in_flight < limit:
+            self._admit(self._queue.popleft())
+            admitted = True
+        if admitted:
+            self._notify_moved()
+
+    def _notify_moved(self):
+        for waiting in self._queue:
+            waiting._moved.set()
+
+    def _rejection(self, status_code: int, detail: str) -> AdmissionRejected:
+        if status_code == 503:
+            self.timed_out += 1
+        return AdmissionRejected(status_code, detail, self.retry_after())
+
+    def retry_after(self) -> int:
+        """估算排队清空所需的秒数"""
+        service_time = self.ewma_service_time or 1.0
+        waves = (len(self._queue) + 1) / max(1, self.limit)
+        return max(1, math.ceil(service_time * waves))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": len(self._queue),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "ewma_service_time_ms": (
+                round(self.ewma_service_time * 1000, 1) if self.ewma_service_time is not None else None
+            )
+        }
+
+
+def create_admission_controller(
+    backend_count: int = 1,
+    capacity: Optional[Callable[[], Optional[int]]] = None
+) -> AdmissionController:
+    """根据环境变量创建准入控制器；capacity 一般是 BackendPool.capacity，上限随节点熔断和恢复变化
+
+    LLM_MAX_IN_FLIGHT_PER_BACKEND: 每个后端同时执行的生成数，默认 2
+    ADMISSION_MAX_QUEUE: 排队上限，默认 16
+    ADMISSION_QUEUE_TIMEOUT: 最长排队时间（秒），默认 60，0 表示不限
+    """
+    per_backend = int(os.environ.get("LLM_MAX_IN_FLIGHT_PER_BACKEND", "2"))
+    return AdmissionController(
+        max_in_flight=per_backend * max(1, backend_count),
+        max_queue=int(setting("ADMISSION_MAX_QUEUE", "16")),
+        queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "60")),
+        capacity=capacity
+    )
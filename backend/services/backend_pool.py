@@ -0,0 +1,318 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import List, Dict, Any, Optional
+
+from backend.services.http_pool import HTTPClients
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class NoBackendAvailableError(RuntimeError):
+    """所有后端节点都处于熔断状态"""
+
+
+class LLMBackend:
+    """一个 OpenAI 兼容的后端节点（如一台 Ollama），使用共享连接池中的长连接
+
+    SDK 客户端在第一次使用时创建：导入 openai 需要几百毫秒，不放在服务启动的路径上。
+    """
+
+    def __init__(self, url: str, http_clients: Optional[HTTPClients] = None):
+        self.url = url
+        self.http_clients = http_clients or HTTPClients()
+        self._client = None
+        self._async_client = None
+        self.in_flight = 0
+        self.total_requests = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.healthy = True
+        self.last_probe: Optional[float] = None
+        self._trial_in_flight = False
+
+    def _client_options(self, upstream_client) -> Dict[str, Any]:
+        return {
+            "base_url": self.url,
+            "api_key": "ollama",  # Ollama 不需要真实的 API key，只需要一个占位符
+            # SDK 会用自己的超时覆盖客户端的设置，这里传入同一份分阶段超时
+            "timeout": self.http_clients.config.timeout("llm"),
+            "http_client": upstream_client
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(**self._client_options(self.http_clients.sync_client("llm")))
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(**self._client_options(self.http_clients.async_client("llm")))
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, value):
+        self._async_client = value
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None
+        }
+
+
+class BackendLease:
+    """一次请求对后端的占用；流式请求可在收到首个 token 时调用 first_token 记录延迟"""
+
+    def __init__(self, pool: "BackendPool", backend: LLMBackend):
+        self.pool = pool
+        self.backend = backend
+        self.started = time.perf_counter()
+        self.latency: Optional[float] = None
+
+    def first_token(self):
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.started
+
+    def _finish(self, error: Optional[BaseException]):
+        if error is not None and not isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            self.pool.record_failure(self.backend)
+            self.pool.release(self.backend)
+            return
+        if self.latency is None and error is None:
+            self.latency = time.perf_counter() - self.started
+        self.pool.release(self.backend, self.latency)
+
+
+class BackendPool:
+    """多节点 LLM 后端池
+
+    - 路由：least_outstanding（最少在途请求）或 latency（EWMA 首 token 延迟 × 在途数加权）
+    - 熔断：连续失败达到阈值后熔断，冷却后放行一个试探请求（半开）
+    - 并发上限：设置 max_in_flight_per_backend 时只选择还有空闲槽位的节点；
+      准入控制按 capacity() 限制同时执行的请求数，其余请求在准入队列中等待
+    - 健康检查：后台定期请求 /models
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        strategy: str = "least_outstanding",
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30,
+        probe_interval: float = 15,
+        ewma_alpha: float = 0.3,
+        http_clients: Optional[HTTPClients] = None,
+        max_in_flight_per_backend: int = 0
+    ):
+        if not urls:
+            raise ValueError("至少需要一个 LLM 后端地址")
+        if strategy not in ("least_outstanding", "latency"):
+            raise ValueError(f"未知的路由策略: {strategy}")
+        # 所有节点共用一个连接池，连接按节点地址区分
+        self.http_clients = http_clients or HTTPClients()
+        self.backends = [LLMBackend(url, self.http_clients) for url in urls]
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_interval = probe_interval
+        self.ewma_alpha = ewma_alpha
+        # 每个节点同时进行的请求数上限，0 表示不限
+        self.max_in_flight_per_backend = max_in_flight_per_backend
+        self._lock = threading.Lock()
+        self._rotation = 0
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _available(self, backend: LLMBackend, now: float) -> bool:
+        if backend.state == OPEN and now - backend.opened_at >= self.recovery_timeout:
+            backend.state = HALF_OPEN
+        if backend.state == HALF_OPEN:
+            return not backend._trial_in_flight
+        return backend.state == CLOSED
+
+    def _score(self, backend: LLMBackend):
+        if self.strategy == "latency":
+            # 尚无延迟数据的节点优先尝试
+            return ((backend.ewma_latency or 0.0) * (backend.in_flight + 1), backend.in_flight)
+        return (backend.in_flight, backend.ewma_latency or 0.0)
+
+    def acquire(self) -> LLMBackend:
+        """选择一个后端并增加其在途计数"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if self._available(b, now)]
+            if not candidates:
+                raise NoBackendAvailableError("所有 LLM 后端都不可用")
+            limit = self.max_in_flight_per_backend
+            if limit:
+                # 只在没有空闲槽位的节点时才超出上限：已接纳的请求在执行中途遇到节点熔断，
+                # 后续调用仍需完成；新请求由准入控制按 capacity() 拦在队列中
+                free = [b for b in candidates if b.in_flight < limit]
+                candidates = free or candidates
+            # 轮转起点，分数相同时在节点之间均匀分布
+            self._rotation = (self._rotation + 1) % len(self.backends)
+            candidates.sort(key=lambda b: (self.backends.index(b) - self._rotation) % len(self.backends))
+            backend = min(candidates, key=self._score)
+            if backend.state == HALF_OPEN:
+                backend._trial_in_flight = True
+            backend.in_flight += 1
+            backend.total_requests += 1
+            return backend
+
+    def release(self, backend: LLMBackend, latency: Optional[float] = None):
+        with self._lock:
+            backend.in_flight -= 1
+            backend._trial_in_flight = False
+            if latency is not None:
+                backend.consecutive_failures = 0
+                backend.state = CLOSED
+                if backend.ewma_latency is None:
+                    backend.ewma_latency = latency
+                else:
+                    backend.ewma_latency += self.ewma_alpha * (latency - backend.ewma_latency)
+
+    def record_failure(self, backend: LLMBackend):
+        with self._lock:
+            backend.consecutive_failures += 1
+            backend.total_failures += 1
+            if backend.state == HALF_OPEN or backend.consecutive_failures >= self.failure_threshold:
+                backend.state = OPEN
+                backend.opened_at = time.monotonic()
+
+    @contextmanager
+    def lease(self):
+        """同步请求使用的后端占用"""
+        lease = BackendLease(self, self.acquire())
+        try:
+            yield lease
+        except BaseException as e:
+            lease._finish(e)
+            raise
+        else:
+            lease._finish(None)
+
+    @asynccontextmanager
+    async def lease_async(self):
+        """异步请求使用的后端占用"""
+        lease = BackendLease(self, self.acquire())
+        try:
+            yield lease
+        except BaseException as e:
+            lease._finish(e)
+            raise
+        else:
+            lease._finish(None)
+
+    async def probe(self, backend: LLMBackend, timeout: float = 5):
+        """探测单个节点；成功时让已熔断的节点进入半开状态"""
+        try:
+            await backend.async_client.with_options(timeout=timeout, max_retries=0).models.list()
+        except Exception:
+            backend.healthy = False
+            self.record_failure(backend)
+        else:
+            backend.healthy = True
+            with self._lock:
+                if backend.state == OPEN:
+                    backend.state = HALF_OPEN
+        backend.last_probe = time.time()
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+
+    async def _probe_loop(self):
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.probe_interval)
+
+    def start(self):
+        """启动后台健康检查（需要在事件循环中调用）"""
+        if self.probe_interval > 0 and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [backend.status() for backend in self.backends]
+
+    def capacity(self) -> Optional[int]:
+        """当前可用节点能同时承担的请求数：正常节点按每个节点的上限计，半开节点只放行一个试探请求；
+        不限制每个节点的并发时返回 None"""
+        limit = self.max_in_flight_per_backend
+        if not limit:
+            return None
+        now = time.monotonic()
+        total = 0
+        with self._lock:
+            for backend in self.backends:
+                # _available 会把冷却结束的熔断节点转为半开
+                self._available(backend, now)
+                if backend.state == CLOSED:
+                    total += limit
+                elif backend.state == HALF_OPEN:
+                    total += 1
+        return total
+
+    def any_available(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(self._available(b, now) for b in self.backends)
+
+
+def backend_urls(base_url: Optional[str] = None) -> List[str]:
+    """后端地址列表：OLLAMA_BASE_URLS（逗号分隔的多个 OpenAI 兼容地址）优先于 OLLAMA_BASE_URL"""
+    if base_url:
+        return [base_url]
+    urls_env = os.environ.get("OLLAMA_BASE_URLS")
+    if urls_env:
+        return [url.strip() for url in urls_env.split(",") if url.strip()]
+    return [os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434/v1")]
+
+
+def create_backend_pool(base_url: Optional[str] = None, http_clients: Optional[HTTPClients] = None) -> BackendPool:
+    """根据环境变量创建后端池
+
+    OLLAMA_BASE_URLS / OLLAMA_BASE_URL: 后端地址，见 backend_urls
+    LLM_ROUTING: least_outstanding（默认）/ latency
+    LLM_FAILURE_THRESHOLD: 连续失败多少次后熔断，默认 3
+    LLM_RECOVERY_TIMEOUT: 熔断冷却时间（秒），默认 30
+    LLM_PROBE_INTERVAL: 健康检查间隔（秒），默认 15，0 表示关闭
+    LLM_MAX_IN_FLIGHT_PER_BACKEND: 每个节点同时进行的请求数，默认 2，0 表示不限
+    """
+    return BackendPool(
+        backend_urls(base_url),
+        strategy=os.environ.get("LLM_ROUTING", "least_outstanding"),
+        failure_threshold=int(os.environ.get("LLM_FAILURE_THRESHOLD", "3")),
+        recovery_timeout=float(os.environ.get("LLM_RECOVERY_TIMEOUT", "30")),
+        probe_interval=float(os.environ.get("LLM_PROBE_INTERVAL", "15")),
+        http_clients=http_clients,
+        max_in_flight_per_backend=int(os.environ.get("LLM_MAX_IN_FLIGHT_PER_BACKEND", "2"))
+    )
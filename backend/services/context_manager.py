@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from backend.services.prompt_prefix import canonical_message
+from backend.services.tool_registry import tools_json
+from backend.services.memory_profile import setting
+
+# 中日韩字符及全角标点，qwen 系列分词器中大多为一个字符一个 token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 每条消息的格式开销（角色标记、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ContextManager:
+    """在 token 预算内构建发送给模型的消息列表
+
+    - 每条消息的 token 数按内容缓存，多轮对话中只需计算新消息
+    - 历史中的 tool 消息（JSON 格式的搜索结果）压缩为标题和链接
+    - 超出预算时按完整回合从最旧的开始丢弃，保证 tool_calls 与 tool 结果成对出现
+    - 输出规范形式的消息，截断点按固定步长对齐，尽量保持提示词前缀稳定
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        stale_tool_chars: int = 120,
+        token_counter: Callable[[Optional[str]], int] = estimate_tokens,
+        cache_size: Optional[int] = None,
+        truncate_step: Optional[int] = None
+    ):
+        self.token_budget = token_budget or int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+        # 超出预算时每次至少丢弃的回合数
+        self.truncate_step = max(1, truncate_step or int(os.environ.get("CONTEXT_TRUNCATE_STEP", "4")))
+        self.stale_tool_chars = stale_tool_chars
+        self.token_counter = token_counter
+        self.cache_size = cache_size or int(setting("CONTEXT_CACHE_SIZE", "4096"))
+        self._cache: "OrderedDict[Tuple[Any, ...], int]" = OrderedDict()
+        self._compact_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._tools_tokens: Optional[Tuple[List[Dict[str, Any]], int]] = None
+        # 非流式路径在线程池中、流式路径在事件循环中同时使用缓存
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _cache_key(message: Dict[str, Any]) -> Tuple[Any, ...]:
+        tool_calls = message.get("tool_calls")
+        return (
+            message.get("role"),
+            message.get("content"),
+            message.get("tool_call_id"),
+            json.dumps(tool_calls, ensure_ascii=False, sort_keys=True) if tool_calls else None
+        )
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """计算单条消息的 token 数（带缓存）"""
+        key = self._cache_key(message)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+            self.cache_misses += 1
+
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.token_counter(message.get("content"))
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            tokens += self.token_counter(function.get("name")) + self.token_counter(function.get("arguments"))
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def count_tools(self, tools: Optional[List[Dict[str, Any]]]) -> int:
+        """工具定义也会占用上下文；工具列表通常是注册表中的同一个对象，使用注册时的序列化结果并按对象缓存"""
+        if not tools:
+            return 0
+        if self._tools_tokens is None or self._tools_tokens[0] is not tools:
+            self._tools_tokens = (tools, self.token_counter(tools_json(tools)))
+        return self._tools_tokens[1]
+
+    def compact_tool_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """将历史中的搜索结果压缩为查询、标题和链接"""
+        content = message.get("content") or ""
+        with self._lock:
+            compacted = self._compact_cache.get(content)
+            if compacted is not None:
+                self._compact_cache.move_to_end(content)
+                return {**message, "content": compacted}
+
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            data = None
+
+        if isinstance(data, dict) and "results" in data:
+            compact = {
+                "query": data.get("query"),
+                "results": [
+                    {"title": item.get("title", ""), "url": item.get("url", "")}
+                    for item in data.get("results", [])
+                ]
+            }
+            compacted = json.dumps(compact, ensure_ascii=False)
+        elif len(content) > self.stale_tool_chars:
+            compacted = content[:self.stale_tool_chars] + "..."
+        else:
+            compacted = content
+
+        with self._lock:
+            self._compact_cache[content] = compacted
+            if len(self._compact_cache) > self.cache_size:
+                self._compact_cache.popitem(last=False)
+        return {**message, "content": compacted}
+
+    @staticmethod
+    def split_turns(history: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """按用户消息切分回合"""
+        turns: List[List[Dict[str, Any]]] = []
+        for message in history:
+            if message.get("role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def build(
+        self,
+        system_prompt: str,
+        history: Optional[List[Dict[str, Any]]],
+        user_message: str,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """构建消息列表：系统提示词 + 预算内的历史回合 + 本轮用户消息
+
+        所有消息都转换为规范形式，且截断点按 truncate_step 个回合对齐，
+        这样相邻请求在大多数情况下共享字节一致的前缀，可以复用 Ollama 的 KV cache。
+        """
+        system = {"role": "system", "content": system_prompt}
+        user = {"role": "user", "content": user_message}
+        remaining = (
+            self.token_budget
+            - self.count_message(system)
+            - self.count_message(user)
+            - self.count_tools(tools)
+        )
+
+        turns = [
+            [
+                self.compact_tool_message(message) if message["role"] == "tool" else message
+                for message in map(canonical_message, turn)
+            ]
+            for turn in self.split_turns(history or [])
+        ]
+        turn_tokens = [self.count_messages(turn) for turn in turns]
+
+        # 找到最少需要丢弃的旧回合数
+        dropped = len(turns)
+        total = 0
+        for index in range(len(turns) - 1, -1, -1):
+            total += turn_tokens[index]
+            if total > remaining:
+                break
+            dropped = index
+        # 向上对齐到 truncate_step 的整数倍，截断点不会每轮都移动
+        if dropped:
+            dropped = min(len(turns), -(-dropped // self.truncate_step) * self.truncate_step)
+
+        messages = [system]
+        for turn in turns[dropped:]:
+            messages.extend(turn)
+        messages.append(user)
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "truncate_step": self.truncate_step,
+            "cache_size": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
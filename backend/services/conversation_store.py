@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from backend.services.memory_profile import setting
+
+
+class ConversationStore:
+    """对话历史存储的基类
+
+    消息使用 OpenAI 消息格式（role / content / tool_calls / tool_call_id），
+    读取时额外带上 timestamp。
+    """
+
+    async def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def get_messages(
+        self, conversation_id: str, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def count(self, conversation_id: str) -> int:
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """将缓冲中的写入落盘"""
+
+    async def close(self) -> None:
+        """释放资源"""
+
+    @staticmethod
+    def _stamp(message: Dict[str, Any], timestamp: float) -> Dict[str, Any]:
+        return {**message, "timestamp": timestamp}
+
+
+class MemoryConversationStore(ConversationStore):
+    """进程内存储，超过 max_conversations 时淘汰最久未访问的对话
+
+    max_messages 限制每个对话保留的消息数，超出时从最旧的完整回合（以用户消息开头）开始丢弃。
+    """
+
+    def __init__(self, max_conversations: int = 1000, max_messages: Optional[int] = None):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self._conversations: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    async def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        history = self._conversations.setdefault(conversation_id, [])
+        history.extend(self._stamp(message, now) for message in messages)
+        if self.max_messages and len(history) > self.max_messages:
+            cut = len(history) - self.max_messages
+            while cut < len(history) and history[cut].get("role") != "user":
+                cut += 1
+            del history[:cut]
+        self._conversations.move_to_end(conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    async def get_messages(
+        self, conversation_id: str, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        history = self._conversations.get(conversation_id)
+        if history is None:
+            return []
+        self._conversations.move_to_end(conversation_id)
+        end = None if limit is None else offset + limit
+        return list(history[offset:end])
+
+    async def count(self, conversation_id: str) -> int:
+        return len(self._conversations.get(conversation_id, []))
+
+
+class SQLiteConversationStore(ConversationStore):
+    """基于 aiosqlite 的持久化存储
+
+    写入先进入内存缓冲，由后台任务按 flush_interval 或 batch_size 批量提交，
+    一个流式回合只产生一次 append，不会为每个 token 做 I/O。
+    读取前会先提交缓冲，保证读到自己刚写入的消息。
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " conversation_id TEXT NOT NULL,"
+        " role TEXT NOT NULL,"
+        " content TEXT,"
+        " extra TEXT,"
+        " created_at REAL NOT NULL)"
+    )
+    _INDEX = "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id)"
+
+    def __init__(self, path: str = "conversations.db", flush_interval: float = 0.5, batch_size: int = 64):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._db = None
+        self._pending: List[Tuple[str, str, Optional[str], Optional[str], float]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+
+    async def _connect(self):
+        if self._db is None:
+            import aiosqlite
+            self._db = await aiosqlite.connect(self.path)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute(self._SCHEMA)
+            await self._db.execute(self._INDEX)
+            await self._db.commit()
+        return self._db
+
+    @staticmethod
+    def _row(conversation_id: str, message: Dict[str, Any], timestamp: float):
+        extra = {k: v for k, v in message.items() if k not in ("role", "content", "timestamp")}
+        return (
+            conversation_id,
+            message["role"],
+            message.get("content"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+            timestamp
+        )
+
+    async def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        self._pending.extend(self._row(conversation_id, message, now) for message in messages)
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            db = await self._connect()
+            await db.executemany(
+                "INSERT INTO messages (conversation_id, role, content, extra, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            await db.commit()
+            self.flushes += 1
+
+    async def get_messages(
+        self, conversation_id: str, offset: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        await self.flush()
+        db = await self._connect()
+        async with db.execute(
+            "SELECT role, content, extra, created_at FROM messages"
+            " WHERE conversation_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (conversation_id, -1 if limit is None else limit, offset)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        messages = []
+        for role, content, extra, created_at in rows:
+            message = {"role": role, "content": content}
+            if extra:
+                message.update(json.loads(extra))
+            messages.append(self._stamp(message, created_at))
+        return messages
+
+    async def count(self, conversation_id: str) -> int:
+        await self.flush()
+        db = await self._connect()
+        async with db.execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0]
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+def create_conversation_store() -> ConversationStore:
+    """根据环境变量创建对话存储
+
+    CONVERSATION_STORE: memory（默认）/ sqlite
+    CONVERSATION_DB_PATH: sqlite 数据库路径，默认 conversations.db
+    CONVERSATION_FLUSH_INTERVAL: 批量写入间隔（秒），默认 0.5
+    CONVERSATION_BATCH_SIZE: 缓冲达到该条数时立即写入，默认 64
+    CONVERSATION_MAX_CONVERSATIONS / CONVERSATION_MAX_MESSAGES: memory 存储保留的对话数（默认 1000）
+    和每个对话的消息数（默认不限）
+    """
+    backend = os.environ.get("CONVERSATION_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteConversationStore(
+            os.environ.get("CONVERSATION_DB_PATH", "conversations.db"),
+            flush_interval=float(os.environ.get("CONVERSATION_FLUSH_INTERVAL", "0.5")),
+            batch_size=int(os.environ.get("CONVERSATION_BATCH_SIZE", "64"))
+        )
+    if backend == "memory":
+        return MemoryConversationStore(
+            int(setting("CONVERSATION_MAX_CONVERSATIONS", "1000")),
+            int(setting("CONVERSATION_MAX_MESSAGES", "0")) or None
+        )
+    raise ValueError(f"未知的 CONVERSATION_STORE: {backend}")
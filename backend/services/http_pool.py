@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import threading
+from typing import List, Dict, Any, Callable, Optional, TYPE_CHECKING
+
+import httpx
+
+from backend.services.tracing import METRICS
+from backend.services.memory_profile import setting
+
+if TYPE_CHECKING:
+    import requests
+
+METRICS.describe("http_requests_total", "counter", "发往上游的 HTTP 请求数")
+METRICS.describe("http_connections_opened_total", "counter", "新建的上游连接数（未复用连接池中的连接）")
+METRICS.describe("http_connect_seconds", "histogram", "新建上游连接的耗时（TCP + TLS）")
+METRICS.describe("http_pool_connections", "gauge", "连接池中的连接数（active / idle）")
+
+# 各上游的读超时：LLM 的长提示词预填充和 token 间隔可能较长，搜索应当很快返回
+DEFAULT_READ_TIMEOUTS = {"llm": 120.0, "search": 30.0}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HTTPPoolConfig:
+    """上游连接池配置，所有上游共用
+
+    HTTP_MAX_CONNECTIONS: 每个上游的最大连接数（也是保持的空闲连接数），默认 32
+    HTTP_KEEPALIVE_EXPIRY: 空闲连接保持时间（秒），默认 60
+    HTTP_CONNECT_TIMEOUT / HTTP_WRITE_TIMEOUT / HTTP_POOL_TIMEOUT: 建连、发送、等待空闲连接的超时（秒），默认 5 / 10 / 10
+    LLM_READ_TIMEOUT / SEARCH_READ_TIMEOUT: 读超时（秒），默认 120 / 30
+    HTTP2: auto（默认，安装了 h2 时对 HTTPS 上游启用）/ 0
+    """
+
+    def __init__(self):
+        self.max_connections = int(setting("HTTP_MAX_CONNECTIONS", "32"))
+        self.keepalive_expiry = float(setting("HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+        self.write_timeout = float(os.environ.get("HTTP_WRITE_TIMEOUT", "10"))
+        self.pool_timeout = float(os.environ.get("HTTP_POOL_TIMEOUT", "10"))
+        self.read_timeouts = {
+            "llm": float(os.environ.get("LLM_READ_TIMEOUT", DEFAULT_READ_TIMEOUTS["llm"])),
+            "search": float(os.environ.get("SEARCH_READ_TIMEOUT", DEFAULT_READ_TIMEOUTS["search"]))
+        }
+        self.http2 = os.environ.get("HTTP2", "auto").lower() not in ("0", "false", "no") and _http2_available()
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def timeout(self, upstream: str) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeouts.get(upstream, DEFAULT_READ_TIMEOUTS["search"]),
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+
+# SSE 流的结束标记之后最多再读取的字节数和时间
+_DRAIN_MAX_BYTES = 64 * 1024
+_DRAIN_TIMEOUT = 1.0
+
+
+class _DrainingStream(httpx.AsyncByteStream):
+    """SSE 响应体：已读到 [DONE] 时，关闭前读完剩余的几个字节
+
+    OpenAI SDK 读到 data: [DONE] 就停止并关闭响应，此时 chunked 编码的结束块还没有读取，
+    httpcore 会认为响应不完整而断开连接，每次流式请求都要重新建连。
+    读完结束块后连接可以放回连接池；没有读到 [DONE]（如客户端断开导致取消）时直接关闭，立即中止上游生成。
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream):
+        self._stream = stream
+        self._tail = b""
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._tail = (self._tail + chunk)[-32:]
+            yield chunk
+
+    async def _drain(self):
+        remaining = _DRAIN_MAX_BYTES
+        async for chunk in self._stream:
+            remaining -= len(chunk)
+            if remaining <= 0:
+                return
+
+    async def aclose(self):
+        if b"[DONE]" in self._tail:
+            try:
+                await asyncio.wait_for(self._drain(), _DRAIN_TIMEOUT)
+            except Exception:
+                pass
+        await self._stream.aclose()
+
+
+class _PooledTransport(httpx.AsyncBaseTransport):
+    """异步传输层：每个事件循环一个连接池，SSE 响应包装为 _DrainingStream
+
+    连接绑定创建它的事件循环。生产环境只有一个事件循环，相当于一个连接池；
+    测试和 TestClient 会在不同的事件循环中使用同一个服务实例，按循环区分可以避免复用已关闭循环上的连接。
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncHTTPTransport]):
+        self._factory = factory
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            for closed in [other for other in self._transports if other.is_closed()]:
+                del self._transports[closed]
+            transport = self._transports[loop] = self._factory()
+        return transport
+
+    def pools(self) -> List[Any]:
+        return [transport._pool for transport in list(self._transports.values())]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._current().handle_async_request(request)
+        if response.headers.get("content-type", "").startswith("text/event-stream"):
+            response.stream = _DrainingStream(response.stream)
+        return response
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        transport = self._transports.pop(loop, None)
+        if transport is not None:
+            await transport.aclose()
+        self._transports.clear()
+
+
+class HTTPClients:
+    """按上游（llm / search）共享的 HTTP 客户端
+
+    同一上游的所有调用方（多个 LLM 后端节点、嵌入接口、搜索）共用一个同步和一个异步客户端，
+    连接在请求之间复用。新建连接的次数和耗时通过 httpcore 的 trace 扩展记录到指标中。
+    异步客户端绑定创建时的事件循环，由 FastAPI lifespan 在关闭时调用 aclose 释放。
+    """
+
+    def __init__(self, config: Optional[HTTPPoolConfig] = None):
+        self.config = config or HTTPPoolConfig()
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._sessions: Dict[str, "requests.Session"] = {}
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.connections_opened: Dict[str, int] = {}
+
+    def _count(self, upstream: str, counter: Dict[str, int], metric: str):
+        with self._lock:
+            counter[upstream] = counter.get(upstream, 0) + 1
+        METRICS.inc(metric, upstream=upstream)
+
+    def _on_connect(self, upstream: str, started: Optional[float]):
+        self._count(upstream, self.connections_opened, "http_connections_opened_total")
+        if started is not None:
+            METRICS.observe("http_connect_seconds", time.perf_counter() - started, upstream=upstream)
+
+    def _request_hook(self, upstream: str):
+        def hook(request: httpx.Request):
+            self._count(upstream, self.requests, "http_requests_total")
+            started = [None]
+
+            def trace(event: str, info: Dict[str, Any]):
+                if event == "connection.connect_tcp.started":
+                    started[0] = time.perf_counter()
+                elif event == "connection.connect_tcp.complete" and request.url.scheme != "https":
+                    self._on_connect(upstream, started[0])
+                elif event == "connection.start_tls.complete":
+                    self._on_connect(upstream, started[0])
+
+            request.extensions["trace"] = trace
+        return hook
+
+    def _async_request_hook(self, upstream: str):
+        sync_hook = self._request_hook(upstream)
+
+        async def hook(request: httpx.Request):
+            sync_hook(request)
+            trace = request.extensions["trace"]
+
+            async def async_trace(event: str, info: Dict[str, Any]):
+                trace(event, info)
+
+            request.extensions["trace"] = async_trace
+        return hook
+
+    def sync_client(self, upstream: str) -> httpx.Client:
+        with self._lock:
+            client = self._sync.get(upstream)
+            if client is None:
+                client = self._sync[upstream] = httpx.Client(
+                    limits=self.config.limits(),
+                    timeout=self.config.timeout(upstream),
+                    http2=self.config.http2,
+                    event_hooks={"request": [self._request_hook(upstream)]}
+                )
+            return client
+
+    def async_client(self, upstream: str) -> httpx.AsyncClient:
+        with self._lock:
+            client = self._async.get(upstream)
+            if client is None:
+                transport = _PooledTransport(
+                    lambda: httpx.AsyncHTTPTransport(limits=self.config.limits(), http2=self.config.http2)
+                )
+                client = self._async[upstream] = httpx.AsyncClient(
+                    transport=transport,
+                    timeout=self.config.timeout(upstream),
+                    event_hooks={"request": [self._async_request_hook(upstream)]}
+                )
+            return client
+
+    def requests_session(self, upstream: str) -> "requests.Session":
+        """供只接受 requests.Session 的同步 SDK（TavilyClient）使用的连接池"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        with self._lock:
+            session = self._sessions.get(upstream)
+            if session is None:
+                session = self._sessions[upstream] = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.config.max_connections)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+            return session
+
+    @staticmethod
+    def _pool_state(client) -> Optional[Dict[str, int]]:
+        """读取 httpcore 连接池中的连接状态（非公开接口，读取失败时返回 None）"""
+        transport = client._transport
+        try:
+            pools = transport.pools() if isinstance(transport, _PooledTransport) else [transport._pool]
+            connections = [connection for pool in pools for connection in list(pool.connections)]
+        except AttributeError:
+            return None
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for upstream in sorted(set(self._sync) | set(self._async) | set(self._sessions)):
+            pools = {}
+            for kind, clients in (("sync", self._sync), ("async", self._async)):
+                if upstream in clients:
+                    pools[kind] = self._pool_state(clients[upstream])
+            requests_count = self.requests.get(upstream, 0)
+            opened = self.connections_opened.get(upstream, 0)
+            result[upstream] = {
+                "requests": requests_count,
+                "connections_opened": opened,
+                "reuse_rate": round(1 - opened / requests_count, 4) if requests_count else 0.0,
+                "pools": pools
+            }
+        return {
+            "max_connections": self.config.max_connections,
+            "http2": self.config.http2,
+            "upstreams": result
+        }
+
+    def update_metrics(self):
+        """将连接池的当前状态写入 gauge，在导出 /metrics 之前调用"""
+        for upstream, info in self.stats()["upstreams"].items():
+            active = sum((pool or {}).get("active", 0) for pool in info["pools"].values())
+            idle = sum((pool or {}).get("idle", 0) for pool in info["pools"].values())
+            METRICS.set_gauge("http_pool_connections", active, upstream=upstream, state="active")
+            METRICS.set_gauge("http_pool_connections", idle, upstream=upstream, state="idle")
+
+    async def aclose(self):
+        for client in self._async.values():
+            await client.aclose()
+        for client in self._sync.values():
+            client.close()
+        for session in self._sessions.values():
+            session.close()
+        self._async.clear()
+        self._sync.clear()
+        self._sessions.clear()
@@ -0,0 +1,120 @@
+import os
+import tracemalloc
+from typing import Dict, Any, Optional, Tuple
+
+# MEMORY_PROFILE=low 时，未显式设置的变量使用这些默认值（后端与 Ollama 在同一台内存有限的设备上）
+LOW_MEMORY_DEFAULTS = {
+    "HTTP_MAX_CONNECTIONS": "4",
+    "HTTP_KEEPALIVE_EXPIRY": "15",
+    "STREAM_BUFFER_EVENTS": "256",
+    "STREAM_IDLE_TTL": "20",
+    "SSE_COALESCE_BYTES": "512",
+    "ADMISSION_MAX_QUEUE": "4",
+    "MAX_CONCURRENT_TOOLS": "2",
+    "CONTEXT_CACHE_SIZE": "512",
+    "CONVERSATION_MAX_CONVERSATIONS": "100",
+    "CONVERSATION_MAX_MESSAGES": "200",
+    "SEARCH_CACHE_MAX_ENTRIES": "64",
+    "RESPONSE_CACHE_MAX_ENTRIES": "32",
+    "SEMANTIC_CACHE_MAX_ENTRIES": "512",
+}
+
+# 设置了 MEMORY_BUDGET_MB 时按预算计算缓存条目数：变量 -> (占预算的比例, 每个条目的估算字节数)
+CACHE_BUDGET_SHARES: Dict[str, Tuple[float, int]] = {
+    "SEARCH_CACHE_MAX_ENTRIES": (0.10, 8 * 1024),  # 5 条结果，每条正文截断到 300 字
+    "SEMANTIC_CACHE_MAX_ENTRIES": (0.10, 6 * 1024),  # 1024 维 float32 向量，结果与搜索缓存共用
+    "RESPONSE_CACHE_MAX_ENTRIES": (0.05, 4 * 1024),
+    "CONVERSATION_MAX_CONVERSATIONS": (0.10, 64 * 1024),
+}
+
+
+def low_memory() -> bool:
+    return os.environ.get("MEMORY_PROFILE", "default").lower() == "low"
+
+
+def memory_budget() -> Optional[int]:
+    """MEMORY_BUDGET_MB 换算为字节，未设置时为 None"""
+    value = os.environ.get("MEMORY_BUDGET_MB")
+    return int(float(value) * 1024 * 1024) if value else None
+
+
+def setting(name: str, default: str) -> str:
+    """读取配置：显式设置的环境变量 > 按内存预算计算的缓存大小 > 低内存配置的默认值 > default"""
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    budget = memory_budget()
+    if budget is not None and name in CACHE_BUDGET_SHARES:
+        share, entry_bytes = CACHE_BUDGET_SHARES[name]
+        return str(max(1, int(budget * share / entry_bytes)))
+    if low_memory():
+        return LOW_MEMORY_DEFAULTS.get(name, default)
+    return default
+
+
+def _proc_status() -> Dict[str, int]:
+    """读取 /proc/self/status 中的内存字段（字节），非 Linux / Android 时为空"""
+    result = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    result[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return result
+
+
+def rss_bytes() -> Tuple[Optional[int], Optional[int]]:
+    """返回（当前 RSS, 峰值 RSS），读取不到时为 None"""
+    status = _proc_status()
+    peak = status.get("VmHWM")
+    if peak is None:
+        try:
+            import resource
+            # Linux 上单位为 KB（macOS 为字节，这里不区分）
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            pass
+    return status.get("VmRSS"), peak
+
+
+def start_tracing():
+    """MEMORY_TRACE 设为保留的栈帧数（如 1）时开始 tracemalloc 跟踪，会带来一定的内存和 CPU 开销"""
+    frames = int(os.environ.get("MEMORY_TRACE", "0") or 0)
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def memory_report(limit: int = 20) -> Dict[str, Any]:
+    """当前进程的内存报告：RSS 与预算，以及 tracemalloc 开启时按代码行统计的分配"""
+    rss, peak = rss_bytes()
+    budget = memory_budget()
+    report: Dict[str, Any] = {
+        "profile": "low" if low_memory() else "default",
+        "rss_bytes": rss,
+        "peak_rss_bytes": peak,
+        "budget_bytes": budget,
+        "over_budget": rss is not None and budget is not None and rss > budget,
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()}
+    }
+    if tracemalloc.is_tracing():
+        current, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        report["tracemalloc"].update({
+            "current_bytes": current,
+            "peak_bytes": traced_peak,
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "blocks": stat.count
+                }
+                for stat in snapshot.statistics("lineno")[:limit]
+            ]
+        })
+    return report
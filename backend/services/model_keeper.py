@@ -0,0 +1,263 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+import httpx
+
+from backend.services.backend_pool import BackendPool, LLMBackend, OPEN
+from backend.services.tracing import METRICS
+
+METRICS.describe("llm_model_warmups_total", "counter", "模型预热请求数（按原因和结果分类）")
+METRICS.describe("llm_model_warm", "gauge", "模型是否已加载在节点上（1 为已加载）")
+
+# 预热请求的用户消息：关闭推理、只生成一个 token
+WARMUP_MESSAGE = "你好 /no_think"
+
+
+def parse_keep_alive(value: Optional[str]) -> Union[str, float, None]:
+    """MODEL_KEEP_ALIVE 转换为 Ollama 接受的格式：纯数字为秒数（-1 表示一直保留），
+    带单位的时长（如 30m、2h）原样传递，空值表示不传、使用 Ollama 的默认值（5 分钟）"""
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def native_url(url: str) -> str:
+    """OpenAI 兼容地址（.../v1）对应的 Ollama 原生接口地址"""
+    url = url.rstrip("/")
+    return url[:-3] if url.endswith("/v1") else url
+
+
+def _expires_at(value: Optional[str]) -> Optional[float]:
+    """/api/ps 中的卸载时间（RFC 3339）转换为时间戳，无法解析时为 None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class ModelKeeper:
+    """让 Ollama 保持模型加载，避免空闲之后的第一个请求等待模型加载
+
+    - 预热：服务启动时向每个节点发送一条最短的请求（系统提示词 + 工具定义 + 一个 token），
+      加载模型并预填充之后每个请求共享的提示词前缀
+    - keep_alive：每个请求都带上保活时长，Ollama 在请求结束后按该时长保留模型
+    - 保活：后台定期读取各节点的 /api/ps，近期有流量且模型即将卸载（或已卸载）时重新预热
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        models: List[str],
+        messages: Optional[List[Dict[str, Any]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        keep_alive: Union[str, float, None] = None,
+        warmup: bool = True,
+        interval: float = 60,
+        traffic_window: float = 1800
+    ):
+        self.pool = pool
+        # 去重并保持顺序，同一节点上依次加载
+        self.models = list(dict.fromkeys(models))
+        self.messages = messages or []
+        self.tools = tools
+        self.keep_alive = keep_alive
+        self.warmup = warmup
+        self.interval = interval
+        # 距上次请求多久之内认为还会有流量（秒），负数表示一直保持加载
+        self.traffic_window = traffic_window
+        # 剩余时间少于两个检查间隔时重新预热，下一次检查之前不会卸载
+        self.margin = 2 * interval
+        # (节点地址, 模型) -> 卸载时间戳；不在其中表示未加载或状态未知
+        self.loaded: Dict[Tuple[str, str], Optional[float]] = {}
+        # 服务启动也算作一次活动，启动后的流量窗口内保持加载
+        self.last_activity = time.monotonic()
+        self.warmups = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def extra_body(self) -> Optional[Dict[str, Any]]:
+        """附加到每个 chat.completions 请求的参数"""
+        return {"keep_alive": self.keep_alive} if self.keep_alive is not None else None
+
+    def touch(self):
+        """记录一次请求，流量窗口从这里重新计算"""
+        self.last_activity = time.monotonic()
+
+    def expecting_traffic(self) -> bool:
+        return self.traffic_window < 0 or time.monotonic() - self.last_activity <= self.traffic_window
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.pool.http_clients.async_client("llm")
+
+    async def warm(self, backend: LLMBackend, model: str, reason: str = "startup") -> bool:
+        """通过原生 /api/chat 发送一次最短的请求，加载模型并刷新保活时间"""
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": [*self.messages, {"role": "user", "content": WARMUP_MESSAGE}],
+            "stream": False,
+            "options": {"num_predict": 1}
+        }
+        if self.tools:
+            body["tools"] = self.tools
+        if self.keep_alive is not None:
+            body["keep_alive"] = self.keep_alive
+        try:
+            response = await self.client.post(f"{native_url(backend.url)}/api/chat", json=body)
+            response.raise_for_status()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{backend.url} {model}: {type(e).__name__}: {str(e)}"
+            METRICS.inc("llm_model_warmups_total", reason=reason, result="error")
+            return False
+        self.warmups += 1
+        METRICS.inc("llm_model_warmups_total", reason=reason, result="ok")
+        return True
+
+    async def refresh(self, backend: LLMBackend) -> bool:
+        """读取节点的 /api/ps，更新已加载模型的卸载时间"""
+        try:
+            response = await self.client.get(f"{native_url(backend.url)}/api/ps")
+            response.raise_for_status()
+            running = response.json().get("models") or []
+        except Exception:
+            for model in self.models:
+                self.loaded.pop((backend.url, model), None)
+            return False
+        names = {}
+        for item in running:
+            for name in (item.get("name"), item.get("model")):
+                if name:
+                    names[name] = _expires_at(item.get("expires_at"))
+        for model in self.models:
+            # 未写标签的模型名在 /api/ps 中带 :latest
+            for name in (model, f"{model}:latest"):
+                if name in names:
+                    self.loaded[(backend.url, model)] = names[name]
+                    break
+            else:
+                self.loaded.pop((backend.url, model), None)
+        return True
+
+    async def _warm_backend(self, backend: LLMBackend, reason: str, only_expiring: bool):
+        await self.refresh(backend)
+        warmed = False
+        for model in self.models:
+            if only_expiring and not self._expiring(backend, model):
+                continue
+            warmed = await self.warm(backend, model, reason) or warmed
+        if warmed:
+            await self.refresh(backend)
+
+    def _expiring(self, backend: LLMBackend, model: str) -> bool:
+        key = (backend.url, model)
+        if key not in self.loaded:
+            return True
+        expires_at = self.loaded[key]
+        return expires_at is not None and expires_at - time.time() <= self.margin
+
+    async def warm_up(self):
+        """启动时预热所有节点上的模型；节点之间并行，同一节点上的模型依次加载"""
+        if not self.warmup:
+            return
+        await asyncio.gather(*(self._warm_backend(backend, "startup", False) for backend in self.pool.backends))
+
+    async def keep_warm(self):
+        """一次保活检查：近期有流量时重新预热即将卸载的模型，熔断中的节点跳过"""
+        backends = [backend for backend in self.pool.backends if backend.state != OPEN]
+        if self.expecting_traffic():
+            await asyncio.gather(*(self._warm_backend(backend, "keepalive", True) for backend in backends))
+        else:
+            await asyncio.gather(*(self.refresh(backend) for backend in backends))
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.keep_warm()
+
+    def start(self):
+        """启动后台保活（需要在事件循环中调用）"""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_loaded(self, backend: LLMBackend, model: str) -> bool:
+        key = (backend.url, model)
+        if key not in self.loaded:
+            return False
+        expires_at = self.loaded[key]
+        return expires_at is None or expires_at > time.time()
+
+    def is_warm(self) -> bool:
+        """每个模型至少在一个节点上已加载"""
+        return all(any(self.is_loaded(backend, model) for backend in self.pool.backends) for model in self.models)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        models = []
+        for backend in self.pool.backends:
+            for model in self.models:
+                expires_at = self.loaded.get((backend.url, model))
+                models.append({
+                    "backend": backend.url,
+                    "model": model,
+                    "loaded": self.is_loaded(backend, model),
+                    "expires_in": round(expires_at - now, 1) if expires_at is not None else None
+                })
+        return {
+            "warm": self.is_warm(),
+            "keep_alive": self.keep_alive,
+            "models": models,
+            "warmups": self.warmups,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
+
+    def update_metrics(self):
+        for backend in self.pool.backends:
+            for model in self.models:
+                METRICS.set_gauge("llm_model_warm", 1 if self.is_loaded(backend, model) else 0, backend=backend.url, model=model)
+
+
+def create_model_keeper(
+    pool: BackendPool,
+    models: List[str],
+    messages: Optional[List[Dict[str, Any]]] = None,
+    tools: Optional[List[Dict[str, Any]]] = None
+) -> ModelKeeper:
+    """根据环境变量创建模型保活
+
+    MODEL_WARMUP: 启动时是否预热模型，默认 1
+    MODEL_KEEP_ALIVE: 每个请求的 keep_alive（秒数或 30m 这样的时长，-1 表示一直保留），默认不传
+    MODEL_KEEPER_INTERVAL: 保活检查间隔（秒），默认 60，0 表示关闭
+    MODEL_KEEP_WARM_WINDOW: 距上次请求多久之内继续保持加载（秒），默认 1800，负数表示一直保持
+    """
+    return ModelKeeper(
+        pool,
+        models,
+        messages=messages,
+        tools=tools,
+        keep_alive=parse_keep_alive(os.environ.get("MODEL_KEEP_ALIVE")),
+        warmup=os.environ.get("MODEL_WARMUP", "1").lower() not in ("0", "false", "no"),
+        interval=float(os.environ.get("MODEL_KEEPER_INTERVAL", "60")),
+        traffic_window=float(os.environ.get("MODEL_KEEP_WARM_WINDOW", "1800"))
+    )
@@ -0,0 +1,78 @@
+import os
+from typing import List, Tuple
+
+DEFAULT_MODEL = "qwen3:1.7b"
+
+# 调用阶段
+PLANNING = "planning"  # 第一次调用：决定是否调用工具（不调用时直接回答）
+ANSWER = "answer"  # 根据搜索结果生成回答，或不再允许调用工具时的回答
+
+# 规划模型直接回答（没有调用工具）时的处理
+KEEP = "keep"  # 保留规划模型的回答，延迟最低
+HANDOFF = "handoff"  # 收到第一个回答 token 时停止规划模型，交给回答模型重新生成（规划调用以流式请求发送）
+
+
+class ModelRouter:
+    """按调用阶段选择模型
+
+    - 本轮已有搜索结果（工具调用之后的各轮）或不再允许调用工具：回答模型
+    - 第一次调用：用户消息超过 long_message_chars 时直接使用回答模型（复杂的问题小模型可能直接回答得不好），
+      否则使用规划模型，由它决定是否搜索
+    - 规划模型没有调用工具而是直接回答时，按 planner_answers 保留回答或交给回答模型；
+      交给回答模型时，流式和非流式接口的规划调用都以流式请求发送，在第一个回答 token 处中止，
+      不会等待规划模型生成完整的回答
+    两个模型相同时与只有一个模型的行为一致。
+    """
+
+    def __init__(
+        self,
+        planner_model: str = DEFAULT_MODEL,
+        answer_model: str = DEFAULT_MODEL,
+        long_message_chars: int = 500,
+        planner_answers: str = HANDOFF
+    ):
+        if planner_answers not in (KEEP, HANDOFF):
+            raise ValueError(f"未知的规划模型回答策略: {planner_answers}")
+        self.planner_model = planner_model
+        self.answer_model = answer_model
+        self.long_message_chars = long_message_chars
+        self.planner_answers = planner_answers
+
+    @property
+    def models(self) -> List[str]:
+        """用到的模型（去重），模型保活按这个列表预热"""
+        return list(dict.fromkeys((self.planner_model, self.answer_model)))
+
+    @property
+    def signature(self) -> str:
+        """回答缓存键中的模型部分；只有一个模型时就是模型名，与按模型缓存的条目兼容"""
+        return "|".join(self.models)
+
+    def route(self, message: str, tool_round: int, allow_tools: bool) -> Tuple[str, str]:
+        """返回（阶段, 模型）"""
+        if tool_round > 0 or not allow_tools:
+            return ANSWER, self.answer_model
+        if self.long_message_chars and len(message) > self.long_message_chars:
+            return PLANNING, self.answer_model
+        return PLANNING, self.planner_model
+
+    def hands_off(self, stage: str, model: str) -> bool:
+        """这次调用直接回答时是否改由回答模型生成"""
+        return stage == PLANNING and model != self.answer_model and self.planner_answers == HANDOFF
+
+
+def create_model_router() -> ModelRouter:
+    """根据环境变量创建模型路由
+
+    LLM_MODEL: 默认模型，默认 qwen3:1.7b
+    PLANNER_MODEL / ANSWER_MODEL: 规划（工具决策）和回答使用的模型，默认都是 LLM_MODEL
+    ROUTE_LONG_MESSAGE_CHARS: 用户消息超过这个字符数时第一次调用也使用回答模型，默认 500，0 表示关闭
+    PLANNER_DIRECT_ANSWER: 规划模型直接回答时 handoff（默认，交给回答模型）或 keep（保留）
+    """
+    default = os.environ.get("LLM_MODEL", DEFAULT_MODEL)
+    return ModelRouter(
+        planner_model=os.environ.get("PLANNER_MODEL") or default,
+        answer_model=os.environ.get("ANSWER_MODEL") or default,
+        long_message_chars=int(os.environ.get("ROUTE_LONG_MESSAGE_CHARS", "500")),
+        planner_answers=os.environ.get("PLANNER_DIRECT_ANSWER", HANDOFF).lower()
+    )
@@ -1,212 +1,690 @@
 import os
 import json
-from typing import List, Dict, Any, AsyncGenerator
-from openai import OpenAI
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from backend.services.tavily_service import TavilyService
+from backend.services.tool_registry import ToolRegistry, tools_json
+from backend.services.single_flight import SingleFlight, make_flight_key
+from backend.services.context_manager import ContextManager
+from backend.services.prompt_prefix import PrefixTracker
+from backend.services.backend_pool import create_backend_pool
+from backend.services.model_keeper import create_model_keeper
+from backend.services.model_router import create_model_router
+from backend.services.http_pool import HTTPClients
+from backend.services.memory_profile import setting
+from backend.services.tracing import Trace
+from backend.services.search_cache import SearchCache
+from backend.services.response_cache import create_response_cache, make_response_key, iter_chunks
+from backend.services.sse import Delta
+from backend.services.think_filter import ThinkStreamParser, split_reasoning, REASONING, NO_THINK_SWITCH
 
 class OpenAIService:
-    def __init__(self):
-        # 使用 Ollama 本地服务
-        self.client = OpenAI(
-            base_url="http://localhost:11434/v1",
-            api_key="ollama"  # Ollama 不需要真实的 API key，只需要一个占位符
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_concurrent_tools: Optional[int] = None,
+        response_cache: Optional[SearchCache] = None,
+        max_tool_rounds: Optional[int] = None,
+        http_clients: Optional[HTTPClients] = None
+    ):
+        # LLM 后端、嵌入接口和搜索共用的连接池配置，每个上游一个客户端
+        self.http_clients = http_clients or HTTPClients()
+        # 使用 Ollama 本地服务；可通过 OLLAMA_BASE_URL / OLLAMA_BASE_URLS 配置一个或多个节点
+        self.backend_pool = create_backend_pool(base_url, self.http_clients)
+        self.tavily_service = TavilyService(http_clients=self.http_clients)
+        # 规划（工具决策）和回答可以使用不同的模型，见 create_model_router
+        self.model_router = create_model_router()
+        self.model = self.model_router.answer_model
+        # 工具在这里注册一次，按名称分发调用
+        self.tool_registry = ToolRegistry()
+        self.tool_registry.register(
+            self.tavily_service.get_tool_definition(),
+            handler=self.tavily_service.search,
+            async_handler=self.tavily_service.search_async
         )
-        self.tavily_service = TavilyService()
+        
+        # 同一轮中并发执行的工具调用上限
+        self.max_concurrent_tools = max_concurrent_tools or int(setting("MAX_CONCURRENT_TOOLS", "4"))
+        # 一次回答最多进行的工具调用轮数，以及整轮的时间（秒）和提示词 token 预算；
+        # 超出后不再提供工具，模型根据已有信息直接回答
+        if max_tool_rounds is None:
+            max_tool_rounds = int(os.environ.get("AGENT_MAX_TOOL_ROUNDS", "3"))
+        self.max_tool_rounds = max_tool_rounds
+        self.time_budget = float(os.environ.get("AGENT_TIME_BUDGET", "30"))
+        self.token_budget = int(os.environ.get("AGENT_TOKEN_BUDGET", "16000"))
+        # 合并并发的相同规划请求（第一次非流式调用）
+        self.planning_flight = SingleFlight()
+        # 在 token 预算内组装多轮历史
+        self.context_manager = ContextManager()
+        # 记录请求之间的提示词前缀复用情况
+        self.prefix_tracker = PrefixTracker()
+        # 不需要工具的回答缓存（RESPONSE_CACHE 开启时），命中后按流式分段回放
+        self.response_cache = response_cache if response_cache is not None else create_response_cache()
+        self.replay_chunk_chars = 8
+        # 流式接口是否默认发送推理过程（reasoning 事件），否则丢弃；请求中的 include_reasoning 优先
+        self.include_reasoning = os.environ.get("STREAM_REASONING", "").lower() in ("1", "true", "yes")
         
         # 系统提示词
         self.system_prompt = (
             "你是一个智能助手。当用户询问需要实时信息的问题时，"
             "使用 search 工具来获取最新信息。请简洁而准确地回答用户的问题。"
         )
+        
+        # 启动时预热模型，每个请求带上 keep_alive，近期有流量时在卸载之前重新预热
+        self.model_keeper = create_model_keeper(
+            self.backend_pool, self.model_router.models, [{"role": "system", "content": self.system_prompt}], self.tools
+        )
     
-    def _prepare_messages(self, user_message: str) -> List[Dict[str, Any]]:
-        """准备消息列表"""
-        return [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+    def preload(self):
+        """创建上游 SDK 客户端（导入 openai / tavily），启动后在后台线程中调用，避免第一个请求承担导入耗时"""
+        for backend in self.backend_pool.backends:
+            backend.client, backend.async_client
+        self.tavily_service.client, self.tavily_service.async_client
+        self._build_tool_calls({})
     
-    def chat_completion(self, message: str) -> Dict[str, Any]:
-        """处理聊天完成，返回完整结果"""
-        messages = self._prepare_messages(message)
-        tools = [self.tavily_service.get_tool_definition()]
-        tool_calls_made = []
+    @property
+    def tools(self) -> List[Dict[str, Any]]:
+        """发送给模型的工具定义，每次请求是同一个对象，保持提示词前缀稳定"""
+        return self.tool_registry.definitions
+    
+    def _prepare_messages(
+        self,
+        user_message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """准备消息列表：系统提示词 + 预算内的历史消息 + 本轮用户消息"""
+        # 历史消息中的 timestamp 等存储字段不发送给模型
+        history = [{k: v for k, v in item.items() if k != "timestamp"} for item in history or []]
+        return self.context_manager.build(self.system_prompt, history, user_message, tools)
+    
+    @staticmethod
+    def _thinking_disabled(fast: Optional[str], tool_round: int) -> bool:
+        """快速模式下本次调用是否关闭推理：planning 为第一次调用，final 为工具调用之后的调用"""
+        if not fast:
+            return False
+        return fast == "all" or (fast == "planning") == (tool_round == 0)
+    
+    @staticmethod
+    def _without_thinking(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """返回给本轮用户消息追加 /no_think 的副本，对话历史中不保存开关
         
-        try:
-            # 第一步：发送给 Ollama
-            response = self.client.chat.completions.create(
-                model="qwen3:1.7b",
+        开关加在本轮用户消息上，其之前的提示词前缀不变，KV cache 仍可复用。
+        """
+        result = list(messages)
+        for index in range(len(result) - 1, -1, -1):
+            if result[index].get("role") == "user":
+                result[index] = {**result[index], "content": f"{result[index]['content']} {NO_THINK_SWITCH}"}
+                break
+        return result
+    
+    def _request_messages(self, messages: List[Dict[str, Any]], fast: Optional[str], tool_round: int) -> List[Dict[str, Any]]:
+        return self._without_thinking(messages) if self._thinking_disabled(fast, tool_round) else messages
+    
+    def _create_planning_completion(
+        self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: Optional[str] = None
+    ):
+        """发送带工具定义的规划请求，相同请求并发时只访问一次上游；默认使用规划模型"""
+        model = model or self.model_router.planner_model
+        key = make_flight_key({"model": model, "messages": messages, "tools": tools_json(tools)})
+        self.prefix_tracker.record(model, messages, tools)
+        
+        def create():
+            with self.backend_pool.lease() as lease:
+                return lease.backend.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tools=tools,
+                    tool_choice="auto",
+                    extra_body=self.model_keeper.extra_body()
+                )
+        
+        return self.planning_flight.do_sync(key, create)
+    
+    def _stream_planning(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], model: str):
+        """规划模型直接回答时要交给回答模型的规划请求（非流式接口使用）
+        
+        以流式请求发送，模型没有调用工具、开始输出回答时立即关闭上游流（中止生成），
+        不等待一个会被丢弃的完整回答。返回（推理, 工具调用），直接回答时工具调用为空。
+        流式请求无法在并发的相同请求之间共享，不经过 planning_flight。
+        """
+        self.prefix_tracker.record(model, messages, tools)
+        parser = ThinkStreamParser()
+        tool_call_parts: Dict[int, Dict[str, str]] = {}
+        reasoning = []
+        with self.backend_pool.lease() as lease:
+            stream = lease.backend.client.chat.completions.create(
+                model=model,
                 messages=messages,
                 tools=tools,
-                tool_choice="auto"
+                tool_choice="auto",
+                stream=True,
+                extra_body=self.model_keeper.extra_body()
             )
+            with stream:
+                for chunk in stream:
+                    lease.first_token()
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        self._accumulate_tool_call_deltas(tool_call_parts, delta.tool_calls)
+                    if delta.content:
+                        for kind, text in parser.feed(delta.content):
+                            if kind == REASONING:
+                                reasoning.append(text)
+                            elif text.strip() and not tool_call_parts:
+                                return "".join(reasoning), []
+        return "".join(reasoning), self._build_tool_calls(tool_call_parts)
+    
+    def _create_completion(
+        self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: str, model: Optional[str] = None
+    ):
+        """发送一次非流式请求（工具调用之后的各轮）；默认使用回答模型"""
+        model = model or self.model_router.answer_model
+        self.prefix_tracker.record(model, messages, tools)
+        with self.backend_pool.lease() as lease:
+            return lease.backend.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                extra_body=self.model_keeper.extra_body()
+            )
+    
+    def _exhausted_budget(self, started: float, prompt_tokens: int) -> Optional[str]:
+        """检查本轮回答的预算，返回已耗尽的预算，未耗尽时返回 None"""
+        if time.perf_counter() - started >= self.time_budget:
+            return "时间预算"
+        if prompt_tokens > self.token_budget:
+            return "token 预算"
+        return None
+    
+    def _timeout_result(self, tool_call) -> Dict[str, Any]:
+        return self._tool_result_message(tool_call, {"success": False, "error": "工具调用超出时间预算，已取消"})
+    
+    def _assistant_tool_message(self, content: Optional[str], tool_calls) -> Dict[str, Any]:
+        """将带工具调用的 assistant 消息转换为对话历史格式"""
+        return {
+            "role": "assistant",
+            "content": content or "",
+            "tool_calls": [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments
+                    }
+                }
+                for tool_call in tool_calls
+            ]
+        }
+    
+    @staticmethod
+    def _accumulate_tool_call_deltas(parts: Dict[int, Dict[str, str]], deltas) -> None:
+        """累积流式响应中的工具调用增量（id、函数名和参数可能分散在多个 chunk 中）"""
+        for delta in deltas:
+            index = delta.index if delta.index is not None else len(parts)
+            part = parts.setdefault(index, {"id": "", "name": "", "arguments": ""})
+            if delta.id:
+                part["id"] = delta.id
+            if delta.function is not None:
+                if delta.function.name:
+                    part["name"] += delta.function.name
+                if delta.function.arguments:
+                    part["arguments"] += delta.function.arguments
+    
+    @staticmethod
+    def _build_tool_calls(parts: Dict[int, Dict[str, str]]) -> List[Any]:
+        """将累积的增量转换为完整的工具调用对象，按 index 排序"""
+        from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+        
+        return [
+            ChatCompletionMessageToolCall(
+                id=part["id"] or f"call_{index}",
+                type="function",
+                function=Function(name=part["name"], arguments=part["arguments"] or "{}")
+            )
+            for index, part in sorted(parts.items())
+        ]
+    
+    def _tool_result_message(self, tool_call, result: Dict[str, Any]) -> Dict[str, Any]:
+        """将工具执行结果转换为 tool 消息"""
+        return {
+            "role": "tool",
+            "content": json.dumps(result, ensure_ascii=False),
+            "tool_call_id": tool_call.id
+        }
+    
+    def _execute_tool_call(self, tool_call) -> Dict[str, Any]:
+        """执行单个工具调用，返回 tool 消息；未知工具和参数错误以失败结果返回给模型"""
+        result = self.tool_registry.call(tool_call.function.name, tool_call.function.arguments)
+        return self._tool_result_message(tool_call, result)
+    
+    @staticmethod
+    def _display_arguments(arguments: Optional[str]) -> Dict[str, Any]:
+        """tool_call 事件中展示的参数，无法解析时为空"""
+        try:
+            data = json.loads(arguments or "{}")
+        except json.JSONDecodeError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    
+    def _run_tool_calls(
+        self, tool_calls, trace: Optional[Trace] = None, deadline: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """并发执行一轮工具调用，结果按原始 tool_call 顺序返回
+
+        到 deadline（perf_counter 时间）仍未完成的调用以超时失败结果返回，不再等待。
+        """
+        trace = trace or Trace(mode="chat")
+        max_workers = max(1, min(self.max_concurrent_tools, len(tool_calls)))
+        
+        def run(tool_call):
+            with trace.span(f"tool.{tool_call.function.name}", tool_call_id=tool_call.id):
+                return self._execute_tool_call(tool_call)
+        
+        # 每个线程使用当前 trace 的上下文副本，TavilyService 可以记录子阶段
+        with trace.activate():
+            contexts = [contextvars.copy_context() for _ in tool_calls]
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [
+                executor.submit(context.run, run, tool_call)
+                for context, tool_call in zip(contexts, tool_calls)
+            ]
+            results = []
+            for tool_call, future in zip(tool_calls, futures):
+                timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                try:
+                    results.append(future.result(timeout=timeout))
+                except FutureTimeoutError:
+                    results.append(self._timeout_result(tool_call))
+            return results
+        finally:
+            # 超时的调用不再等待（线程无法中断，结果被丢弃），未开始的直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _run_tool_calls_async(
+        self,
+        tool_calls,
+        results: List[Optional[Dict[str, Any]]],
+        trace: Optional[Trace] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """并发执行一轮工具调用（异步版本）
+        
+        每个调用开始和结束时产出 tool_call 事件；全部完成后，
+        results 按原始 tool_call 顺序填入 tool 消息。
+        到 deadline（perf_counter 时间）仍未完成的调用被取消，以超时失败结果返回。
+        """
+        trace = trace or Trace()
+        semaphore = asyncio.Semaphore(self.max_concurrent_tools)
+        queue: asyncio.Queue = asyncio.Queue()
+        results[:] = [None] * len(tool_calls)
+        
+        async def run(index: int, tool_call):
+            try:
+                function_name = tool_call.function.name
+                async with semaphore:
+                    await queue.put({
+                        "type": "tool_call",
+                        "tool_call_id": tool_call.id,
+                        "tool_name": function_name,
+                        "tool_args": self._display_arguments(tool_call.function.arguments),
+                        "tool_status": "started"
+                    })
+                    with trace.span(f"tool.{function_name}", tool_call_id=tool_call.id) as span:
+                        result = await self.tool_registry.call_async(function_name, tool_call.function.arguments)
+                        span.attrs["success"] = bool(result.get("success"))
+                    results[index] = self._tool_result_message(tool_call, result)
+                    await queue.put({
+                        "type": "tool_call",
+                        "tool_call_id": tool_call.id,
+                        "tool_name": function_name,
+                        "tool_status": "completed" if result.get("success") else "failed"
+                    })
+            finally:
+                # None 作为该任务结束的哨兵
+                await queue.put(None)
+        
+        # 任务创建时复制上下文，其中的 TavilyService 调用会记录到同一个 trace
+        with trace.activate():
+            tasks = [asyncio.create_task(run(index, tool_call)) for index, tool_call in enumerate(tool_calls)]
+        try:
+            finished = 0
+            while finished < len(tasks):
+                timeout = None if deadline is None else deadline - time.perf_counter()
+                try:
+                    if timeout is not None and timeout <= 0:
+                        raise asyncio.TimeoutError
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # 超出时间预算：转发已到达的事件，其余调用按超时处理
+                    while not queue.empty():
+                        event = queue.get_nowait()
+                        if event is not None:
+                            yield event
+                    break
+                if event is None:
+                    finished += 1
+                else:
+                    yield event
             
-            assistant_message = response.choices[0].message
+            for index, task in enumerate(tasks):
+                if task.done():
+                    # 传播任务中的异常
+                    task.result()
+                    continue
+                task.cancel()
+                if results[index] is not None:
+                    continue
+                results[index] = self._timeout_result(tool_calls[index])
+                yield {
+                    "type": "tool_call",
+                    "tool_call_id": tool_calls[index].id,
+                    "tool_name": tool_calls[index].function.name,
+                    "tool_status": "failed"
+                }
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def chat_completion(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        trace: Optional[Trace] = None,
+        fast: Optional[str] = None,
+        include_reasoning: bool = False
+    ) -> Dict[str, Any]:
+        """处理聊天完成，返回完整结果
+
+        返回值中的 messages 为本轮新增的消息（用户消息、工具调用及结果、最终回复），
+        供调用方写入对话历史。各阶段耗时记录在 trace 中。
+        回复中的 <think> 块不写入历史，include_reasoning 时通过 reasoning 返回。
+        """
+        trace = trace or Trace(mode="chat")
+        self.model_keeper.touch()
+        tools = self.tools
+        messages = self._prepare_messages(message, history, tools)
+        turn_start = len(messages) - 1
+        tool_calls_made = []
+        reasoning_parts = []
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = make_response_key(self.model_router.signature, self._request_messages(messages, fast, 0), tools)
+        
+        try:
+            if cache_key is not None:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    messages.append({"role": "assistant", "content": cached["content"]})
+                    trace.finish()
+                    return {
+                        "success": True,
+                        "response": cached["content"],
+                        "tool_calls_made": [],
+                        "messages": messages[turn_start:]
+                    }
             
-            # 检查是否需要工具调用
-            if assistant_message.tool_calls:
-                # 添加 assistant 消息到对话历史
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content,
-                    "tool_calls": [
-                        {
-                            "id": tool_call.id,
-                            "type": "function",
-                            "function": {
-                                "name": tool_call.function.name,
-                                "arguments": tool_call.function.arguments
-                            }
-                        }
-                        for tool_call in assistant_message.tool_calls
-                    ]
-                })
+            # 多轮工具调用：每轮并发执行模型请求的工具，直到模型直接回答、达到轮数上限或预算耗尽
+            started = time.perf_counter()
+            prompt_tokens = 0
+            tool_round = 0
+            # 规划模型直接回答时改由回答模型生成，这次调用不再提供工具
+            handed_off = False
+            while True:
+                prompt_tokens += self.context_manager.count_messages(messages) + self.context_manager.count_tools(tools)
+                allow_tools = (
+                    not handed_off and tool_round < self.max_tool_rounds
+                    and self._exhausted_budget(started, prompt_tokens) is None
+                )
+                stage, model = self.model_router.route(message, tool_round, allow_tools)
+                # 交给回答模型的调用按最终回答处理（fast=final 时关闭推理）
+                request_messages = self._request_messages(messages, fast, 1 if handed_off else tool_round)
+                hands_off = tool_round == 0 and allow_tools and self.model_router.hands_off(stage, model)
+                if hands_off:
+                    # 规划模型开始直接回答时中止，由回答模型生成
+                    with trace.span("llm.planning", model=model) as call_span:
+                        reasoning, tool_calls = self._stream_planning(request_messages, tools, model)
+                        call_span.attrs["handoff"] = not tool_calls
+                    content = ""
+                else:
+                    if tool_round == 0 and allow_tools:
+                        with trace.span("llm.planning", model=model):
+                            response = self._create_planning_completion(request_messages, tools, model)
+                    else:
+                        # 发送相同的工具定义以复用前缀；不再允许调用工具时 tool_choice 为 none
+                        with trace.span("llm.generation", round=tool_round, model=model):
+                            response = self._create_completion(request_messages, tools, "auto" if allow_tools else "none", model)
+                    assistant_message = response.choices[0].message
+                    reasoning, content = split_reasoning(assistant_message.content)
+                    tool_calls = assistant_message.tool_calls if allow_tools else None
                 
-                # 执行工具调用
-                for tool_call in assistant_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    if function_name == "search":
-                        tool_calls_made.append("search")
-                        search_result = self.tavily_service.search(
-                            function_args.get("query"),
-                            function_args.get("max_results", 5)
-                        )
-                        
-                        # 添加工具结果到消息
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": json.dumps(search_result, ensure_ascii=False)
-                        })
+                if reasoning:
+                    reasoning_parts.append(reasoning)
+                if hands_off and not tool_calls:
+                    handed_off = True
+                    continue
+                if not tool_calls:
+                    final_content = content
+                    # 无需工具调用的回答写入缓存
+                    if tool_round == 0 and cache_key is not None and final_content:
+                        self.response_cache.set(cache_key, {"content": final_content})
+                    break
                 
-                # 获取最终回复
-                final_response = self.client.chat.completions.create(
-                    model="qwen3:1.7b",
-                    messages=messages
-                )
+                tool_round += 1
+                # 添加 assistant 消息到对话历史
+                messages.append(self._assistant_tool_message(content, tool_calls))
                 
-                final_content = final_response.choices[0].message.content
-            else:
-                # 无需工具调用，直接返回
-                final_content = assistant_message.content
+                # 并发执行工具调用，按原始顺序添加工具结果到消息
+                tool_messages = self._run_tool_calls(tool_calls, trace, started + self.time_budget)
+                for tool_call, tool_message in zip(tool_calls, tool_messages):
+                    tool_calls_made.append(tool_call.function.name)
+                    messages.append(tool_message)
             
-            return {
+            messages.append({"role": "assistant", "content": final_content})
+            trace.finish()
+            result = {
                 "success": True,
                 "response": final_content,
-                "tool_calls_made": tool_calls_made
+                "tool_calls_made": tool_calls_made,
+                "messages": messages[turn_start:]
             }
-            
+            if include_reasoning:
+                result["reasoning"] = "\n".join(reasoning_parts)
+            return result
+        
         except Exception as e:
+            trace.finish("error")
             return {
                 "success": False,
                 "error": f"{type(e).__name__}: {str(e)}"
             }
     
-    async def chat_completion_stream(self, message: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """处理流式聊天完成"""
-        messages = self._prepare_messages(message)
-        tools = [self.tavily_service.get_tool_definition()]
-        tool_calls_made = []
+    async def chat_completion_stream(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        turn_messages: Optional[List[Dict[str, Any]]] = None,
+        trace: Optional[Trace] = None,
+        fast: Optional[str] = None,
+        include_reasoning: Optional[bool] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理流式聊天完成
+
+        成功完成时，本轮新增的消息会在 done 事件之前填入 turn_messages。
+        各阶段耗时、首 token 时间和生成速度记录在 trace 中，trace 在 done / error 之前结束。
+        模型输出按增量拆分推理和回答：推理在 include_reasoning 时作为 reasoning 事件发送，否则丢弃，
+        都不写入历史；首 token 时间从第一个回答 token 计算。
+        fast 指定关闭推理的调用（planning / final / all）。
+        """
+        trace = trace or Trace()
+        if include_reasoning is None:
+            include_reasoning = self.include_reasoning
+        self.model_keeper.touch()
+        tools = self.tools
+        messages = self._prepare_messages(message, history, tools)
+        turn_start = len(messages) - 1
+        content_parts = []
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = make_response_key(self.model_router.signature, self._request_messages(messages, fast, 0), tools)
+        first_token_at = None
+        reasoning_deltas = 0
+        
+        def split_events(parts):
+            """将拆分后的片段转换为事件：回答转发为 content，推理按 include_reasoning 发送或丢弃"""
+            nonlocal first_token_at, reasoning_deltas
+            for kind, text in parts:
+                if kind == REASONING:
+                    if not reasoning_deltas:
+                        yield {"type": "status", "content": "正在思考..."}
+                    reasoning_deltas += 1
+                    if include_reasoning:
+                        yield Delta("reasoning", text)
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    trace.first_token()
+                    yield {"type": "status", "content": "正在生成回复..."}
+                content_parts.append(text)
+                yield Delta("content", text)
         
         try:
             yield {"type": "status", "content": "正在理解您的问题..."}
             
-            # 第一步：发送给 Ollama
-            response = self.client.chat.completions.create(
-                model="qwen3:1.7b",
-                messages=messages,
-                tools=tools,
-                tool_choice="auto"
-            )
-            
-            assistant_message = response.choices[0].message
+            # 缓存命中时按与模型输出相同的事件序列回放
+            if cache_key is not None:
+                cached = await self.response_cache.get_async(cache_key)
+                if cached is not None:
+                    with trace.span("cache.response"):
+                        yield {"type": "status", "content": "正在生成回复..."}
+                        trace.first_token()
+                        for chunk in iter_chunks(cached["content"], self.replay_chunk_chars):
+                            yield Delta("content", chunk)
+                    messages.append({"role": "assistant", "content": cached["content"]})
+                    if turn_messages is not None:
+                        turn_messages.extend(messages[turn_start:])
+                    trace.finish()
+                    yield {"type": "done"}
+                    return
             
-            # 检查是否需要工具调用
-            if assistant_message.tool_calls:
-                yield {"type": "status", "content": "正在搜索相关信息..."}
-                
-                # 添加 assistant 消息到对话历史
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content,
-                    "tool_calls": [
-                        {
-                            "id": tool_call.id,
-                            "type": "function",
-                            "function": {
-                                "name": tool_call.function.name,
-                                "arguments": tool_call.function.arguments
-                            }
-                        }
-                        for tool_call in assistant_message.tool_calls
-                    ]
-                })
+            # 多轮工具调用：直接回答的内容立即转发，工具调用增量先累积；
+            # 每轮并发执行工具，直到模型直接回答、达到轮数上限或预算耗尽
+            started = time.perf_counter()
+            prompt_tokens = 0
+            tool_round = 0
+            # 规划模型开始直接回答时停止它，改由回答模型生成，这次调用不再提供工具
+            handed_off = False
+            while True:
+                prompt_tokens += self.context_manager.count_messages(messages) + self.context_manager.count_tools(tools)
+                exhausted = self._exhausted_budget(started, prompt_tokens)
+                allow_tools = not handed_off and tool_round < self.max_tool_rounds and exhausted is None
+                if tool_round and exhausted is not None:
+                    yield {"type": "status", "content": f"{exhausted}已用完，正在根据已有信息生成回复...", "round": tool_round}
+                stage, model = self.model_router.route(message, tool_round, allow_tools)
+                hands_off = self.model_router.hands_off(stage, model)
                 
-                # 执行工具调用
-                for tool_call in assistant_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    if function_name == "search":
-                        tool_calls_made.append("search")
-                        
-                        # 发送工具调用事件
-                        yield {
-                            "type": "tool_call",
-                            "tool_name": function_name,
-                            "tool_args": function_args
-                        }
-                        
-                        search_result = self.tavily_service.search(
-                            function_args.get("query"),
-                            function_args.get("max_results", 5)
+                # 发送相同的工具定义以复用前缀；不再允许调用工具时 tool_choice 为 none；
+                # 交给回答模型的调用按最终回答处理（fast=final 时关闭推理）
+                request_messages = self._request_messages(messages, fast, 1 if handed_off else tool_round)
+                self.prefix_tracker.record(model, request_messages, tools)
+                tool_call_parts: Dict[int, Dict[str, str]] = {}
+                parser = ThinkStreamParser()
+                first_token_at = None
+                reasoning_deltas = 0
+                span_name = "llm.generation" if tool_round or handed_off else "llm.planning"
+                with trace.span(span_name, round=tool_round, model=model) as call_span:
+                    async with self.backend_pool.lease_async() as lease:
+                        stream = await lease.backend.async_client.chat.completions.create(
+                            model=model,
+                            messages=request_messages,
+                            tools=tools,
+                            tool_choice="auto" if allow_tools else "none",
+                            stream=True,
+                            extra_body=self.model_keeper.extra_body()
                         )
                         
-                        # 添加工具结果到消息
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": json.dumps(search_result, ensure_ascii=False)
-                        })
+                        # 退出时关闭上游响应，客户端断开导致取消时也会立即释放连接
+                        async with stream:
+                            async for chunk in stream:
+                                lease.first_token()
+                                if not chunk.choices:
+                                    continue
+                                delta = chunk.choices[0].delta
+                                if delta.tool_calls and allow_tools:
+                                    self._accumulate_tool_call_deltas(tool_call_parts, delta.tool_calls)
+                                if delta.content:
+                                    parts = parser.feed(delta.content)
+                                    # 规划模型没有调用工具、开始输出回答：关闭上游流（中止生成），交给回答模型
+                                    if hands_off and not tool_call_parts and any(
+                                        kind != REASONING and text.strip() for kind, text in parts
+                                    ):
+                                        for event in split_events([part for part in parts if part[0] == REASONING]):
+                                            yield event
+                                        handed_off = True
+                                        break
+                                    for event in split_events(parts):
+                                        yield event
+                            if not handed_off:
+                                for event in split_events(parser.flush()):
+                                    yield event
+                    call_span.attrs["tool_calls"] = len(tool_call_parts)
+                    call_span.attrs["reasoning"] = reasoning_deltas
+                    if hands_off:
+                        call_span.attrs["handoff"] = handed_off
+                trace.record_generation(len(content_parts), first_token_at, time.perf_counter())
+                trace.record_reasoning(reasoning_deltas)
                 
-                yield {"type": "status", "content": "正在生成回复..."}
+                if hands_off and handed_off:
+                    # 规划模型的推理不计入回答，回答模型从同一组消息开始生成
+                    continue
                 
-                # 获取流式最终回复
-                final_stream = self.client.chat.completions.create(
-                    model="qwen3:1.7b",
-                    messages=messages,
-                    stream=True
-                )
+                if not tool_call_parts:
+                    # 没有调用工具的完整回答写入缓存
+                    if tool_round == 0 and cache_key is not None and content_parts:
+                        await self.response_cache.set_async(cache_key, {"content": "".join(content_parts)})
+                    break
                 
-                for chunk in final_stream:
-                    if chunk.choices[0].delta.content:
-                        yield {
-                            "type": "content",
-                            "content": chunk.choices[0].delta.content
-                        }
-            else:
-                # 无需工具调用，直接流式返回
-                yield {"type": "status", "content": "正在生成回复..."}
+                tool_round += 1
+                tool_calls = self._build_tool_calls(tool_call_parts)
+                yield {"type": "status", "content": "正在搜索相关信息...", "round": tool_round}
                 
-                stream = self.client.chat.completions.create(
-                    model="qwen3:1.7b",
-                    messages=messages,
-                    stream=True
-                )
+                # 添加 assistant 消息到对话历史，本次调用中已输出的内容归入该消息
+                messages.append(self._assistant_tool_message("".join(content_parts), tool_calls))
+                content_parts = []
                 
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        yield {
-                            "type": "content",
-                            "content": chunk.choices[0].delta.content
-                        }
+                # 并发执行工具调用，逐个发送开始/结束事件
+                tool_messages: List[Optional[Dict[str, Any]]] = []
+                async for event in self._run_tool_calls_async(
+                    tool_calls, tool_messages, trace, started + self.time_budget
+                ):
+                    yield {**event, "round": tool_round}
+                
+                # 按原始顺序添加工具结果到消息
+                messages.extend(tool_messages)
             
-            yield {"type": "done"}
+            messages.append({"role": "assistant", "content": "".join(content_parts)})
+            if turn_messages is not None:
+                turn_messages.extend(messages[turn_start:])
             
+            trace.finish()
+            yield {"type": "done"}
+        
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开等原因取消，上游流和工具调用随之关闭
+            trace.finish("cancelled")
+            raise
         except Exception as e:
+            trace.finish("error")
             yield {
                 "type": "error",
                 "content": f"{type(e).__name__}: {str(e)}"
-            }
\ No newline at end of file
+            }
@@ -0,0 +1,95 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from backend.services.tool_registry import tools_json
+
+# 消息字段的固定顺序，保证同一条消息每次序列化的字节完全一致
+_MESSAGE_FIELDS = ("role", "content", "tool_calls", "tool_call_id")
+
+
+def canonical_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """将消息转换为规范形式：固定字段顺序，content 为空时统一为空字符串"""
+    canonical: Dict[str, Any] = {}
+    for field in _MESSAGE_FIELDS:
+        if field == "content":
+            canonical["content"] = message.get("content") or ""
+        elif message.get(field) is not None:
+            canonical[field] = message[field]
+    return canonical
+
+
+def message_digest(message: Dict[str, Any]) -> bytes:
+    data = json.dumps(canonical_message(message), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).digest()
+
+
+class PrefixTracker:
+    """提示词前缀复用诊断
+
+    为每个请求计算逐条消息的链式摘要（模型 + 工具定义 + 第 1..i 条消息），
+    与最近发送过的请求比较，得到可被 Ollama KV cache 复用的最长前缀。
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prefix_hits = 0
+        self.reused_messages = 0
+        self.total_messages = 0
+        self.reused_chars = 0
+        self.total_chars = 0
+
+    def record(
+        self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """记录一次请求，返回本次请求的前缀复用情况"""
+        head = json.dumps({"model": model, "tools": tools_json(tools)}, ensure_ascii=False)
+        chain = hashlib.sha1(head.encode("utf-8")).digest()
+
+        chains = []
+        total_chars = 0
+        for message in messages:
+            chain = hashlib.sha1(chain + message_digest(message)).digest()
+            total_chars += len(message.get("content") or "")
+            chains.append((chain, total_chars))
+
+        with self._lock:
+            reused_messages = 0
+            reused_chars = 0
+            for index, (chain, chars) in enumerate(chains):
+                if chain not in self._seen:
+                    break
+                self._seen.move_to_end(chain)
+                reused_messages = index + 1
+                reused_chars = chars
+            for chain, chars in chains[reused_messages:]:
+                self._seen[chain] = chars
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+            self.requests += 1
+            self.prefix_hits += 1 if reused_messages else 0
+            self.reused_messages += reused_messages
+            self.total_messages += len(messages)
+            self.reused_chars += reused_chars
+            self.total_chars += total_chars
+
+        return {
+            "reused_messages": reused_messages,
+            "total_messages": len(messages),
+            "reused_chars": reused_chars,
+            "total_chars": total_chars
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "prefix_hits": self.prefix_hits,
+            "message_reuse_rate": round(self.reused_messages / self.total_messages, 4) if self.total_messages else 0.0,
+            "char_reuse_rate": round(self.reused_chars / self.total_chars, 4) if self.total_chars else 0.0
+        }
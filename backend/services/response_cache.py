@@ -0,0 +1,56 @@
+import os
+import unicodedata
+from typing import List, Dict, Any, Iterator, Optional
+from backend.services.search_cache import SearchCache, MemorySearchCache, SQLiteSearchCache
+from backend.services.single_flight import make_flight_key
+from backend.services.tool_registry import tools_json
+from backend.services.memory_profile import setting
+
+
+def normalize_question(question: str) -> str:
+    """回答缓存中的问题规范化：只做 NFKC（全角转半角）并去掉首尾空白
+
+    不去掉符号和填充词：“1+1等于几”和“11等于几”、“-5 的绝对值”和“5 的绝对值”是不同的问题。
+    """
+    return unicodedata.normalize("NFKC", question or "").strip()
+
+
+def make_response_key(model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]]) -> str:
+    """回答缓存键：模型 + 消息列表（最后一条用户消息按 normalize_question 规范化）+ 工具定义
+
+    消息由 ContextManager 输出，已经是规范形式；本轮问题只统一全角字符和首尾空白。
+    """
+    normalized = list(messages)
+    if normalized and normalized[-1].get("role") == "user":
+        normalized[-1] = {**normalized[-1], "content": normalize_question(normalized[-1].get("content") or "")}
+    return make_flight_key({"model": model, "messages": normalized, "tools": tools_json(tools)})
+
+
+def iter_chunks(text: str, size: int) -> Iterator[str]:
+    """将缓存的回答切成小段，按流式接口的方式回放"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def create_response_cache() -> Optional[SearchCache]:
+    """根据环境变量创建回答缓存（默认关闭）
+
+    只缓存没有调用工具的回答，调用了工具的回答依赖实时信息，不缓存。
+
+    RESPONSE_CACHE: none（默认）/ memory / sqlite
+    RESPONSE_CACHE_TTL: 条目有效期（秒），默认 3600
+    RESPONSE_CACHE_MAX_ENTRIES: 最大条目数，默认 256
+    RESPONSE_CACHE_PATH: sqlite 数据库路径，默认 response_cache.db
+    """
+    backend = os.environ.get("RESPONSE_CACHE", "none").lower()
+    ttl = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+    max_entries = int(setting("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        path = os.environ.get("RESPONSE_CACHE_PATH", "response_cache.db")
+        return SQLiteSearchCache(path, ttl=ttl, max_entries=max_entries)
+    if backend == "memory":
+        return MemorySearchCache(ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"未知的 RESPONSE_CACHE: {backend}")
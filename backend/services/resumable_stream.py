@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Any, AsyncIterator, Optional, Tuple
+
+from backend.services.sse import encode_event
+from backend.services.tracing import METRICS
+from backend.services.memory_profile import setting
+
+METRICS.describe("stream_cancelled_total", "counter", "客户端断开后被取消的流式生成数")
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析 Last-Event-ID（格式为 <stream_id>:<序号>），无法解析时返回 None"""
+    if not value:
+        return None
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ResumableStream:
+    """与 HTTP 连接解耦的一次生成
+
+    生成结果编码为带 id 的 SSE 帧，保存在有界的环形缓冲中；
+    断线重连的客户端从 Last-Event-ID 之后开始重放，然后继续接收仍在进行的生成。
+    最后一个客户端断开 disconnect_grace 秒后仍未重连时，取消生成（None 表示不取消）。
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        max_events: int = 1024,
+        conversation_id: Optional[str] = None,
+        disconnect_grace: Optional[float] = None
+    ):
+        self.stream_id = stream_id
+        self.conversation_id = conversation_id
+        self.disconnect_grace = disconnect_grace
+        self.cancelled = False
+        self.frames: Deque[Tuple[int, bytes]] = deque(maxlen=max_events)
+        self.next_seq = 1
+        self.finished = False
+        self.subscribers = 0
+        self.last_active = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Dict[str, Any]):
+        seq = self.next_seq
+        self.next_seq += 1
+        frame = f"id: {self.stream_id}:{seq}\n".encode("utf-8") + encode_event(event)
+        self.frames.append((seq, frame))
+        self._notify()
+
+    def finish(self):
+        self.finished = True
+        self.last_active = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[bytes]:
+        """产出序号大于 after_seq 的帧，直到生成结束"""
+        self.subscribers += 1
+        cursor = after_seq
+        try:
+            while True:
+                changed = self._changed
+                if self.frames:
+                    first_seq = self.frames[0][0]
+                    if cursor + 1 < first_seq:
+                        # 断线太久，部分事件已被环形缓冲覆盖
+                        yield encode_event({"type": "status", "content": "断线期间的部分内容已过期"})
+                        cursor = first_seq - 1
+                    for index in range(cursor + 1 - first_seq, len(self.frames)):
+                        seq, frame = self.frames[index]
+                        cursor = seq
+                        yield frame
+                if self.finished and cursor >= self.next_seq - 1:
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            self.last_active = time.monotonic()
+            if not self.subscribers and not self.finished and self.disconnect_grace is not None:
+                asyncio.get_running_loop().call_later(self.disconnect_grace, self._cancel_if_abandoned)
+
+    def _cancel_if_abandoned(self):
+        """断开后仍没有客户端重连：取消生成，释放上游连接、工具调用和并发槽位"""
+        if self.subscribers or self.finished or self.task is None or self.task.done():
+            return
+        self.cancelled = True
+        self.task.cancel()
+        METRICS.inc("stream_cancelled_total", reason="disconnect")
+
+
+class StreamRegistry:
+    """进行中和最近完成的流，按 stream_id 索引
+
+    没有客户端连接、且空闲超过 idle_ttl 的流会被清理；仍在生成的会被取消。清理在新请求到达时进行，
+    start_sweeper 启动后还会在后台每隔 idle_ttl / 2 进行一次，没有流量时也会释放已完成的流的缓冲。
+    disconnect_grace 为客户端断开后等待重连的时间，超过后取消仍在进行的生成（负数表示不取消）。
+    """
+
+    def __init__(
+        self,
+        max_events: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        disconnect_grace: Optional[float] = None
+    ):
+        self.max_events = max_events or int(setting("STREAM_BUFFER_EVENTS", "1024"))
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(setting("STREAM_IDLE_TTL", "60"))
+        if disconnect_grace is None:
+            disconnect_grace = float(os.environ.get("STREAM_DISCONNECT_GRACE", "5"))
+        self.disconnect_grace = disconnect_grace if disconnect_grace >= 0 else None
+        self._streams: Dict[str, ResumableStream] = {}
+        self.resumed = 0
+        self.expired = 0
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    def start(
+        self, stream_id: str, events: AsyncIterator[Dict[str, Any]], conversation_id: Optional[str] = None
+    ) -> ResumableStream:
+        """在后台任务中运行生成，事件写入该流的缓冲"""
+        self.sweep()
+        stream = ResumableStream(stream_id, self.max_events, conversation_id, self.disconnect_grace)
+        self._streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._pump(stream, events))
+        return stream
+
+    @staticmethod
+    async def _pump(stream: ResumableStream, events: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for event in events:
+                stream.publish(event)
+        finally:
+            stream.finish()
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        self.sweep()
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            self.resumed += 1
+        return stream
+
+    def sweep(self):
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.subscribers == 0 and now - stream.last_active > self.idle_ttl:
+                if stream.task is not None and not stream.task.done():
+                    stream.task.cancel()
+                del self._streams[stream_id]
+                self.expired += 1
+
+    async def _sweep_loop(self):
+        interval = max(self.idle_ttl / 2, 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def start_sweeper(self):
+        """启动后台定期清理（需要在事件循环中调用）"""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop_sweeper(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
+    async def close(self):
+        await self.stop_sweeper()
+        tasks = [s.task for s in self._streams.values() if s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._streams),
+            "active": sum(1 for s in self._streams.values() if not s.finished),
+            "resumed": self.resumed,
+            "expired": self.expired
+        }
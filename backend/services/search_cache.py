@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from backend.services.memory_profile import setting
+
+# 对搜索结果没有影响的常见口语前缀，只在查询开头去掉（长的在前）
+_FILLER_PREFIXES = ("请问", "麻烦", "帮我", "搜索一下", "搜一下", "查一下", "今天的", "今天")
+_WHITESPACE_RE = re.compile(r"\s+")
+# 句末标点；不包含 + # . - 等可能有意义的符号
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s?？!！。，,、;；:：~～…]+$")
+# 去掉前缀之后残留的分隔符，如“请问，北京天气”
+_LEADING_SEPARATOR_RE = re.compile(r"^[\s，,、:：]+")
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、小写、合并空白、去掉句末标点和开头的填充词
+
+    查询中间的符号和数字保留：“C++ 教程”和“C 教程”、“3.14”和“314”是不同的查询；
+    填充词只在开头去掉，“搜索引擎推荐”“一下子”不受影响。
+    """
+    text = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query or "").lower()).strip()
+    text = _TRAILING_PUNCTUATION_RE.sub("", text)
+    stripped = text
+    while True:
+        prefix = next((word for word in _FILLER_PREFIXES if stripped.startswith(word)), None)
+        if prefix is None:
+            break
+        stripped = _LEADING_SEPARATOR_RE.sub("", stripped[len(prefix):])
+    # 只剩填充词时保留原始文本，避免不同查询撞到同一个空键
+    return stripped or text
+
+
+def make_cache_key(query: str, max_results: int) -> str:
+    """缓存键：规范化查询 + 结果数量"""
+    return f"{normalize_query(query)}|{max_results}"
+
+
+class SearchCache:
+    """搜索结果缓存的基类
+
+    同时提供同步接口（供线程池中的非流式路径使用）和异步接口（供流式路径使用）。
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get(key)
+
+    async def set_async(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+    async def close(self):
+        """释放资源"""
+
+
+class MemorySearchCache(SearchCache):
+    """进程内 LRU 缓存，带每条目 TTL"""
+
+    def __init__(self, ttl: float = 600, max_entries: int = 512):
+        super().__init__(ttl, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._record(False)
+                return None
+            self._entries.move_to_end(key)
+            self._record(True)
+            return entry[1]
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteSearchCache(SearchCache):
+    """基于 SQLite 的持久化缓存，重启后仍然有效
+
+    同步接口使用 sqlite3，异步接口使用 aiosqlite，两者共享同一个数据库文件。
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS search_cache ("
+        " key TEXT PRIMARY KEY,"
+        " value TEXT NOT NULL,"
+        " expires_at REAL NOT NULL,"
+        " last_access REAL NOT NULL)"
+    )
+    _INDEX = "CREATE INDEX IF NOT EXISTS idx_search_cache_last_access ON search_cache(last_access)"
+
+    def __init__(self, path: str = "search_cache.db", ttl: float = 600, max_entries: int = 4096):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(self._SCHEMA)
+        self._conn.execute(self._INDEX)
+        self._conn.commit()
+        self._async_conn = None
+
+    def _evict_sql(self) -> Tuple[str, Tuple[Any, ...]]:
+        return (
+            "DELETE FROM search_cache WHERE key IN ("
+            " SELECT key FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] < now:
+                self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        self._record(row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+            )
+            cursor = self._conn.execute(*self._evict_sql())
+            self.evictions += max(cursor.rowcount, 0)
+            self._conn.commit()
+
+    async def _get_async_conn(self):
+        if self._async_conn is None:
+            import aiosqlite
+            self._async_conn = await aiosqlite.connect(self.path)
+        return self._async_conn
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        db = await self._get_async_conn()
+        async with db.execute("SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+        if row is not None and row[1] < now:
+            await db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+            row = None
+        if row is not None:
+            await db.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+        await db.commit()
+        self._record(row is not None)
+        return json.loads(row[0]) if row is not None else None
+
+    async def set_async(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        db = await self._get_async_conn()
+        await db.execute(
+            "INSERT OR REPLACE INTO search_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+        )
+        cursor = await db.execute(*self._evict_sql())
+        self.evictions += max(cursor.rowcount, 0)
+        await db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+    async def close(self):
+        if self._async_conn is not None:
+            await self._async_conn.close()
+            self._async_conn = None
+        with self._lock:
+            self._conn.close()
+
+
+def create_search_cache() -> Optional[SearchCache]:
+    """根据环境变量创建搜索缓存
+
+    SEARCH_CACHE_BACKEND: memory（默认）/ sqlite / none
+    SEARCH_CACHE_TTL: 条目有效期（秒），默认 600
+    SEARCH_CACHE_MAX_ENTRIES: 最大条目数，默认 512
+    SEARCH_CACHE_PATH: sqlite 数据库路径，默认 search_cache.db
+    """
+    backend = os.environ.get("SEARCH_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.environ.get("SEARCH_CACHE_TTL", "600"))
+    max_entries = int(setting("SEARCH_CACHE_MAX_ENTRIES", "512"))
+
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        path = os.environ.get("SEARCH_CACHE_PATH", "search_cache.db")
+        return SQLiteSearchCache(path, ttl=ttl, max_entries=max_entries)
+    if backend == "memory":
+        return MemorySearchCache(ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"未知的 SEARCH_CACHE_BACKEND: {backend}")
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
+
+from backend.services.http_pool import HTTPClients
+from backend.services.backend_pool import backend_urls
+from backend.services.memory_profile import setting
+
+
+class EmbeddingClient:
+    """调用 OpenAI 兼容后端的 /v1/embeddings（如 Ollama 的 bge-m3）"""
+
+    def __init__(self, base_url: str, model: str = "bge-m3", http_clients: Optional[HTTPClients] = None):
+        self.model = model
+        http_clients = http_clients or HTTPClients()
+        timeout = http_clients.config.timeout("llm")
+        self.client = OpenAI(
+            base_url=base_url, api_key="ollama", timeout=timeout, http_client=http_clients.sync_client("llm")
+        )
+        self.async_client = AsyncOpenAI(
+            base_url=base_url, api_key="ollama", timeout=timeout, http_client=http_clients.async_client("llm")
+        )
+
+    def embed(self, text: str) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.model, input=text, encoding_format="float")
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        response = await self.async_client.embeddings.create(model=self.model, input=text, encoding_format="float")
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+
+class SemanticCache:
+    """近似查询缓存
+
+    向量归一化后按行存放在预分配的 float32 矩阵中（内存上限为 max_entries × 维度 × 4 字节），
+    查询时一次矩阵乘法得到与所有条目的余弦相似度，取 top-1，达到 threshold 才算命中。
+    partition 区分不能互相复用的条目（如不同的 max_results）。
+    已满时优先覆盖过期条目，否则覆盖最久未使用的条目。
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[EmbeddingClient] = None,
+        max_entries: int = 4096,
+        threshold: float = 0.92,
+        ttl: float = 600
+    ):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dim: Optional[int] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.partitions = np.zeros(max_entries, dtype=np.int64)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.last_access = np.zeros(max_entries, dtype=np.float64)
+        self.values: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embedding_errors = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _best(self, vector: np.ndarray, partition: int, now: float) -> Tuple[int, float]:
+        """返回同一分区内未过期条目中相似度最高的槽位和分数，调用方持有锁"""
+        if self.vectors is None or not self.size:
+            return -1, -1.0
+        n = self.size
+        scores = self.vectors[:n] @ vector
+        scores[(self.partitions[:n] != partition) | (self.expires_at[:n] < now)] = -1.0
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, vector: np.ndarray, partition: int = 0) -> Optional[Dict[str, Any]]:
+        return self.lookup_scored(vector, partition)[0]
+    
+    def lookup_scored(self, vector: np.ndarray, partition: int = 0) -> Tuple[Optional[Dict[str, Any]], float]:
+        """返回（命中的值, 相似度），未命中时值为 None"""
+        vector = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if vector is None or len(vector) != self.dim:
+                self.misses += 1
+                return None, -1.0
+            index, score = self._best(vector, partition, now)
+            if index < 0 or score < self.threshold:
+                self.misses += 1
+                return None, score
+            self.last_access[index] = now
+            self.hits += 1
+            return self.values[index], score
+
+    def add(self, vector: np.ndarray, value: Dict[str, Any], partition: int = 0, ttl: Optional[float] = None):
+        vector = self._normalize(vector)
+        if vector is None:
+            return
+        now = time.time()
+        with self._lock:
+            if self.dim != len(vector):
+                # 第一次写入或更换了嵌入模型：按新维度重建矩阵
+                self.dim = len(vector)
+                self.vectors = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+                self.values = [None] * self.max_entries
+                self.size = 0
+
+            index, score = self._best(vector, partition, now)
+            if index < 0 or score < self.threshold:
+                if self.size < self.max_entries:
+                    index = self.size
+                    self.size += 1
+                else:
+                    # 过期条目的访问时间视为最早
+                    candidates = np.where(self.expires_at < now, -np.inf, self.last_access)
+                    index = int(np.argmin(candidates))
+                    self.evictions += 1
+            self.vectors[index] = vector
+            self.partitions[index] = partition
+            self.expires_at[index] = now + (self.ttl if ttl is None else ttl)
+            self.last_access[index] = now
+            self.values[index] = value
+
+    @staticmethod
+    def _scored(value: Optional[Dict[str, Any]], score: float) -> Optional[Dict[str, Any]]:
+        """命中的值附带相似度，调用方可以告诉模型结果来自近似查询"""
+        return {**value, "similarity": round(score, 4)} if value is not None else None
+
+    def get(self, text: str, partition: int = 0) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """嵌入文本并查找；返回（命中的值及 similarity, 向量），向量供未命中时写入，嵌入失败时为 None"""
+        try:
+            vector = self.embedder.embed(text)
+        except Exception:
+            self.embedding_errors += 1
+            return None, None
+        return self._scored(*self.lookup_scored(vector, partition)), vector
+
+    async def get_async(self, text: str, partition: int = 0) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """异步版本；矩阵乘法在线程中执行（10 万条目时约 40ms），不阻塞事件循环"""
+        try:
+            vector = await self.embedder.embed_async(text)
+        except Exception:
+            self.embedding_errors += 1
+            return None, None
+        return self._scored(*await asyncio.to_thread(self.lookup_scored, vector, partition)), vector
+
+    async def add_async(self, vector: np.ndarray, value: Dict[str, Any], partition: int = 0, ttl: Optional[float] = None):
+        """异步版本，写入时同样要计算一次全部相似度，在线程中执行"""
+        await asyncio.to_thread(self.add, vector, value, partition, ttl)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "embedding_errors": self.embedding_errors,
+            "size": self.size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "matrix_bytes": self.vectors.nbytes if self.vectors is not None else 0
+        }
+
+
+def create_semantic_cache(http_clients: Optional[HTTPClients] = None) -> Optional[SemanticCache]:
+    """根据环境变量创建近似查询缓存（默认关闭）
+
+    SEMANTIC_CACHE: 设为 1 开启
+    SEMANTIC_CACHE_THRESHOLD: 余弦相似度阈值，默认 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES: 最大条目数，默认 4096
+    SEMANTIC_CACHE_TTL: 条目有效期（秒），默认与 SEARCH_CACHE_TTL 相同
+    EMBEDDING_MODEL: 嵌入模型，默认 bge-m3
+    EMBEDDING_BASE_URL: 嵌入服务地址，默认使用 OLLAMA_BASE_URLS 的第一个或 OLLAMA_BASE_URL
+    """
+    if os.environ.get("SEMANTIC_CACHE", "0").lower() not in ("1", "true", "yes"):
+        return None
+    base_url = os.environ.get("EMBEDDING_BASE_URL") or backend_urls()[0]
+    embedder = EmbeddingClient(base_url, os.environ.get("EMBEDDING_MODEL", "bge-m3"), http_clients)
+    return SemanticCache(
+        embedder,
+        max_entries=int(setting("SEMANTIC_CACHE_MAX_ENTRIES", "4096")),
+        threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", os.environ.get("SEARCH_CACHE_TTL", "600")))
+    )
@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+def make_flight_key(payload: Any) -> str:
+    """将任意可 JSON 序列化的请求参数转换为稳定的键"""
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """请求合并（single-flight）
+
+    同一时刻相同 key 的调用只执行一次，其余调用者等待并共享同一个结果（或异常）。
+    异步调用在独立任务中执行，因此某个等待者被取消不会影响其他等待者；
+    所有等待者都取消时（例如客户端全部断开），取消该调用。
+    同步接口供线程池中的非流式路径使用。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._sync_calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行或加入一个进行中的异步调用"""
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.shared += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # 只有在等待者全部被取消时任务才可能尚未完成
+                if not task.done():
+                    # 取消时立即移除，之后加入的调用者开始新的调用，
+                    # 而不是在完成回调运行之前加入正在取消的任务并收到 CancelledError
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                    task.cancel()
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def do_sync(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """执行或加入一个进行中的同步调用"""
+        with self._lock:
+            future = self._sync_calls.get(key)
+            leader = future is None
+            if leader:
+                self.executed += 1
+                future = Future()
+                self._sync_calls[key] = future
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._sync_calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计"""
+        return {
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._calls) + len(self._sync_calls),
+        }
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import asyncio
+from collections.abc import Mapping
+from json.encoder import encode_basestring
+from typing import Dict, Any, AsyncIterator, Optional
+
+from backend.services.memory_profile import setting
+
+# 通用事件的编码器，只构建一次
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+# 最常见的事件形状直接拼接字符串，避免每个 token 走一遍完整的 json.dumps
+_CONTENT_PREFIX = 'data: {"type":"content","content":'
+_STATUS_PREFIX = 'data: {"type":"status","content":'
+_FRAME_SUFFIX = "}\n\n"
+_DONE_FRAME = b'data: {"type":"done"}\n\n'
+
+
+class Delta(Mapping):
+    """流式增量事件（content / reasoning）
+
+    每个 token 产生一个，用两个槽位代替字典（48 字节，字典约 180 字节）；
+    实现只读的 Mapping 接口，可以和 {"type": ..., "content": ...} 字典互换使用和比较。
+    """
+
+    __slots__ = ("type", "content")
+
+    def __init__(self, type: str, content: str):
+        self.type = type
+        self.content = content
+
+    def __getitem__(self, key: str) -> str:
+        if key == "type":
+            return self.type
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("type", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return f"Delta({self.type!r}, {self.content!r})"
+
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """将事件编码为一个 SSE 帧"""
+    if type(event) is Delta:
+        if event.type == "content":
+            return (_CONTENT_PREFIX + encode_basestring(event.content) + _FRAME_SUFFIX).encode("utf-8")
+        event = {"type": event.type, "content": event.content}
+    elif len(event) == 2:
+        kind = event.get("type")
+        content = event.get("content")
+        if isinstance(content, str):
+            if kind == "content":
+                return (_CONTENT_PREFIX + encode_basestring(content) + _FRAME_SUFFIX).encode("utf-8")
+            if kind == "status":
+                return (_STATUS_PREFIX + encode_basestring(content) + _FRAME_SUFFIX).encode("utf-8")
+    elif len(event) == 1 and event.get("type") == "done":
+        return _DONE_FRAME
+    return ("data: " + _ENCODER.encode(event) + "\n\n").encode("utf-8")
+
+
+def _content_of(event: Dict[str, Any]) -> Optional[str]:
+    """只有 type 和 content 两个字段的内容事件返回其文本，其他事件返回 None"""
+    if type(event) is Delta:
+        return event.content if event.type == "content" else None
+    if len(event) == 2 and event.get("type") == "content":
+        return event["content"]
+    return None
+
+
+def default_coalesce_ms() -> float:
+    """SSE_COALESCE_MS: 合并内容增量的时间窗口（毫秒），默认 15，0 表示逐个发送"""
+    return float(os.environ.get("SSE_COALESCE_MS", "15"))
+
+
+def default_coalesce_bytes() -> int:
+    """SSE_COALESCE_BYTES: 缓冲的内容达到该字节数时立即发送，默认 1024"""
+    return int(setting("SSE_COALESCE_BYTES", "1024"))
+
+
+async def coalesce_content(
+    events: AsyncIterator[Dict[str, Any]],
+    window_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """将时间窗口内连续的 content 事件合并为一个
+
+    第一个增量到达后最多等待 window_ms，期间到达的增量拼接在一起；
+    遇到其他类型的事件、缓冲超过 max_bytes 或窗口到期时立即发出。
+    window_ms 为 0 时原样转发。
+    """
+    window = (default_coalesce_ms() if window_ms is None else window_ms) / 1000
+    limit = default_coalesce_bytes() if max_bytes is None else max_bytes
+    if window <= 0:
+        async for event in events:
+            yield event
+        return
+
+    iterator = events.__aiter__()
+    parts = []
+    size = 0
+    deadline = 0.0
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if parts:
+                # 有缓冲时只等到窗口结束，下一个事件的读取任务保留到下一轮
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - time.monotonic()))
+                if not done:
+                    yield Delta("content", "".join(parts))
+                    parts, size = [], 0
+                    continue
+            try:
+                event = await pending
+            except StopAsyncIteration:
+                break
+            finally:
+                if pending.done():
+                    pending = None
+
+            content = _content_of(event)
+            if content is not None:
+                if not parts:
+                    deadline = time.monotonic() + window
+                parts.append(content)
+                size += len(content.encode("utf-8"))
+                if size >= limit:
+                    yield Delta("content", "".join(parts))
+                    parts, size = [], 0
+                continue
+
+            if parts:
+                yield Delta("content", "".join(parts))
+                parts, size = [], 0
+            yield event
+
+        if parts:
+            yield Delta("content", "".join(parts))
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
@@ -1,73 +1,219 @@
 import os
-from tavily import TavilyClient
-from typing import Dict, Any
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from backend.services.http_pool import HTTPClients
+from backend.services.search_cache import SearchCache, create_search_cache, make_cache_key
+from backend.services.single_flight import SingleFlight
+from backend.services.tracing import METRICS, span
+
+if TYPE_CHECKING:
+    from backend.services.semantic_cache import SemanticCache
+
+# 搜索工具定义，模块级常量保证每次请求序列化结果一致
+SEARCH_TOOL_DEFINITION = {
+    "type": "function",
+    "function": {
+        "name": "search",
+        "description": "搜索实时信息。当用户询问最新新闻、天气、股价、体育赛事结果等需要实时信息的问题时使用此工具。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "搜索查询字符串"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "最大结果数量",
+                    "minimum": 1,
+                    "maximum": 10,
+                    "default": 5
+                }
+            },
+            "required": ["query"]
+        }
+    }
+}
 
 class TavilyService:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[SearchCache] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        http_clients: Optional[HTTPClients] = None
+    ):
         self.api_key = os.environ.get('TAVILY_API_KEY')
         if not self.api_key:
             raise ValueError("TAVILY_API_KEY environment variable is required")
-        self.client = TavilyClient(api_key=self.api_key)
+        # 可通过 TAVILY_BASE_URL 指向自建或本地的兼容服务
+        self.base_url = os.environ.get('TAVILY_BASE_URL')
+        # 连接池由 OpenAIService 共享传入，单独使用时自建
+        self.http_clients = http_clients or HTTPClients()
+        # SDK 按单个超时值发送请求，使用读超时作为整体上限
+        self.timeout = self.http_clients.config.read_timeouts["search"]
+        # SDK 客户端在第一次搜索时创建，导入 tavily 不放在服务启动的路径上
+        self._client = None
+        self._async_client = None
+        # 搜索结果缓存，未显式传入时按环境变量创建（可能为 None 表示禁用）
+        self.cache = cache if cache is not None else create_search_cache()
+        # 精确缓存未命中时按查询向量查找近似查询（SEMANTIC_CACHE 开启时）
+        if semantic_cache is None and os.environ.get("SEMANTIC_CACHE", "0").lower() in ("1", "true", "yes"):
+            # 开启时才导入 numpy 和嵌入客户端
+            from backend.services.semantic_cache import create_semantic_cache
+            semantic_cache = create_semantic_cache(self.http_clients)
+        self.semantic_cache = semantic_cache
+        # 合并并发的相同查询
+        self.single_flight = SingleFlight()
+    
+    @property
+    def client(self):
+        if self._client is None:
+            from tavily import TavilyClient
+            self._client = TavilyClient(
+                api_key=self.api_key,
+                api_base_url=self.base_url,
+                session=self.http_clients.requests_session("search")
+            )
+        return self._client
+    
+    @property
+    def async_client(self):
+        """异步客户端，供流式接口使用，避免阻塞事件循环"""
+        if self._async_client is None:
+            from tavily import AsyncTavilyClient
+            self._async_client = AsyncTavilyClient(
+                api_key=self.api_key,
+                api_base_url=self.base_url,
+                client=self.http_clients.async_client("search")
+            )
+        return self._async_client
     
     def get_tool_definition(self) -> Dict[str, Any]:
-        """返回搜索工具的定义"""
+        """返回搜索工具的定义（同一个对象，不要修改）"""
+        return SEARCH_TOOL_DEFINITION
+    
+    def _format_response(self, query: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        """格式化搜索结果"""
+        formatted_results = []
+        for result in response.get('results', []):
+            content = result.get('content', '')
+            if len(content) > 300:
+                content = content[:300] + "..."
+                
+            formatted_results.append({
+                "title": result.get('title', ''),
+                "url": result.get('url', ''),
+                "content": content,
+                "score": result.get('score', 0)
+            })
+        
         return {
-            "type": "function",
-            "function": {
-                "name": "search",
-                "description": "搜索实时信息。当用户询问最新新闻、天气、股价、体育赛事结果等需要实时信息的问题时使用此工具。",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "搜索查询字符串"
-                        },
-                        "max_results": {
-                            "type": "integer",
-                            "description": "最大结果数量",
-                            "minimum": 1,
-                            "maximum": 10,
-                            "default": 5
-                        }
-                    },
-                    "required": ["query"]
-                }
-            }
+            "success": True,
+            "query": query,
+            "results_count": len(formatted_results),
+            "results": formatted_results
         }
     
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """返回缓存统计，未启用缓存时返回 None"""
+        return self.cache.stats() if self.cache is not None else None
+    
+    def semantic_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """返回近似查询缓存统计，未启用时返回 None"""
+        return self.semantic_cache.stats() if self.semantic_cache is not None else None
+    
+    def _fetch(self, key: str, query: str, max_results: int) -> Dict[str, Any]:
+        """访问上游并写入缓存"""
+        # 使用基本搜索
+        response = self.client.search(
+            query=query,
+            max_results=max_results,
+            include_raw_content=False,
+            timeout=self.timeout
+        )
+        result = self._format_response(query, response)
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return result
+    
+    async def _fetch_async(self, key: str, query: str, max_results: int) -> Dict[str, Any]:
+        """访问上游并写入缓存（异步版本）"""
+        response = await self.async_client.search(
+            query=query,
+            max_results=max_results,
+            include_raw_content=False,
+            timeout=self.timeout
+        )
+        result = self._format_response(query, response)
+        if self.cache is not None:
+            await self.cache.set_async(key, result)
+        return result
+    
+    @staticmethod
+    def _semantic_hit(query: str, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """近似命中的结果：保留原查询（matched_query）和相似度，模型可以看出结果是为另一个查询获取的"""
+        return {**cached, "query": query, "matched_query": cached.get("query"), "semantic_hit": True}
+    
     def search(self, query: str, max_results: int = 5) -> Dict[str, Any]:
         """执行搜索功能"""
+        key = make_cache_key(query, max_results)
         try:
-            # 使用基本搜索
-            response = self.client.search(
-                query=query,
-                max_results=max_results,
-                include_raw_content=False
-            )
+            if self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    METRICS.inc("search_requests_total", result="cache_hit")
+                    return {**cached, "query": query}
             
-            # 格式化结果
-            formatted_results = []
-            for result in response.get('results', []):
-                content = result.get('content', '')
-                if len(content) > 300:
-                    content = content[:300] + "..."
-                    
-                formatted_results.append({
-                    "title": result.get('title', ''),
-                    "url": result.get('url', ''),
-                    "content": content,
-                    "score": result.get('score', 0)
-                })
+            vector = None
+            if self.semantic_cache is not None:
+                with span("search.embedding"):
+                    cached, vector = self.semantic_cache.get(query, max_results)
+                if cached is not None:
+                    METRICS.inc("search_requests_total", result="semantic_hit")
+                    return self._semantic_hit(query, cached)
             
+            # 相同的进行中查询合并为一次上游请求
+            with span("search.upstream"):
+                result = self.single_flight.do_sync(key, lambda: self._fetch(key, query, max_results))
+            METRICS.inc("search_requests_total", result="upstream")
+            if vector is not None:
+                self.semantic_cache.add(vector, result, max_results)
+            return {**result, "query": query}
+        
+        except Exception as e:
+            METRICS.inc("search_requests_total", result="error")
             return {
-                "success": True,
-                "query": query,
-                "results_count": len(formatted_results),
-                "results": formatted_results
+                "success": False,
+                "error": f"{type(e).__name__}: {str(e)}"
             }
+    
+    async def search_async(self, query: str, max_results: int = 5) -> Dict[str, Any]:
+        """执行搜索功能（异步版本）"""
+        key = make_cache_key(query, max_results)
+        try:
+            if self.cache is not None:
+                cached = await self.cache.get_async(key)
+                if cached is not None:
+                    METRICS.inc("search_requests_total", result="cache_hit")
+                    return {**cached, "query": query}
+            
+            vector = None
+            if self.semantic_cache is not None:
+                with span("search.embedding"):
+                    cached, vector = await self.semantic_cache.get_async(query, max_results)
+                if cached is not None:
+                    METRICS.inc("search_requests_total", result="semantic_hit")
+                    return self._semantic_hit(query, cached)
+            
+            # 相同的进行中查询合并为一次上游请求
+            with span("search.upstream"):
+                result = await self.single_flight.do(key, lambda: self._fetch_async(key, query, max_results))
+            METRICS.inc("search_requests_total", result="upstream")
+            if vector is not None:
+                await self.semantic_cache.add_async(vector, result, max_results)
+            return {**result, "query": query}
         
         except Exception as e:
+            METRICS.inc("search_requests_total", result="error")
             return {
                 "success": False,
                 "error": f"{type(e).__name__}: {str(e)}"
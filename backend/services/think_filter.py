@@ -0,0 +1,91 @@
+from typing import List, Tuple, Optional
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# qwen3 的软开关：追加在用户消息末尾时本次回复跳过推理（仍输出一个空的 think 块）
+NO_THINK_SWITCH = "/no_think"
+
+REASONING = "reasoning"
+CONTENT = "content"
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text 末尾可能是 tag 开头的最长长度（标签被拆在两个增量之间时需要留到下一次判断）"""
+    for length in range(min(len(text), len(tag) - 1), 0, -1):
+        if tag.startswith(text[-length:]):
+            return length
+    return 0
+
+
+class ThinkStreamParser:
+    """按增量拆分推理和回答
+
+    qwen3 在回答之前输出 <think>...</think>。feed 接收任意切分的增量，返回 (类型, 文本) 片段，
+    类型为 reasoning 或 content；只有可能是标签开头的几个字符会留到下一个增量，其余立即返回。
+    推理块只在回答开头识别（前面只允许空白），回答正文中出现的 <think> 原样保留；
+    think 块之后、回答之前的空白丢弃。
+    """
+
+    def __init__(self):
+        # start: 还没有看到非空白内容；reasoning: 在 think 块中；answer_start: 刚结束 think 块；content: 回答正文
+        self.state = "start"
+        self._pending = ""
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        text = self._pending + text
+        self._pending = ""
+        parts: List[Tuple[str, str]] = []
+
+        while text:
+            if self.state == "start":
+                stripped = text.lstrip()
+                if not stripped:
+                    self._pending = text
+                    break
+                if stripped.startswith(THINK_OPEN):
+                    self.state = "reasoning"
+                    text = stripped[len(THINK_OPEN):]
+                elif THINK_OPEN.startswith(stripped):
+                    self._pending = text
+                    break
+                else:
+                    self.state = "content"
+            elif self.state == "reasoning":
+                end = text.find(THINK_CLOSE)
+                if end >= 0:
+                    if end:
+                        parts.append((REASONING, text[:end]))
+                    self.state = "answer_start"
+                    text = text[end + len(THINK_CLOSE):]
+                    continue
+                keep = _partial_suffix(text, THINK_CLOSE)
+                if len(text) > keep:
+                    parts.append((REASONING, text[:len(text) - keep]))
+                self._pending = text[len(text) - keep:]
+                break
+            elif self.state == "answer_start":
+                text = text.lstrip()
+                if text:
+                    self.state = "content"
+            else:
+                parts.append((CONTENT, text))
+                break
+
+        return parts
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """流结束时返回留存的字符；未闭合的 think 块按推理处理，只有空白时丢弃"""
+        text, self._pending = self._pending, ""
+        if not text or self.state == "answer_start" or (self.state == "start" and not text.strip()):
+            return []
+        return [(REASONING if self.state == "reasoning" else CONTENT, text)]
+
+
+def split_reasoning(text: Optional[str]) -> Tuple[str, str]:
+    """拆分完整回复（非流式）中的推理和回答，返回 (推理, 回答)"""
+    parser = ThinkStreamParser()
+    reasoning, content = [], []
+    for kind, part in parser.feed(text or "") + parser.flush():
+        (reasoning if kind == REASONING else content).append(part)
+    return "".join(reasoning), "".join(content)
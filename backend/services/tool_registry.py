@@ -0,0 +1,199 @@
+import json
+import asyncio
+import inspect
+from typing import List, Dict, Any, Callable, Optional
+
+# JSON Schema 类型与 Python 类型的对应（只支持工具参数用得到的子集）
+_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict
+}
+
+
+class ToolArgumentError(ValueError):
+    """工具参数不符合 schema"""
+
+
+def compile_schema(schema: Dict[str, Any], path: str = "参数") -> Callable[[Any], Any]:
+    """将 JSON Schema 编译为校验函数，注册时执行一次
+
+    校验函数返回规范化后的值（对象补齐 default、丢弃未声明的字段），不合法时抛出 ToolArgumentError。
+    小模型常把数字写成字符串，integer / number 接受可解析的数字字符串。
+    schema 本身不合法（未知类型、required 中的字段未声明）时抛出 ValueError。
+    """
+    kind = schema.get("type")
+    if kind not in _TYPES:
+        raise ValueError(f"{path}: 不支持的类型 {kind!r}")
+    expected = _TYPES[kind]
+    enum = schema.get("enum")
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+
+    if kind == "object":
+        properties = {
+            name: (compile_schema(sub, f"{path}.{name}"), sub)
+            for name, sub in (schema.get("properties") or {}).items()
+        }
+        required = list(schema.get("required") or [])
+        for name in required:
+            if name not in properties:
+                raise ValueError(f"{path}: required 中的 {name} 未在 properties 中声明")
+    elif kind == "array":
+        item_validator = compile_schema(schema["items"], f"{path}[]") if "items" in schema else None
+
+    def validate(value: Any) -> Any:
+        if kind in ("integer", "number") and isinstance(value, str):
+            try:
+                value = float(value.strip())
+            except ValueError:
+                raise ToolArgumentError(f"{path} 应为数字") from None
+        if kind == "integer" and isinstance(value, float) and value.is_integer():
+            value = int(value)
+        # bool 是 int 的子类，需要单独排除
+        if not isinstance(value, expected) or (kind in ("integer", "number") and isinstance(value, bool)):
+            raise ToolArgumentError(f"{path} 应为 {kind}")
+        if enum is not None and value not in enum:
+            raise ToolArgumentError(f"{path} 应为 {enum} 之一")
+        if minimum is not None and value < minimum:
+            raise ToolArgumentError(f"{path} 不能小于 {minimum}")
+        if maximum is not None and value > maximum:
+            raise ToolArgumentError(f"{path} 不能大于 {maximum}")
+
+        if kind == "object":
+            result = {}
+            for name, (validator, sub) in properties.items():
+                if name in value:
+                    result[name] = validator(value[name])
+                elif "default" in sub:
+                    result[name] = sub["default"]
+                elif name in required:
+                    raise ToolArgumentError(f"缺少 {path}.{name}")
+            return result
+        if kind == "array" and item_validator is not None:
+            return [item_validator(item) for item in value]
+        return value
+
+    return validate
+
+
+class ToolDefinitions(list):
+    """发送给模型的工具列表，附带注册时序列化好的 JSON（token 计数和各类缓存键直接使用，不再逐次序列化）
+
+    注册完成后不应再修改列表内容，否则 json 与列表不一致。
+    """
+
+    def __init__(self, definitions: List[Dict[str, Any]]):
+        super().__init__(definitions)
+        self.json = json.dumps(definitions, ensure_ascii=False, sort_keys=True)
+
+
+def tools_json(tools: Optional[List[Dict[str, Any]]]) -> str:
+    """工具列表的 JSON；ToolDefinitions 直接返回注册时的序列化结果"""
+    if isinstance(tools, ToolDefinitions):
+        return tools.json
+    return json.dumps(tools or [], ensure_ascii=False, sort_keys=True)
+
+
+class Tool:
+    """一个已注册的工具：定义、编译好的参数校验函数，以及同步 / 异步实现（至少提供一个）"""
+
+    def __init__(
+        self,
+        definition: Dict[str, Any],
+        handler: Optional[Callable[..., Dict[str, Any]]] = None,
+        async_handler: Optional[Callable[..., Any]] = None
+    ):
+        function = definition.get("function") or {}
+        if definition.get("type") != "function" or not function.get("name"):
+            raise ValueError("工具定义应为 {\"type\": \"function\", \"function\": {\"name\": ...}}")
+        parameters = function.get("parameters") or {"type": "object", "properties": {}}
+        if parameters.get("type") != "object":
+            raise ValueError(f"{function['name']}: parameters 应为 object")
+        if handler is None and async_handler is None:
+            raise ValueError(f"{function['name']}: 至少需要一个实现")
+        if async_handler is None and inspect.iscoroutinefunction(handler):
+            handler, async_handler = None, handler
+
+        self.name = function["name"]
+        self.definition = definition
+        self.validate = compile_schema(parameters, self.name)
+        self.handler = handler
+        self.async_handler = async_handler
+
+    def call(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        if self.handler is not None:
+            return self.handler(**arguments)
+        # 同步路径（工具线程池中）调用只有异步实现的工具
+        return asyncio.run(self.async_handler(**arguments))
+
+    async def call_async(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        if self.async_handler is not None:
+            return await self.async_handler(**arguments)
+        # 只有同步实现的工具放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self.handler, **arguments)
+
+
+class ToolRegistry:
+    """工具注册表
+
+    工具在启动时注册一次：校验定义并编译参数校验函数；definitions 是发送给模型的工具列表，
+    注册时序列化一次（见 ToolDefinitions），注册完成后保持为同一个对象，请求之间的提示词前缀保持稳定。
+    调用按名称查表分发，未知工具、参数错误和执行异常都转换为失败结果，作为 tool 消息返回给模型。
+    """
+
+    def __init__(self):
+        self._tools: Dict[str, Tool] = {}
+        self.definitions = ToolDefinitions([])
+
+    def register(
+        self,
+        definition: Dict[str, Any],
+        handler: Optional[Callable[..., Dict[str, Any]]] = None,
+        async_handler: Optional[Callable[..., Any]] = None
+    ) -> Tool:
+        tool = Tool(definition, handler, async_handler)
+        if tool.name in self._tools:
+            raise ValueError(f"工具 {tool.name} 已注册")
+        self._tools[tool.name] = tool
+        self.definitions = ToolDefinitions([t.definition for t in self._tools.values()])
+        return tool
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def parse_arguments(self, name: str, arguments: Optional[str]) -> Dict[str, Any]:
+        """解析并校验模型给出的参数 JSON，失败时抛出 ToolArgumentError"""
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolArgumentError(f"未知的工具: {name}")
+        try:
+            data = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ToolArgumentError(f"参数不是合法的 JSON: {e}") from None
+        if not isinstance(data, dict):
+            raise ToolArgumentError("参数应为 JSON 对象")
+        return tool.validate(data)
+
+    def call(self, name: str, arguments: Optional[str]) -> Dict[str, Any]:
+        try:
+            parsed = self.parse_arguments(name, arguments)
+            return self._tools[name].call(parsed)
+        except Exception as e:
+            return {"success": False, "error": f"{type(e).__name__}: {str(e)}"}
+
+    async def call_async(self, name: str, arguments: Optional[str]) -> Dict[str, Any]:
+        try:
+            parsed = self.parse_arguments(name, arguments)
+            return await self._tools[name].call_async(parsed)
+        except Exception as e:
+            return {"success": False, "error": f"{type(e).__name__}: {str(e)}"}
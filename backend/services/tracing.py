@@ -0,0 +1,247 @@
+import time
+import uuid
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Tuple
+
+# 延迟直方图的桶边界（秒），覆盖从缓存命中到长回答的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 生成速度直方图的桶边界（tokens/秒）
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，按 Prometheus 文本格式导出
+
+    只支持本服务需要的三种类型：counter、gauge 和固定桶的 histogram。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None):
+        self._help[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges), ("histogram", self._histograms)):
+                for name in sorted(metrics):
+                    help_text = self._help.get(name, (kind, ""))[1]
+                    if help_text:
+                        lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(metrics[name].items()):
+                        if kind != "histogram":
+                            lines.append(f"{name}{_format_labels(key)} {value:g}")
+                            continue
+                        cumulative = 0
+                        for bound, count in zip(value.buckets, value.counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {value.count}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {value.sum:.6f}")
+                        lines.append(f"{name}_count{_format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表，/metrics 端点导出
+METRICS = MetricsRegistry()
+METRICS.describe("chat_requests_total", "counter", "聊天请求数")
+METRICS.describe("chat_request_seconds", "histogram", "聊天请求总耗时")
+METRICS.describe("chat_span_seconds", "histogram", "请求各阶段耗时（规划、工具调用、生成、搜索上游）")
+METRICS.describe("chat_time_to_first_token_seconds", "histogram", "从请求开始到第一个回复 token 的时间（不含推理）")
+METRICS.describe("chat_generation_tokens_per_second", "histogram", "回复生成速度", RATE_BUCKETS)
+METRICS.describe("chat_generated_tokens_total", "counter", "回复的流式片段数")
+METRICS.describe("chat_reasoning_tokens_total", "counter", "推理（<think> 块）的流式片段数")
+METRICS.describe("search_requests_total", "counter", "搜索请求数（按缓存命中 / 近似命中 / 上游 / 失败分类）")
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace() -> Optional["Trace"]:
+    return _current_trace.get()
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "attrs")
+
+    def __init__(self, name: str, start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    """一次请求的耗时记录
+
+    span 在结束时写入直方图；token 热路径上只需调用 first_token（一次比较），
+    token 计数由调用方在本地累加后通过 record_generation 一次性提交。
+    """
+
+    def __init__(self, request_id: Optional[str] = None, mode: str = "stream", registry: MetricsRegistry = METRICS):
+        self.request_id = request_id or new_request_id()
+        self.mode = mode
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+        self.tokens_per_second: Optional[float] = None
+        self.reasoning_tokens = 0
+        self.finished_at: Optional[float] = None
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        span = Span(name, time.perf_counter(), attrs)
+        try:
+            yield span
+        except BaseException:
+            span.attrs["error"] = True
+            raise
+        finally:
+            span.end = time.perf_counter()
+            self.spans.append(span)
+            self.registry.observe("chat_span_seconds", span.end - span.start, span=name)
+
+    @contextmanager
+    def activate(self):
+        """将 trace 设为当前上下文的 trace，供 TavilyService 等下游记录子阶段"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+            self.registry.observe("chat_time_to_first_token_seconds", self.ttft, mode=self.mode)
+
+    def record_generation(self, tokens: int, first_token_at: Optional[float], ended_at: float):
+        """提交一次生成的 token 数；速度按首个 token 到结束的时间计算"""
+        if not tokens:
+            return
+        self.tokens += tokens
+        self.registry.inc("chat_generated_tokens_total", tokens)
+        if first_token_at is not None and tokens > 1 and ended_at > first_token_at:
+            self.tokens_per_second = (tokens - 1) / (ended_at - first_token_at)
+            self.registry.observe("chat_generation_tokens_per_second", self.tokens_per_second)
+
+    def record_reasoning(self, tokens: int):
+        """提交一次生成中推理部分的片段数，推理不计入首 token 时间和生成速度"""
+        if not tokens:
+            return
+        self.reasoning_tokens += tokens
+        self.registry.inc("chat_reasoning_tokens_total", tokens)
+
+    def finish(self, status: str = "ok"):
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        self.registry.inc("chat_requests_total", mode=self.mode, status=status)
+        self.registry.observe("chat_request_seconds", self.finished_at - self.started, mode=self.mode)
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished_at or time.perf_counter()
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((end - self.started) * 1000, 1),
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "tokens": self.tokens,
+            "tokens_per_second": round(self.tokens_per_second, 1) if self.tokens_per_second else None,
+            "reasoning_tokens": self.reasoning_tokens,
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start - self.started) * 1000, 1),
+                    "duration_ms": round(span.duration * 1000, 1),
+                    **span.attrs
+                }
+                for span in self.spans
+            ]
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """在当前 trace 中记录一个阶段；没有 trace 时只记录直方图"""
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace.span(name, **attrs) as current:
+            yield current
+        return
+    start = time.perf_counter()
+    try:
+        yield None
+    finally:
+        METRICS.observe("chat_span_seconds", time.perf_counter() - start, span=name)
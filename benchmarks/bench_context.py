@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+上下文管理基准
+测试目标：对比启用 token 预算前后，提示词大小和首 token 延迟随对话长度的变化
+使用本地桩服务器（按提示词字符数模拟预填充耗时），不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_context.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+from backend.services.context_manager import ContextManager
+from backend.services.openai_service import OpenAIService
+
+TURN_COUNTS = [1, 5, 10, 20, 50]
+# 每个字符 20 微秒的预填充耗时（约 1 万字符 0.2 秒）
+PREFILL_DELAY_PER_CHAR = 0.00002
+
+
+def make_history(turns: int):
+    """构造带搜索结果的多轮历史"""
+    history = []
+    for i in range(turns):
+        call_id = f"call_{i}"
+        history.extend([
+            {"role": "user", "content": f"第 {i} 个问题：今天有什么新闻？"},
+            {"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id, "type": "function",
+                "function": {"name": "search", "arguments": json.dumps({"query": f"新闻 {i}"}, ensure_ascii=False)}
+            }]},
+            {"role": "tool", "tool_call_id": call_id, "content": json.dumps({
+                "success": True, "query": f"新闻 {i}", "results_count": 5,
+                "results": [{"title": f"标题 {j}", "url": f"https://example.com/{j}",
+                             "content": "新闻内容" * 75, "score": 0.9} for j in range(5)]
+            }, ensure_ascii=False)},
+            {"role": "assistant", "content": "这是关于今天新闻的总结。" * 15},
+        ])
+    return history
+
+
+async def measure(service: OpenAIService, history):
+    """返回 (提示词估算 token 数, 提示词字符数, 首 token 延迟秒数)"""
+    tools = [service.tavily_service.get_tool_definition()]
+    messages = service._prepare_messages("你好", history, tools)
+    prompt_tokens = service.context_manager.count_messages(messages)
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+
+    start = time.perf_counter()
+    ttft = None
+    async for event in service.chat_completion_stream("你好", history):
+        if event["type"] == "content" and ttft is None:
+            ttft = time.perf_counter() - start
+    return prompt_tokens, prompt_chars, ttft
+
+
+async def run():
+    budgeted = OpenAIService()
+    unbounded = OpenAIService()
+    unbounded.context_manager = ContextManager(token_budget=10 ** 9)
+    # 提前导入 SDK 并各发一次不计时的请求（建立连接），第一行的 TTFT 不包含这些一次性开销
+    for service in (budgeted, unbounded):
+        service.preload()
+        await measure(service, [])
+
+    print(f"token 预算: {budgeted.context_manager.token_budget}（两列都压缩历史搜索结果，只有右列截断旧回合）")
+    print(f"{'回合数':>6} | {'无预算 tokens':>12} {'字符':>8} {'TTFT(ms)':>9} | {'有预算 tokens':>12} {'字符':>8} {'TTFT(ms)':>9}")
+    print("-" * 82)
+    for turns in TURN_COUNTS:
+        history = make_history(turns)
+        raw = await measure(unbounded, history)
+        managed = await measure(budgeted, history)
+        print(
+            f"{turns:>6} | {raw[0]:>12} {raw[1]:>8} {raw[2] * 1000:>9.1f} | "
+            f"{managed[0]:>12} {managed[1]:>8} {managed[2] * 1000:>9.1f}"
+        )
+
+    # 多轮对话中逐条缓存 token 数的效果
+    history = make_history(50)
+    manager = ContextManager(token_budget=10 ** 9)
+    start = time.perf_counter()
+    manager.build("系统", history, "问题")
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    manager.build("系统", history, "问题")
+    warm = time.perf_counter() - start
+    print(f"\n50 回合构建耗时：首次 {cold * 1000:.2f} ms，缓存后 {warm * 1000:.2f} ms")
+
+
+def main():
+    llm_app = create_llm_app(token_delay=0.0, prefill_delay_per_char=PREFILL_DELAY_PER_CHAR)
+    with StubServer(llm_app) as llm_server, StubServer(create_search_app()) as search_server:
+        os.environ["OLLAMA_BASE_URL"] = f"{llm_server.url}/v1"
+        os.environ["TAVILY_BASE_URL"] = search_server.url
+        os.environ.setdefault("TAVILY_API_KEY", "tvly-stub")
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+上游连接复用基准
+测试目标：对比普通 AsyncClient（OpenAI SDK 读到 [DONE] 后断开连接）与共享连接池（读完结束块、连接放回连接池）
+在不同并发下每个流式请求新建的连接数和请求耗时
+使用本地桩服务器，不需要 Ollama；本机回环上建连很便宜，到远程或 TLS 上游时差距更大
+桩服务器是单进程 Python，并发到 32 左右时 CPU 已经饱和，此时的耗时反映的是桩服务器的调度而不是客户端
+
+运行：python benchmarks/bench_http_pool.py [--requests 200] [--concurrency 1 8]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from openai import AsyncOpenAI
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app
+from backend.services.http_pool import HTTPClients
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def make_clients(pooled: bool) -> HTTPClients:
+    clients = HTTPClients()
+    if not pooled:
+        # 改动之前的配置：普通 AsyncClient，只挂上计数用的钩子
+        clients._async["llm"] = httpx.AsyncClient(
+            limits=clients.config.limits(),
+            event_hooks={"request": [clients._async_request_hook("llm")]}
+        )
+    return clients
+
+
+async def run_case(url: str, pooled: bool, requests: int, concurrency: int):
+    clients = make_clients(pooled)
+    client = AsyncOpenAI(base_url=url, api_key="ollama", http_client=clients.async_client("llm"))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            stream = await client.chat.completions.create(
+                model="qwen3:1.7b", messages=[{"role": "user", "content": "你好"}], stream=True
+            )
+            async with stream:
+                async for _ in stream:
+                    pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stats = clients.stats()["upstreams"]["llm"]
+    await clients.aclose()
+    return {
+        "connections_per_request": stats["connections_opened"] / requests,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput": requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游连接复用基准")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    with StubServer(create_llm_app(token_delay=0.0)) as llm:
+        url = f"{llm.url}/v1"
+        print(f"每组 {args.requests} 个流式请求")
+        print(f"{'并发':>4} | {'客户端':>8} | {'新建连接/请求':>13} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'吞吐(req/s)':>11}")
+        print("-" * 72)
+        for concurrency in args.concurrency:
+            for pooled in (False, True):
+                result = asyncio.run(run_case(url, pooled, args.requests, concurrency))
+                print(
+                    f"{concurrency:>4} | {'共享连接池' if pooled else '普通客户端':>8} | "
+                    f"{result['connections_per_request']:>13.2f} | {result['p50_ms']:>8.2f} | "
+                    f"{result['p99_ms']:>8.2f} | {result['throughput']:>11.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+内存基准
+测试目标：
+1. 默认配置与 MEMORY_PROFILE=low 下，以固定并发发送多轮流式请求后的峰值 RSS（VmHWM）和 tracemalloc 峰值
+2. 每个流式增量使用 dict 与 Delta 时的对象大小
+服务运行在独立的 uvicorn 进程中，上游使用本地桩服务器，不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_memory.py [--tokens 1000] [--concurrency 8] [--requests 32]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+from backend.services.sse import Delta
+
+PROFILES = [
+    ("默认", {}),
+    ("MEMORY_PROFILE=low", {"MEMORY_PROFILE": "low"}),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def drive(url: str, concurrency: int, requests: int):
+    """并发发送流式请求，每个对话进行多轮；返回收到的增量事件数"""
+    semaphore = asyncio.Semaphore(concurrency)
+    received = 0
+
+    async def one(client, i):
+        nonlocal received
+        body = {"message": "请搜索北京天气" if i % 2 else "你好", "conversation_id": f"bench-{i % concurrency}"}
+        async with semaphore:
+            while True:
+                async with client.stream("POST", f"{url}/api/chat/stream", json=body) as response:
+                    # 低内存配置的排队上限较小，被拒绝时稍后重试
+                    if response.status_code == 429:
+                        await asyncio.sleep(0.05)
+                        continue
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:") and '"content"' in line:
+                            received += 1
+                    return
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+    return received
+
+
+def measure(env, concurrency: int, requests: int):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=project_root, env=env
+    )
+    try:
+        with httpx.Client(timeout=30) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if client.get(f"{url}/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("服务在 60 秒内没有变为健康")
+                time.sleep(0.05)
+            # 先完成一个请求，让 SDK 导入和客户端创建不计入请求期间的分配
+            client.post(f"{url}/api/chat/stream", json={"message": "你好"}).raise_for_status()
+            idle = client.get(f"{url}/api/memory").json()
+            start = time.perf_counter()
+            received = asyncio.run(drive(url, concurrency, requests))
+            elapsed = time.perf_counter() - start
+            report = client.get(f"{url}/api/memory", params={"limit": 5}).json()
+        return idle, report, received, elapsed
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存基准")
+    parser.add_argument("--tokens", type=int, default=1000, help="每个回答的 token 数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    args = parser.parse_args()
+
+    event = {"type": "content", "content": "字"}
+    print(f"每个增量事件：dict {sys.getsizeof(event)} 字节，Delta {sys.getsizeof(Delta('content', '字'))} 字节")
+    print()
+
+    tokens = [f"字{i % 10}" for i in range(args.tokens)]
+    with StubServer(create_llm_app(tokens=tokens, token_delay=0.0)) as llm, \
+            StubServer(create_search_app(latency=0.0)) as search:
+        base_env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": f"{llm.url}/v1",
+            "TAVILY_BASE_URL": search.url,
+            "TAVILY_API_KEY": "tvly-stub",
+            "MEMORY_TRACE": "1",
+            "PYTHONPATH": str(project_root),
+        }
+        print(f"每个回答 {args.tokens} 个 token，并发 {args.concurrency}，共 {args.requests} 个流式请求（开启 tracemalloc）")
+        print(f"{'配置':>20} | {'空闲 RSS(MB)':>12} | {'峰值 RSS(MB)':>12} | {'traced 峰值(MB)':>15} | {'每 token(B)':>11} | {'耗时(s)':>7}")
+        print("-" * 96)
+        tops = []
+        for name, overrides in PROFILES:
+            idle, report, received, elapsed = measure({**base_env, **overrides}, args.concurrency, args.requests)
+            traced = report["tracemalloc"]
+            per_token = (traced["peak_bytes"] - idle["tracemalloc"]["current_bytes"]) / max(received, 1)
+            print(
+                f"{name:>20} | {idle['rss_bytes'] / 2 ** 20:>12.1f} | {report['peak_rss_bytes'] / 2 ** 20:>12.1f} | "
+                f"{traced['peak_bytes'] / 2 ** 20:>15.1f} | {per_token:>11.0f} | {elapsed:>7.2f}"
+            )
+            tops.append((name, traced["top"]))
+
+        for name, top in tops:
+            print()
+            print(f"{name}：结束时占用最多的代码行")
+            for entry in top:
+                print(f"  {entry['size_bytes'] / 1024:>9.1f} KB  {entry['location']}")
+
+
+if __name__ == "__main__":
+    main()
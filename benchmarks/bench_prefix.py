@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+提示词前缀复用基准
+测试目标：在多轮对话中测量上游可复用的提示词前缀比例（模拟 Ollama KV cache），
+对比逐回合截断（truncate_step=1）与按步长对齐截断的差异
+使用本地桩服务器，不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_prefix.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, StubStats, create_llm_app, create_search_app
+from backend.services.context_manager import ContextManager
+from backend.services.openai_service import OpenAIService
+
+TURNS = 30
+TOKEN_BUDGET = 1200
+# 每个未命中 KV cache 的字符 20 微秒的预填充耗时
+PREFILL_DELAY_PER_CHAR = 0.00002
+
+
+async def run_conversation(service: OpenAIService):
+    """运行一段多轮对话，每三轮触发一次搜索，返回平均首 token 延迟"""
+    history = []
+    ttfts = []
+    for i in range(TURNS):
+        message = f"请搜索第 {i} 条新闻" if i % 3 == 0 else f"第 {i} 个问题，请详细说明"
+        turn = []
+        start = time.perf_counter()
+        ttft = None
+        async for event in service.chat_completion_stream(message, history, turn):
+            if event["type"] == "content" and ttft is None:
+                ttft = time.perf_counter() - start
+        ttfts.append(ttft or 0.0)
+        history.extend(turn)
+    return sum(ttfts) / len(ttfts)
+
+
+def run_case(llm_server: StubServer, truncate_step: int):
+    llm_server.app.state.stats = StubStats()
+    service = OpenAIService()
+    service.context_manager = ContextManager(token_budget=TOKEN_BUDGET, truncate_step=truncate_step)
+    # 提前导入 SDK，第一组的平均 TTFT 不包含导入耗时
+    service.preload()
+    avg_ttft = asyncio.run(run_conversation(service))
+    tracker = service.prefix_tracker.stats()
+    return llm_server.stats.prefix_reuse_rate, tracker["message_reuse_rate"], avg_ttft
+
+
+def main():
+    tokens = ["这是", "一段", "比较", "长的", "回答", "，", "用来", "填充", "历史", "。"] * 5
+    llm_app = create_llm_app(tokens=tokens, token_delay=0.0, prefill_delay_per_char=PREFILL_DELAY_PER_CHAR)
+    with StubServer(llm_app) as llm_server, StubServer(create_search_app()) as search_server:
+        os.environ["OLLAMA_BASE_URL"] = f"{llm_server.url}/v1"
+        os.environ["TAVILY_BASE_URL"] = search_server.url
+        os.environ.setdefault("TAVILY_API_KEY", "tvly-stub")
+
+        print(f"{TURNS} 轮对话，token 预算 {TOKEN_BUDGET}")
+        print(f"{'truncate_step':>13} | {'上游前缀复用率':>14} | {'诊断消息复用率':>14} | {'平均 TTFT(ms)':>13}")
+        print("-" * 68)
+        for step in (1, 2, 4, 8):
+            upstream, tracked, ttft = run_case(llm_server, step)
+            print(f"{step:>13} | {upstream:>14.1%} | {tracked:>14.1%} | {ttft * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
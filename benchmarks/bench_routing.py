@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+按阶段选择模型的基准
+测试目标：比较只用大模型、小模型规划 + 大模型回答（handoff / keep）时，
+直接回答和需要搜索的问题的首个回答 token 时间（TTFT）与总耗时
+桩服务器按模型名放大预填充和 token 间隔，模拟推理较慢的大模型，不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_routing.py [--slowdown 4] [--think-tokens 100] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+
+CONFIGS = [
+    ("只用大模型", {"PLANNER_MODEL": "big", "ANSWER_MODEL": "big"}),
+    ("小模型规划 handoff", {"PLANNER_MODEL": "small", "ANSWER_MODEL": "big", "PLANNER_DIRECT_ANSWER": "handoff"}),
+    ("小模型规划 keep", {"PLANNER_MODEL": "small", "ANSWER_MODEL": "big", "PLANNER_DIRECT_ANSWER": "keep"}),
+]
+
+
+async def run_once(service, message: str):
+    start = time.perf_counter()
+    ttft = None
+    async for event in service.chat_completion_stream(message):
+        if event["type"] == "content" and ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按阶段选择模型的基准")
+    parser.add_argument("--slowdown", type=float, default=4.0, help="大模型相对小模型的耗时倍数")
+    parser.add_argument("--think-tokens", type=int, default=100, help="每次调用的推理 token 数")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="小模型每个 token 的生成间隔（秒）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    think = [f"想{i}" for i in range(args.think_tokens)]
+    llm_app = create_llm_app(
+        token_delay=args.token_delay, first_token_delay=0.05, think_tokens=think,
+        model_slowdown={"big": args.slowdown}
+    )
+    with StubServer(llm_app) as llm, StubServer(create_search_app(latency=0.05)) as search:
+        os.environ["OLLAMA_BASE_URL"] = f"{llm.url}/v1"
+        os.environ["TAVILY_BASE_URL"] = search.url
+        os.environ["TAVILY_API_KEY"] = "tvly-stub"
+        os.environ["SEARCH_CACHE_BACKEND"] = "none"
+        os.environ["MODEL_WARMUP"] = "0"
+        from backend.services.openai_service import OpenAIService
+
+        print(f"大模型耗时 ×{args.slowdown:g}，每次调用推理 {args.think_tokens} 个 token，每组 {args.repeat} 次取中位数")
+        print(f"{'问题':>6} | {'配置':>16} | {'TTFT(ms)':>9} | {'总耗时(ms)':>10}")
+        print("-" * 52)
+        for label, message in (("直接回答", "你好"), ("搜索", "请搜索北京天气")):
+            for name, env in CONFIGS:
+                os.environ.update(env)
+                service = OpenAIService()
+                service.preload()
+                runs = [asyncio.run(run_once(service, message)) for _ in range(args.repeat)]
+                ttft = statistics.median(run[0] for run in runs) * 1000
+                total = statistics.median(run[1] for run in runs) * 1000
+                print(f"{label:>6} | {name:>16} | {ttft:>9.1f} | {total:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
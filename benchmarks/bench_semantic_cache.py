@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+近似查询缓存查找基准
+测试目标：测量 SemanticCache 在 1 万 / 10 万条目下 top-1 查找的延迟和矩阵内存占用
+向量随机生成，不需要嵌入服务
+
+运行：python benchmarks/bench_semantic_cache.py [--dim 1024] [--sizes 10000 100000] [--lookups 200]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.semantic_cache import SemanticCache
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_case(size: int, dim: int, lookups: int, rng: np.random.Generator):
+    cache = SemanticCache(max_entries=size, threshold=0.92)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+
+    start = time.perf_counter()
+    # 直接批量写入矩阵，逐条 add 会让每次写入都做一次去重查找
+    cache.add(vectors[0], {"i": 0})
+    cache.vectors[:] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    cache.expires_at[:] = time.time() + 3600
+    cache.values = [{"i": i} for i in range(size)]
+    cache.size = size
+    fill_seconds = time.perf_counter() - start
+
+    # 一半查询是已有条目加噪声（应命中），一半是随机向量（应未命中）
+    latencies = []
+    hits = 0
+    for i in range(lookups):
+        if i % 2 == 0:
+            query = vectors[rng.integers(size)] + rng.standard_normal(dim, dtype=np.float32) * 0.1
+        else:
+            query = rng.standard_normal(dim, dtype=np.float32)
+        start = time.perf_counter()
+        value = cache.lookup(query)
+        latencies.append(time.perf_counter() - start)
+        hits += value is not None
+
+    return {
+        "fill_ms": fill_seconds * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "hit_rate": hits / lookups,
+        "matrix_mb": cache.stats()["matrix_bytes"] / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似查询缓存查找基准")
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度（bge-m3 为 1024）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"维度 {args.dim}，每组 {args.lookups} 次查找（一半应命中）")
+    print(f"{'条目数':>8} | {'矩阵(MB)':>9} | {'写入(ms)':>9} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'命中率':>6}")
+    print("-" * 66)
+    for size in args.sizes:
+        result = run_case(size, args.dim, args.lookups, rng)
+        print(
+            f"{size:>8} | {result['matrix_mb']:>9.1f} | {result['fill_ms']:>9.1f} | "
+            f"{result['p50_ms']:>8.2f} | {result['p99_ms']:>8.2f} | {result['hit_rate']:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+冷启动基准
+测试目标：
+1. 导入耗时报告：python -X importtime 导入 backend.main，按累计耗时列出最慢的模块
+2. 从启动 uvicorn 进程到 /health 第一次返回 200 的时间，以及到第一个 /api/chat 成功返回的时间
+上游使用本地桩服务器，不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+
+
+def import_profile(env, top: int):
+    """返回 [(累计微秒, 自身微秒, 模块名)]，按累计耗时降序"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        cwd=project_root, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), int(own), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_startup(env):
+    """返回 (首次健康响应秒数, 首个聊天响应秒数)，都从启动进程开始计时"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=project_root, env=env
+    )
+    try:
+        healthy = None
+        with httpx.Client(timeout=30) as client:
+            while time.perf_counter() - start < 60:
+                try:
+                    if client.get(f"{url}/health").status_code == 200:
+                        healthy = time.perf_counter() - start
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+            if healthy is None:
+                raise RuntimeError("服务在 60 秒内没有变为健康")
+            response = client.post(f"{url}/api/chat", json={"message": "你好"})
+            response.raise_for_status()
+            first_chat = time.perf_counter() - start
+        return healthy, first_chat
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="导入耗时报告列出的模块数")
+    args = parser.parse_args()
+
+    with StubServer(create_llm_app(token_delay=0.0)) as llm, StubServer(create_search_app()) as search:
+        env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": f"{llm.url}/v1",
+            "TAVILY_BASE_URL": search.url,
+            "TAVILY_API_KEY": "tvly-stub",
+            "PYTHONPATH": str(project_root),
+        }
+
+        # 第一次导入会编译字节码，先导入一次再测量
+        import_profile(env, 1)
+        rows = import_profile(env, args.top)
+        print(f"导入 backend.main 最慢的 {len(rows)} 个模块（累计耗时）")
+        print(f"{'累计(ms)':>9} | {'自身(ms)':>9} | 模块")
+        print("-" * 60)
+        for cumulative, own, name in rows:
+            print(f"{cumulative / 1000:>9.1f} | {own / 1000:>9.1f} | {name}")
+
+        results = [measure_startup(env) for _ in range(args.repeat)]
+        healthy = [r[0] * 1000 for r in results]
+        first_chat = [r[1] * 1000 for r in results]
+        print()
+        print(f"启动 uvicorn 到首次响应（{args.repeat} 次，中位数 / 最大值）")
+        print(f"  /health 返回 200: {statistics.median(healthy):.0f} / {max(healthy):.0f} ms")
+        print(f"  第一个 /api/chat: {statistics.median(first_chat):.0f} / {max(first_chat):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
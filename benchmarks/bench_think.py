@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+推理过滤与快速模式基准
+测试目标：测量不同模式下首个回答 token 的时间（TTFT）和发送给客户端的字节数
+- 发送推理：推理作为 reasoning 事件发送（改动之前推理作为 content 发送，字节数相同）
+- 丢弃推理：默认行为，推理只在服务端解析
+- fast=planning / final / all：在对应的调用上追加 /no_think
+使用本地桩服务器模拟 qwen3 的推理输出，不需要 Ollama / Tavily
+
+运行：python benchmarks/bench_think.py [--think-tokens 200] [--token-delay 0.005] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+from backend.services.sse import encode_event
+
+MODES = [
+    ("发送推理", {"include_reasoning": True}),
+    ("丢弃推理", {}),
+    ("fast=planning", {"fast": "planning"}),
+    ("fast=final", {"fast": "final"}),
+    ("fast=all", {"fast": "all"}),
+]
+
+
+async def run_once(service, message: str, options):
+    start = time.perf_counter()
+    ttft = None
+    sent = 0
+    async for event in service.chat_completion_stream(message, None, [], **options):
+        sent += len(encode_event(event))
+        if event["type"] == "content" and ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft, time.perf_counter() - start, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理过滤与快速模式基准")
+    parser.add_argument("--think-tokens", type=int, default=200, help="每次调用的推理 token 数")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="每个 token 的生成间隔（秒）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    think = [f"想{i}" for i in range(args.think_tokens)]
+    with StubServer(create_llm_app(token_delay=args.token_delay, think_tokens=think)) as llm, \
+            StubServer(create_search_app(latency=0.05)) as search:
+        os.environ["OLLAMA_BASE_URL"] = f"{llm.url}/v1"
+        os.environ["TAVILY_BASE_URL"] = search.url
+        os.environ["TAVILY_API_KEY"] = "tvly-stub"
+        os.environ["SEARCH_CACHE_BACKEND"] = "none"
+        from backend.services.openai_service import OpenAIService
+        service = OpenAIService()
+        service.preload()
+
+        print(f"每次调用推理 {args.think_tokens} 个 token，token 间隔 {args.token_delay * 1000:g}ms，每组 {args.repeat} 次取中位数")
+        print(f"{'问题':>6} | {'模式':>14} | {'TTFT(ms)':>9} | {'总耗时(ms)':>10} | {'发送(KB)':>9}")
+        print("-" * 62)
+        for label, message in (("直接回答", "你好"), ("搜索", "请搜索北京天气")):
+            for name, options in MODES:
+                runs = [asyncio.run(run_once(service, message, options)) for _ in range(args.repeat)]
+                ttft = statistics.median(run[0] for run in runs) * 1000
+                total = statistics.median(run[1] for run in runs) * 1000
+                sent = statistics.median(run[2] for run in runs) / 1024
+                print(f"{label:>6} | {name:>14} | {ttft:>9.1f} | {total:>10.1f} | {sent:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+模型预热与保活基准
+测试目标：测量空闲之后第一个请求的首 token 时间（TTFT）
+- 冷启动：模型未加载，第一个请求等待模型加载
+- 启动预热：ModelKeeper.warm_up 之后的第一个请求
+- 空闲之后：空闲超过 keep_alive，关闭 / 开启后台保活时的第一个请求
+默认使用模拟模型加载耗时的本地桩服务器；--ollama 指向真实的 Ollama（如 http://localhost:11434/v1）时，
+空闲时间需要超过其 keep_alive（--keep-alive 对桩服务器和请求同时生效）
+
+运行：python benchmarks/bench_warmup.py [--load-delay 1.5] [--keep-alive 2] [--ollama URL]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+from backend.services.model_keeper import native_url
+
+
+async def first_token_seconds(service) -> float:
+    start = time.perf_counter()
+    async for event in service.chat_completion_stream("你好"):
+        if event["type"] == "content":
+            return time.perf_counter() - start
+    raise RuntimeError("没有收到回答")
+
+
+async def unload(keeper):
+    """通过 keep_alive=0 让 Ollama 立即卸载模型（桩服务器上同样生效）"""
+    for backend in keeper.pool.backends:
+        for model in keeper.models:
+            await keeper.client.post(
+                f"{native_url(backend.url)}/api/chat",
+                json={"model": model, "messages": [], "keep_alive": 0}
+            )
+
+
+async def run(args):
+    from backend.services.openai_service import OpenAIService
+    service = OpenAIService()
+    service.preload()
+    keeper = service.model_keeper
+    keeper.interval = args.keep_alive / 4
+    keeper.margin = 2 * keeper.interval
+    results = []
+
+    await unload(keeper)
+    results.append(("冷启动", await first_token_seconds(service)))
+
+    await unload(keeper)
+    await keeper.warm_up()
+    results.append(("启动预热", await first_token_seconds(service)))
+
+    # 空闲超过 keep_alive
+    await asyncio.sleep(args.keep_alive * 1.5)
+    results.append(("空闲之后（无保活）", await first_token_seconds(service)))
+
+    keeper.start()
+    await asyncio.sleep(args.keep_alive * 1.5)
+    results.append(("空闲之后（后台保活）", await first_token_seconds(service)))
+    await keeper.stop()
+    return results, keeper.warmups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型预热与保活基准")
+    parser.add_argument("--load-delay", type=float, default=1.5, help="桩服务器模拟的模型加载时间（秒）")
+    parser.add_argument("--keep-alive", type=float, default=2.0, help="模型在最后一个请求之后保留的秒数")
+    parser.add_argument("--ollama", help="真实 Ollama 的 OpenAI 兼容地址，不指定时使用桩服务器")
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.ollama:
+            os.environ["OLLAMA_BASE_URL"] = args.ollama
+        else:
+            llm = stack.enter_context(StubServer(create_llm_app(
+                token_delay=0.005, load_delay=args.load_delay, keep_alive=args.keep_alive
+            )))
+            search = stack.enter_context(StubServer(create_search_app()))
+            os.environ["OLLAMA_BASE_URL"] = f"{llm.url}/v1"
+            os.environ["TAVILY_BASE_URL"] = search.url
+            os.environ.setdefault("TAVILY_API_KEY", "tvly-stub")
+        os.environ["MODEL_KEEP_ALIVE"] = f"{args.keep_alive:g}"
+        results, warmups = asyncio.run(run(args))
+
+    print(f"keep_alive {args.keep_alive:g}s" + ("" if args.ollama else f"，模拟加载时间 {args.load_delay:g}s"))
+    print(f"{'场景':>12} | {'TTFT(ms)':>9}")
+    print("-" * 28)
+    for name, seconds in results:
+        print(f"{name:>12} | {seconds * 1000:>9.0f}")
+    print(f"预热请求数：{warmups}")
+
+
+if __name__ == "__main__":
+    main()
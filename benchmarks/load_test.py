@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+接口压测基准
+测试目标：在本地桩 LLM / 搜索服务器上，以受控并发驱动 /api/chat 和 /api/chat/stream，
+统计吞吐、首事件延迟、token 间隔分位数和内存，结果保存为 JSON 以便在提交之间对比
+使用本地桩服务器，不需要 Ollama / Tavily
+
+运行：
+    python benchmarks/load_test.py --concurrency 1,4,16 --requests 32
+    python benchmarks/load_test.py --compare benchmarks/results/<上次的结果>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from tests.stub_servers import StubServer, create_llm_app, create_search_app
+
+RESULTS_DIR = project_root / "benchmarks" / "results"
+# 对比时展示的指标：(名称, 越小越好)
+COMPARE_METRICS = [
+    ("throughput_rps", False),
+    ("tokens_per_sec", False),
+    ("latency_p50_ms", True),
+    ("latency_p95_ms", True),
+    ("first_event_p50_ms", True),
+    ("first_token_p95_ms", True),
+    ("inter_token_p95_ms", True),
+    ("peak_rss_mb", True),
+]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """线性插值分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（压测客户端与服务端在同一进程中）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_message(level: str, index: int, search_ratio: float) -> str:
+    """生成互不相同的消息，按比例混入会触发搜索的消息"""
+    if int((index + 1) * search_ratio) > int(index * search_ratio):
+        return f"[{level}] 请搜索第 {index} 条新闻"
+    return f"[{level}] 第 {index} 个问题"
+
+
+async def stream_request(client: httpx.AsyncClient, message: str, coalesce_ms: Optional[float] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"status": None, "first_event": None, "first_token": None, "inter_token": [], "tokens": 0}
+    body: Dict[str, Any] = {"message": message}
+    if coalesce_ms is not None:
+        body["coalesce_ms"] = coalesce_ms
+    async with client.stream("POST", "/api/chat/stream", json=body) as response:
+        result["status"] = response.status_code
+        if response.status_code != 200:
+            await response.aread()
+            result["total"] = time.perf_counter() - start
+            return result
+        last_token = None
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            now = time.perf_counter()
+            if result["first_event"] is None:
+                result["first_event"] = now - start
+            event = json.loads(line[6:])
+            if event["type"] == "content":
+                # 合并发送时一帧可能包含多个 token，这里统计的是内容帧数
+                result["tokens"] += 1
+                if last_token is None:
+                    result["first_token"] = now - start
+                else:
+                    result["inter_token"].append(now - last_token)
+                last_token = now
+            elif event["type"] == "error":
+                result["status"] = "stream_error"
+    result["total"] = time.perf_counter() - start
+    return result
+
+
+async def chat_request(client: httpx.AsyncClient, message: str, coalesce_ms: Optional[float] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = await client.post("/api/chat", json={"message": message})
+    return {"status": response.status_code, "total": time.perf_counter() - start, "tokens": 0}
+
+
+async def run_level(
+    base_url: str, mode: str, concurrency: int, requests: int, search_ratio: float,
+    coalesce_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    """以固定并发发送 requests 个请求并汇总指标"""
+    request_fn = stream_request if mode == "stream" else chat_request
+    level = f"{mode}-{concurrency}-{time.time_ns()}"
+    next_index = 0
+    results: List[Dict[str, Any]] = []
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            results.append(await request_fn(client, make_message(level, index, search_ratio), coalesce_ms))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    ok = [r for r in results if r["status"] == 200]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    latencies = [r["total"] for r in ok]
+    first_events = [r["first_event"] for r in ok if r.get("first_event") is not None]
+    first_tokens = [r["first_token"] for r in ok if r.get("first_token") is not None]
+    inter_tokens = [gap for r in ok for gap in r.get("inter_token", [])]
+    tokens = sum(r["tokens"] for r in ok)
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(ok),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else None,
+        "tokens_per_sec": round(tokens / duration, 1) if mode == "stream" and duration else None,
+        "latency_p50_ms": _ms(percentile(latencies, 50)),
+        "latency_p95_ms": _ms(percentile(latencies, 95)),
+        "latency_p99_ms": _ms(percentile(latencies, 99)),
+        "first_event_p50_ms": _ms(percentile(first_events, 50)),
+        "first_event_p95_ms": _ms(percentile(first_events, 95)),
+        "first_token_p50_ms": _ms(percentile(first_tokens, 50)),
+        "first_token_p95_ms": _ms(percentile(first_tokens, 95)),
+        "inter_token_p50_ms": _ms(percentile(inter_tokens, 50)),
+        "inter_token_p95_ms": _ms(percentile(inter_tokens, 95)),
+        "inter_token_p99_ms": _ms(percentile(inter_tokens, 99)),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def start_api():
+    """按当前环境变量（桩服务器地址、准入限制等）创建服务并返回 FastAPI 应用"""
+    import backend.main as main
+    from backend.services.admission import create_admission_controller
+    from backend.services.openai_service import OpenAIService
+
+    main.openai_service = OpenAIService()
+    main.admission = create_admission_controller(len(main.openai_service.backend_pool.backends))
+    return main.app
+
+
+def run_benchmark(config: Dict[str, Any]) -> Dict[str, Any]:
+    """启动桩服务器和 API，逐个并发级别压测，返回完整结果"""
+    answer_tokens = [f"词{i}" for i in range(config["tokens"])]
+    llm_app = create_llm_app(
+        tokens=answer_tokens,
+        token_delay=config["token_delay"],
+        first_token_delay=config["first_token_delay"]
+    )
+    search_app = create_search_app(latency=config["search_latency"])
+    with StubServer(llm_app) as llm_server, StubServer(search_app) as search_server:
+        os.environ["OLLAMA_BASE_URL"] = f"{llm_server.url}/v1"
+        os.environ.pop("OLLAMA_BASE_URLS", None)
+        os.environ["TAVILY_BASE_URL"] = search_server.url
+        os.environ.setdefault("TAVILY_API_KEY", "tvly-stub")
+        os.environ["LLM_MAX_IN_FLIGHT_PER_BACKEND"] = str(config["max_in_flight"])
+        os.environ["ADMISSION_MAX_QUEUE"] = str(config["max_queue"])
+
+        with StubServer(start_api()) as api_server:
+            levels = []
+            for mode in config["modes"]:
+                for concurrency in config["concurrency"]:
+                    levels.append(asyncio.run(run_level(
+                        api_server.url, mode, concurrency, config["requests"], config["search_ratio"],
+                        config.get("coalesce_ms")
+                    )))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+        },
+        "results": levels,
+    }
+
+
+def print_results(report: Dict[str, Any]):
+    header = (
+        f"{'模式':>6} {'并发':>4} | {'成功':>4} {'错误':>6} | {'RPS':>7} {'tok/s':>7} | "
+        f"{'P50(ms)':>8} {'P95(ms)':>8} | {'首事件P50':>9} {'首tokenP95':>10} | {'间隔P95':>8} | {'RSS(MB)':>7}"
+    )
+    print(header)
+    print("-" * 118)
+    for r in report["results"]:
+        def fmt(value, width):
+            return f"{'-' if value is None else value:>{width}}"
+        print(
+            f"{r['mode']:>6} {r['concurrency']:>4} | {r['ok']:>4} {sum(r['errors'].values()):>6} | "
+            f"{fmt(r['throughput_rps'], 7)} {fmt(r['tokens_per_sec'], 7)} | "
+            f"{fmt(r['latency_p50_ms'], 8)} {fmt(r['latency_p95_ms'], 8)} | "
+            f"{fmt(r['first_event_p50_ms'], 9)} {fmt(r['first_token_p95_ms'], 10)} | "
+            f"{fmt(r['inter_token_p95_ms'], 8)} | {fmt(r['peak_rss_mb'], 7)}"
+        )
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """按 (模式, 并发) 对比两次结果，标出变差超过 10% 的指标"""
+    previous = {(r["mode"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\n与 {baseline['meta'].get('commit')}（{baseline['meta'].get('timestamp')}）对比：")
+    for r in current["results"]:
+        base = previous.get((r["mode"], r["concurrency"]))
+        if base is None:
+            continue
+        changes = []
+        for metric, lower_is_better in COMPARE_METRICS:
+            old, new = base.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            delta = (new - old) / old
+            worse = delta > 0.1 if lower_is_better else delta < -0.1
+            changes.append(f"{metric} {old}→{new} ({delta:+.0%}){' ⚠' if worse else ''}")
+        print(f"  {r['mode']} x{r['concurrency']}: " + "; ".join(changes))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="基于桩服务器的聊天接口压测")
+    parser.add_argument("--modes", default="stream,chat", help="逗号分隔：stream / chat")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=32, help="每个并发级别的请求数")
+    parser.add_argument("--tokens", type=int, default=32, help="桩 LLM 每次回答的 token 数")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="桩 LLM 每个 token 的间隔（秒）")
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="桩 LLM 首 token 前的延迟（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="桩搜索延迟（秒）")
+    parser.add_argument("--search-ratio", type=float, default=0.25, help="触发搜索的请求比例")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="每个后端的并发生成上限")
+    parser.add_argument("--max-queue", type=int, default=1024, help="准入队列上限")
+    parser.add_argument("--coalesce-ms", type=float, help="流式内容合并窗口（毫秒），默认使用服务端配置，0 表示逐 token 发送")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 benchmarks/results/<commit>-<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        "modes": [m.strip() for m in args.modes.split(",") if m.strip()],
+        "concurrency": [int(c) for c in args.concurrency.split(",")],
+        "requests": args.requests,
+        "tokens": args.tokens,
+        "token_delay": args.token_delay,
+        "first_token_delay": args.first_token_delay,
+        "search_latency": args.search_latency,
+        "search_ratio": args.search_ratio,
+        "max_in_flight": args.max_in_flight,
+        "max_queue": args.max_queue,
+        "coalesce_ms": args.coalesce_ms,
+    }
+    report = run_benchmark(config)
+    print_results(report)
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{report['meta']['commit'] or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n结果已保存到 {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_results(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
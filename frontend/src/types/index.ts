@@ -26,7 +26,9 @@ export enum SSEEventType {
   TOOL_CALL = 'tool_call',
   CONTENT = 'content',
   ERROR = 'error',
-  DONE = 'done'
+  DONE = 'done',
+  TIMING = 'timing',
+  REASONING = 'reasoning'
 }
 
 export interface SSEEvent {
@@ -34,18 +36,28 @@ export interface SSEEvent {
   content?: string;
   tool_name?: string;
   tool_args?: Record<string, any>;
+  tool_call_id?: string;
+  tool_status?: 'started' | 'completed' | 'failed';
+  queue_position?: number;
+  round?: number;
+  request_id?: string;
+  timing?: Record<string, any>;
 }
 
 // API 请求/响应类型
 export interface ChatRequest {
   message: string;
   conversation_id?: string;
+  coalesce_ms?: number;
+  fast?: 'planning' | 'final' | 'all';
+  include_reasoning?: boolean;
 }
 
 export interface ChatResponse {
   response: string;
   conversation_id: string;
   tool_calls_made?: string[];
+  reasoning?: string;
 }
 
 export interface ConversationHistory {
@@ -0,0 +1,35 @@
+"""
+离线测试的公共夹具：启动本地桩服务器并将服务指向它们
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+
+@pytest.fixture
+def llm_server():
+    with StubServer(create_llm_app(token_delay=0.02)) as server:
+        yield server
+
+
+@pytest.fixture
+def search_server():
+    with StubServer(create_search_app(latency=0.2)) as server:
+        yield server
+
+
+@pytest.fixture
+def stub_env(monkeypatch, llm_server, search_server):
+    """将 OpenAIService / TavilyService 指向桩服务器"""
+    monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm_server.url}/v1")
+    monkeypatch.setenv("TAVILY_BASE_URL", search_server.url)
+    monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+    return llm_server, search_server
@@ -0,0 +1,388 @@
+"""
+本地桩服务器
+用途：在不依赖 Ollama / Tavily 的情况下，为测试和基准提供可控的上游服务
+- LLM 桩：兼容 OpenAI /v1/chat/completions（流式与非流式、工具调用）和 /v1/embeddings，
+  以及 Ollama 原生的 /api/chat（非流式）和 /api/ps，模拟模型的加载与按 keep_alive 卸载
+- 搜索桩：兼容 Tavily /search
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class StubStats:
+    """桩服务器的运行统计，测试用来断言上游行为"""
+
+    def __init__(self):
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.bodies: List[Dict[str, Any]] = []
+        # 模拟 KV cache 的前缀复用统计
+        self.prompt_chars = 0
+        self.prefix_reused_chars = 0
+        # 模型加载次数和原生 /api/chat 的请求体
+        self.model_loads = 0
+        self.native_bodies: List[Dict[str, Any]] = []
+
+    def enter(self, body: Dict[str, Any]):
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.bodies.append(body)
+
+    def leave(self, completed: bool = True):
+        self.active -= 1
+        if completed:
+            self.completed += 1
+        else:
+            self.cancelled += 1
+
+    @property
+    def prefix_reuse_rate(self) -> float:
+        return self.prefix_reused_chars / self.prompt_chars if self.prompt_chars else 0.0
+
+
+def render_prompt(body: Dict[str, Any]) -> str:
+    """按类似聊天模板的方式渲染提示词：工具定义在前，随后是逐条消息"""
+    parts = [json.dumps(body.get("tools") or [], ensure_ascii=False)]
+    for message in body.get("messages") or []:
+        parts.append(f"<|{message.get('role')}|>{message.get('content') or ''}")
+        if message.get("tool_calls"):
+            parts.append(json.dumps(message["tool_calls"], ensure_ascii=False))
+    return "".join(parts)
+
+
+class KVCacheSlots:
+    """模拟 Ollama 的 KV cache 槽位：新请求选择前缀最长的槽位复用，否则替换最久未用的槽位"""
+
+    def __init__(self, slots: int = 1):
+        self.slots: List[str] = [""] * slots
+
+    def admit(self, prompt: str) -> int:
+        best_index, best_length = len(self.slots) - 1, 0
+        for index, cached in enumerate(self.slots):
+            length = len(os.path.commonprefix([cached, prompt]))
+            if length > best_length:
+                best_index, best_length = index, length
+        self.slots.pop(best_index)
+        self.slots.insert(0, prompt)
+        return best_length
+
+
+def keep_alive_seconds(value: Any, default: float) -> float:
+    """按 Ollama 的规则解析 keep_alive：数字为秒数，字符串为带单位的时长，负数表示一直保留"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        unit = next(u for u in ("ms", "s", "m", "h") if value.endswith(u))
+        seconds = float(value[:-len(unit)]) * units[unit]
+    return float("inf") if seconds < 0 else seconds
+
+
+def stub_embedding(text: str, dim: int = 256) -> List[float]:
+    """确定性的文本向量：字符和相邻字符对哈希到 dim 维，字面相近的文本余弦相似度高"""
+    vector = [0.0] * dim
+    chars = [c for c in text.lower() if c.isalnum()]
+    for gram in chars + [a + b for a, b in zip(chars, chars[1:])]:
+        vector[zlib.crc32(gram.encode("utf-8")) % dim] += 1.0
+    return vector
+
+
+def _completed_tool_rounds(messages: List[Dict[str, Any]]) -> int:
+    """最后一条用户消息之后已经进行的工具调用轮数"""
+    rounds = 0
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            rounds += 1
+    return rounds
+
+
+def _should_call_tool(body: Dict[str, Any], trigger: str, tool_rounds: int = 1) -> bool:
+    """带工具定义、本轮用户消息包含触发词，且工具调用轮数未达到 tool_rounds 时返回工具调用"""
+    if not body.get("tools") or body.get("tool_choice") == "none":
+        return False
+    messages = body.get("messages") or []
+    users = [m for m in messages if m.get("role") == "user"]
+    if not users or trigger not in (users[-1].get("content") or ""):
+        return False
+    return _completed_tool_rounds(messages) < tool_rounds
+
+
+def create_llm_app(
+    tokens: Optional[List[str]] = None,
+    token_delay: float = 0.01,
+    first_token_delay: float = 0.0,
+    tool_trigger: str = "搜索",
+    tool_calls_per_turn: int = 1,
+    prefill_delay_per_char: float = 0.0,
+    kv_slots: int = 1,
+    tool_rounds: int = 1,
+    think_tokens: Optional[List[str]] = None,
+    load_delay: float = 0.0,
+    keep_alive: float = 300.0,
+    model_slowdown: Optional[Dict[str, float]] = None,
+) -> FastAPI:
+    """创建兼容 OpenAI Chat Completions 的 LLM 桩
+
+    prefill_delay_per_char 按提示词字符数模拟预填充耗时，用于观察提示词长度对首 token 延迟的影响；
+    已在 KV cache 中的前缀不计入预填充。
+    tool_rounds 为一次回答中连续请求工具调用的轮数，用于测试多轮工具调用。
+    think_tokens 模拟 qwen3 的推理：在回答或工具调用之前输出 <think>...</think>（标签拆在多个增量中）；
+    本轮用户消息带 /no_think 时只输出空的 think 块。
+    load_delay 为模型未加载时请求额外等待的加载时间；请求结束后模型保留 keep_alive 秒
+    （请求体中的 keep_alive 优先），之后视为卸载。
+    model_slowdown 按模型名放大预填充和 token 间隔，模拟大小不同的模型。
+    """
+    app = FastAPI()
+    app.state.stats = StubStats()
+    kv_cache = KVCacheSlots(kv_slots)
+    answer_tokens = tokens or ["这是", "一个", "来自", "桩服务", "的", "回答", "。"]
+    # 模型 -> 卸载时间戳
+    loaded: Dict[str, float] = {}
+    app.state.loaded = loaded
+
+    def _load(body: Dict[str, Any]) -> float:
+        """返回本次请求的模型加载时间，并按 keep_alive 更新卸载时间"""
+        model = body.get("model", "stub")
+        cold = loaded.get(model, 0.0) <= time.time()
+        if cold:
+            app.state.stats.model_loads += 1
+        loaded[model] = time.time() + load_delay * cold + keep_alive_seconds(body.get("keep_alive"), keep_alive)
+        return load_delay if cold else 0.0
+
+    def _think_chunks(body: Dict[str, Any]) -> List[str]:
+        if not think_tokens:
+            return []
+        users = [m for m in body.get("messages") or [] if m.get("role") == "user"]
+        if users and (users[-1].get("content") or "").rstrip().endswith("/no_think"):
+            return ["<think>\n\n</think>\n\n"]
+        return ["<th", "ink>\n", *think_tokens, "\n</thi", "nk>\n\n"]
+
+    def _tool_calls(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        messages = body["messages"]
+        query = [m for m in messages if m.get("role") == "user"][-1]["content"]
+        completed = _completed_tool_rounds(messages)
+        if completed:
+            # 后续轮次细化查询，避免命中搜索缓存
+            query = f"{query}（第 {completed + 1} 轮）"
+        return [{
+            "id": f"call_{uuid.uuid4().hex[:8]}",
+            "type": "function",
+            "function": {
+                "name": "search",
+                "arguments": json.dumps(
+                    {"query": query if tool_calls_per_turn == 1 else f"{query} #{i}"},
+                    ensure_ascii=False,
+                ),
+            },
+        } for i in range(tool_calls_per_turn)]
+
+    def _chunk(model: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    @app.get("/v1/models")
+    async def models():
+        return JSONResponse({"object": "list", "data": [{"id": "qwen3:1.7b", "object": "model", "owned_by": "stub"}]})
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return JSONResponse({
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats: StubStats = app.state.stats
+        model = body.get("model", "stub")
+        call_tool = _should_call_tool(body, tool_trigger, tool_rounds)
+        prompt = render_prompt(body)
+        reused = kv_cache.admit(prompt)
+        stats.prompt_chars += len(prompt)
+        stats.prefix_reused_chars += reused
+        slowdown = (model_slowdown or {}).get(model, 1.0)
+        token_interval = token_delay * slowdown
+        prefill_delay = _load(body) + (first_token_delay + prefill_delay_per_char * (len(prompt) - reused)) * slowdown
+
+        if not body.get("stream"):
+            stats.enter(body)
+            think = _think_chunks(body)
+            try:
+                await asyncio.sleep(prefill_delay + token_interval * (len(think) + len(answer_tokens)))
+            finally:
+                stats.leave()
+            content = "".join(think) + ("" if call_tool else "".join(answer_tokens))
+            message: Dict[str, Any] = {"role": "assistant", "content": content}
+            if call_tool:
+                message["tool_calls"] = _tool_calls(body)
+            return JSONResponse({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if call_tool else "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(answer_tokens), "total_tokens": len(answer_tokens)},
+            })
+
+        async def generate():
+            stats.enter(body)
+            completed = False
+            try:
+                await asyncio.sleep(prefill_delay)
+                yield _chunk(model, {"role": "assistant", "content": ""})
+                for token in _think_chunks(body):
+                    await asyncio.sleep(token_interval)
+                    yield _chunk(model, {"content": token})
+                if call_tool:
+                    # 与 OpenAI 一致：参数分成多个增量发送
+                    for index, tool_call in enumerate(_tool_calls(body)):
+                        arguments = tool_call["function"]["arguments"]
+                        middle = len(arguments) // 2
+                        yield _chunk(model, {"tool_calls": [{
+                            "index": index, "id": tool_call["id"], "type": "function",
+                            "function": {"name": "search", "arguments": arguments[:middle]},
+                        }]})
+                        yield _chunk(model, {"tool_calls": [{
+                            "index": index, "function": {"arguments": arguments[middle:]},
+                        }]})
+                    yield _chunk(model, {}, "tool_calls")
+                else:
+                    for token in answer_tokens:
+                        await asyncio.sleep(token_interval)
+                        yield _chunk(model, {"content": token})
+                    yield _chunk(model, {}, "stop")
+                yield "data: [DONE]\n\n"
+                completed = True
+            finally:
+                stats.leave(completed)
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.post("/api/chat")
+    async def native_chat(request: Request):
+        body = await request.json()
+        app.state.stats.native_bodies.append(body)
+        await asyncio.sleep(_load(body) + token_delay)
+        return JSONResponse({
+            "model": body.get("model", "stub"),
+            "message": {"role": "assistant", "content": answer_tokens[0]},
+            "done": True,
+        })
+
+    @app.get("/api/ps")
+    async def running_models():
+        now = time.time()
+        models = []
+        for model, expires_at in loaded.items():
+            if expires_at <= now:
+                continue
+            expires = "2318-01-01T00:00:00Z" if expires_at == float("inf") else \
+                datetime.fromtimestamp(expires_at, timezone.utc).isoformat()
+            models.append({"name": model, "model": model, "expires_at": expires})
+        return JSONResponse({"models": models})
+
+    return app
+
+
+def create_search_app(latency: Union[float, Callable[[str], float]] = 0.0, results_count: int = 3) -> FastAPI:
+    """创建兼容 Tavily /search 的搜索桩，latency 可以是按查询计算延迟的函数"""
+    app = FastAPI()
+    app.state.stats = StubStats()
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        stats: StubStats = app.state.stats
+        query = body.get("query", "")
+        stats.enter(body)
+        try:
+            await asyncio.sleep(latency(query) if callable(latency) else latency)
+        finally:
+            stats.leave()
+        count = min(int(body.get("max_results") or results_count), results_count)
+        return JSONResponse({
+            "query": query,
+            "results": [
+                {
+                    "title": f"{query} - 结果 {i + 1}",
+                    "url": f"https://example.com/{i + 1}",
+                    "content": f"关于 {query} 的第 {i + 1} 条结果。",
+                    "score": round(1.0 - i * 0.1, 2),
+                }
+                for i in range(count)
+            ],
+        })
+
+    return app
+
+
+class StubServer:
+    """在后台线程中运行的 uvicorn 服务器，作为上下文管理器使用"""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    @property
+    def stats(self) -> StubStats:
+        return self.app.state.stats
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("桩服务器启动超时")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+        self._socket.close()
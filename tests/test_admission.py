@@ -0,0 +1,149 @@
+"""
+准入控制测试
+测试目标：验证并发上限、FIFO 排队、队列满时 429 / 排队超时 503 带 Retry-After，
+以及流式接口在排队时推送位置
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import Response
+
+import backend.main as main
+import backend.services.admission as admission_module
+from backend.models.schemas import ChatRequest
+from backend.services.admission import AdmissionController, AdmissionRejected
+from backend.services.backend_pool import BackendPool
+from backend.services.openai_service import OpenAIService
+from stub_servers import StubServer, create_llm_app
+
+
+@pytest.mark.asyncio
+async def test_fifo_admission_and_positions():
+    """超过并发上限的请求按到达顺序获得槽位，排队位置随之前移"""
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0)
+    running = controller.enter()
+    waiting = [controller.enter() for _ in range(3)]
+    assert running.admitted
+    assert [ticket.position for ticket in waiting] == [0, 1, 2]
+
+    positions = []
+
+    async def track():
+        async for position in waiting[2].positions():
+            positions.append(position)
+
+    tracker = asyncio.create_task(track())
+    await asyncio.sleep(0)
+    for ticket in [running] + waiting[:2]:
+        ticket.release()
+        await asyncio.sleep(0.01)
+    await asyncio.wait_for(tracker, 1)
+
+    assert positions == [2, 1, 0]
+    assert waiting[2].admitted and controller.in_flight == 1
+    waiting[2].release()
+    assert controller.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_full_and_timeout_rejections():
+    """队列满时立即 429，排队超时 503，都带 Retry-After"""
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    running = controller.enter()
+    queued = controller.enter()
+
+    with pytest.raises(AdmissionRejected) as full:
+        controller.enter()
+    assert full.value.status_code == 429
+    assert int(full.value.headers["Retry-After"]) >= 1
+
+    with pytest.raises(AdmissionRejected) as timeout:
+        await queued.wait()
+    assert timeout.value.status_code == 503
+    # 超时的请求离开队列，不占用槽位
+    assert controller.stats()["queued"] == 0
+    running.release()
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_follows_available_backends(monkeypatch):
+    """上限随可用节点变化：节点熔断时请求留在队列中，节点恢复后不必等待其他请求结束即可放行"""
+    monkeypatch.setattr(admission_module, "CAPACITY_POLL_INTERVAL", 0.02)
+    pool = BackendPool(
+        ["http://a/v1", "http://b/v1"], failure_threshold=1, recovery_timeout=0.2,
+        probe_interval=0, max_in_flight_per_backend=1
+    )
+    controller = AdmissionController(max_in_flight=2, max_queue=4, queue_timeout=0, capacity=pool.capacity)
+    pool.record_failure(pool.backends[1])
+
+    running = controller.enter()
+    queued = controller.enter()
+    assert running.admitted and not queued.admitted
+    assert controller.stats()["limit"] == 1
+
+    # 冷却结束后节点转为半开，容量恢复
+    await asyncio.wait_for(queued.wait(), 1)
+    assert controller.in_flight == 2
+    running.release()
+    queued.release()
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_queued_request_leaves_queue(stub_env, monkeypatch):
+    """排队中的非流式请求被取消（客户端断开）时让出队列位置，不会在之后占用槽位"""
+    monkeypatch.setattr(main, "openai_service", OpenAIService())
+    monkeypatch.setattr(main, "admission", AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=0))
+    running = main.admission.enter()
+
+    task = asyncio.create_task(main.chat(ChatRequest(message="你好"), Response(), None))
+    await asyncio.sleep(0.05)
+    assert main.admission.stats()["queued"] == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert main.admission.stats()["queued"] == 0
+    running.release()
+    assert main.admission.in_flight == 0
+
+
+async def _events(response):
+    async for line in response.aiter_lines():
+        if line.startswith("data: "):
+            yield json.loads(line[6:])
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_queues_and_rejects(stub_env, monkeypatch):
+    """流式接口：排队的客户端收到位置事件，队列满时返回 429"""
+    with StubServer(create_llm_app(token_delay=0.1)) as slow_llm, StubServer(main.app) as api:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{slow_llm.url}/v1")
+        monkeypatch.setattr(main, "openai_service", OpenAIService())
+        monkeypatch.setattr(main, "admission", AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=10))
+
+        async with httpx.AsyncClient(base_url=api.url, timeout=10) as client:
+            async with client.stream("POST", "/api/chat/stream", json={"message": "你好"}) as first:
+                first_events = _events(first)
+                await anext(first_events)
+                async with client.stream("POST", "/api/chat/stream", json={"message": "你好"}) as second:
+                    second_events = _events(second)
+                    queued = await anext(second_events)
+                    assert queued["type"] == "status"
+                    assert queued["queue_position"] == 0
+
+                    rejected = await client.post("/api/chat/stream", json={"message": "你好"})
+                    assert rejected.status_code == 429
+                    assert int(rejected.headers["Retry-After"]) >= 1
+
+                    first_rest = [event async for event in first_events]
+                    second_rest = [event async for event in second_events]
+
+    assert first_rest[-1]["type"] == "done"
+    assert second_rest[-1]["type"] == "done"
+    assert main.admission.stats()["in_flight"] == 0
+    assert main.admission.stats()["rejected"] == 1
@@ -0,0 +1,102 @@
+"""
+多轮工具调用测试
+测试目标：验证模型可以连续进行多轮工具调用，轮数上限、时间预算和 token 预算耗尽后
+不再提供工具、直接根据已有信息回答，超出时间预算的工具调用被取消
+"""
+
+import time
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+
+@pytest.fixture
+def agent_env(monkeypatch):
+    """每次回答连续请求 3 轮搜索的 LLM 桩"""
+    def start(search_latency: float = 0.05):
+        llm = StubServer(create_llm_app(token_delay=0.0, tool_rounds=3))
+        search = StubServer(create_search_app(latency=search_latency))
+        stack.extend([llm.__enter__(), search.__enter__()])
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm.url}/v1")
+        monkeypatch.setenv("TAVILY_BASE_URL", search.url)
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        return llm, search
+
+    stack = []
+    yield start
+    for server in reversed(stack):
+        server.__exit__(None, None, None)
+
+
+async def _stream(service: OpenAIService, message: str):
+    turn = []
+    events = [e async for e in service.chat_completion_stream(message, None, turn)]
+    return events, turn
+
+
+@pytest.mark.asyncio
+async def test_multiple_tool_rounds(agent_env):
+    """每轮的工具调用事件带轮次，最后一次请求不再允许调用工具"""
+    llm, search = agent_env()
+    service = OpenAIService(max_tool_rounds=3)
+
+    events, turn = await _stream(service, "请搜索北京天气")
+
+    assert events[-1]["type"] == "done"
+    rounds = [e["round"] for e in events if e["type"] == "tool_call" and e["tool_status"] == "completed"]
+    assert rounds == [1, 2, 3]
+    assert search.stats.requests == 3
+    assert [body["tool_choice"] for body in llm.stats.bodies] == ["auto", "auto", "auto", "none"]
+    assert [m["role"] for m in turn] == ["user"] + ["assistant", "tool"] * 3 + ["assistant"]
+    assert turn[-1]["content"] == "这是一个来自桩服务的回答。"
+
+    result = OpenAIService(max_tool_rounds=3).chat_completion("请搜索上海天气")
+    assert result["success"] and result["tool_calls_made"] == ["search"] * 3
+
+
+@pytest.mark.asyncio
+async def test_round_and_token_budgets(agent_env):
+    """达到轮数上限或 token 预算后直接回答"""
+    llm, search = agent_env()
+    service = OpenAIService(max_tool_rounds=1)
+    events, _ = await _stream(service, "请搜索北京天气")
+    assert events[-1]["type"] == "done"
+    assert [body["tool_choice"] for body in llm.stats.bodies] == ["auto", "none"]
+
+    llm.stats.bodies.clear()
+    service = OpenAIService(max_tool_rounds=3)
+    # 只够第一次请求：第一轮工具调用之后的提示词累计超出预算
+    messages = service._prepare_messages("请搜索上海天气", None, service.tools)
+    service.token_budget = (
+        service.context_manager.count_messages(messages) + service.context_manager.count_tools(service.tools)
+    )
+    events, _ = await _stream(service, "请搜索上海天气")
+    assert [body["tool_choice"] for body in llm.stats.bodies] == ["auto", "none"]
+    statuses = [e["content"] for e in events if e["type"] == "status"]
+    assert "token 预算已用完，正在根据已有信息生成回复..." in statuses
+
+
+@pytest.mark.asyncio
+async def test_time_budget_cancels_slow_tools(agent_env):
+    """工具调用超出时间预算时被取消，以失败结果交给模型生成回复"""
+    llm, search = agent_env(search_latency=2.0)
+    service = OpenAIService(max_tool_rounds=3)
+    service.time_budget = 0.3
+
+    start = time.perf_counter()
+    events, turn = await _stream(service, "请搜索北京天气")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1.5
+    assert events[-1]["type"] == "done"
+    statuses = [e["tool_status"] for e in events if e["type"] == "tool_call"]
+    assert statuses == ["started", "failed"]
+    assert "超出时间预算" in turn[2]["content"]
+    assert [body["tool_choice"] for body in llm.stats.bodies] == ["auto", "none"]
+
+    start = time.perf_counter()
+    result = service.chat_completion("请搜索上海天气")
+    assert time.perf_counter() - start < 1.5
+    assert result["success"] and "超出时间预算" in result["messages"][2]["content"]
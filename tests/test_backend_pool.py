@@ -0,0 +1,129 @@
+"""
+LLM 后端池测试
+测试目标：验证最少在途请求路由、熔断与恢复、健康检查和 /health 的节点状态
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.backend_pool import CLOSED, HALF_OPEN, OPEN, BackendPool, NoBackendAvailableError
+from backend.services.openai_service import OpenAIService
+from stub_servers import StubServer, create_llm_app
+
+
+def _closed_port_url() -> str:
+    """返回一个没有服务监听的地址"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def test_least_outstanding_routing():
+    """在途请求最少的节点优先"""
+    pool = BackendPool(["http://a/v1", "http://b/v1", "http://c/v1"], probe_interval=0)
+    first = pool.acquire()
+    second = pool.acquire()
+    third = pool.acquire()
+    assert len({first.url, second.url, third.url}) == 3
+    pool.release(second, 0.1)
+    assert pool.acquire() is second
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """连续失败后熔断；冷却后放行一个试探请求，成功则恢复"""
+    pool = BackendPool(["http://a/v1"], failure_threshold=2, recovery_timeout=0.05, probe_interval=0)
+    backend = pool.backends[0]
+    for _ in range(2):
+        pool.acquire()
+        pool.record_failure(backend)
+        pool.release(backend)
+    assert backend.state == OPEN
+    with pytest.raises(NoBackendAvailableError):
+        pool.acquire()
+
+    time.sleep(0.06)
+    assert pool.acquire() is backend
+    assert backend.state == HALF_OPEN
+    # 试探请求进行中，不放行其他请求
+    with pytest.raises(NoBackendAvailableError):
+        pool.acquire()
+    pool.release(backend, 0.05)
+    assert backend.state == CLOSED
+
+
+def test_per_backend_limit_and_capacity():
+    """节点达到并发上限后不再分到请求（即使它延迟最低）；熔断的节点不计入容量"""
+    pool = BackendPool(
+        ["http://a/v1", "http://b/v1"], strategy="latency", failure_threshold=1,
+        recovery_timeout=60, probe_interval=0, max_in_flight_per_backend=2
+    )
+    fast, slow = pool.backends
+    fast.ewma_latency, slow.ewma_latency = 0.01, 1.0
+    assert pool.capacity() == 4
+    assert [pool.acquire() for _ in range(3)] == [fast, fast, slow]
+
+    pool.record_failure(slow)
+    pool.release(slow)
+    assert slow.state == OPEN
+    assert pool.capacity() == 2
+    # 不限制每个节点的并发时没有容量上限
+    assert BackendPool(["http://a/v1"], probe_interval=0).capacity() is None
+
+
+@pytest.mark.asyncio
+async def test_requests_avoid_failed_node(stub_env, monkeypatch):
+    """一个节点不可达时，请求在熔断后全部转到健康节点"""
+    llm_server, _ = stub_env
+    monkeypatch.setenv("OLLAMA_BASE_URLS", f"{_closed_port_url()},{llm_server.url}/v1")
+    monkeypatch.setenv("LLM_FAILURE_THRESHOLD", "1")
+    monkeypatch.setenv("LLM_RECOVERY_TIMEOUT", "60")
+    service = OpenAIService()
+    for backend in service.backend_pool.backends:
+        backend.async_client = backend.async_client.with_options(max_retries=0)
+
+    results = []
+    for _ in range(4):
+        events = [e async for e in service.chat_completion_stream("你好")]
+        results.append(events[-1]["type"])
+
+    dead, alive = service.backend_pool.backends
+    assert dead.state == OPEN
+    assert results.count("done") >= 3
+    assert alive.total_requests >= 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_streams_spread_across_nodes(monkeypatch, search_server):
+    """并发的流式请求分布到多个节点"""
+    with StubServer(create_llm_app(token_delay=0.02)) as a, StubServer(create_llm_app(token_delay=0.02)) as b:
+        monkeypatch.setenv("OLLAMA_BASE_URLS", f"{a.url}/v1,{b.url}/v1")
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        monkeypatch.setenv("TAVILY_BASE_URL", search_server.url)
+        service = OpenAIService()
+
+        async def consume():
+            return [e async for e in service.chat_completion_stream("你好")]
+
+        await asyncio.gather(*(consume() for _ in range(6)))
+        assert a.stats.requests == 3 and b.stats.requests == 3
+        assert all(backend.in_flight == 0 for backend in service.backend_pool.backends)
+
+
+def test_health_reports_backends(stub_env, monkeypatch):
+    """/health 返回每个节点的状态和在途请求数；健康检查失败的节点被标记"""
+    llm_server, _ = stub_env
+    monkeypatch.setenv("OLLAMA_BASE_URLS", f"{llm_server.url}/v1,{_closed_port_url()}")
+    service = OpenAIService()
+    asyncio.run(service.backend_pool.probe_all())
+    monkeypatch.setattr(main, "openai_service", service)
+
+    data = TestClient(main.app).get("/health").json()
+    assert data["status"] == "healthy"
+    assert [b["healthy"] for b in data["backends"]] == [True, False]
+    assert all("in_flight" in b and "state" in b for b in data["backends"])
@@ -0,0 +1,111 @@
+"""
+上下文管理测试
+测试目标：验证 token 估算、预算内截断、工具结果压缩和逐条缓存
+"""
+
+import json
+import sys
+import threading
+
+from backend.services.context_manager import ContextManager, estimate_tokens
+
+
+def _turn(index: int, with_search: bool = True):
+    """构造一个完整回合：用户问题、工具调用、搜索结果、最终回答"""
+    messages = [{"role": "user", "content": f"第 {index} 个问题"}]
+    if with_search:
+        call_id = f"call_{index}"
+        messages.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call_id, "type": "function",
+                            "function": {"name": "search", "arguments": json.dumps({"query": f"q{index}"})}}],
+        })
+        messages.append({
+            "role": "tool",
+            "tool_call_id": call_id,
+            "content": json.dumps({
+                "success": True,
+                "query": f"q{index}",
+                "results": [{"title": f"t{i}", "url": f"https://e.com/{i}", "content": "长" * 300, "score": 0.9}
+                            for i in range(5)],
+            }, ensure_ascii=False),
+        })
+    messages.append({"role": "assistant", "content": f"第 {index} 个回答" + "。" * 50})
+    return messages
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("北京天气") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_history_tool_results_are_compacted():
+    """历史中的搜索结果只保留查询、标题和链接"""
+    manager = ContextManager(token_budget=100000)
+    messages = manager.build("系统", _turn(0), "新问题")
+    tool = next(m for m in messages if m["role"] == "tool")
+    data = json.loads(tool["content"])
+    assert data["query"] == "q0"
+    assert data["results"][0] == {"title": "t0", "url": "https://e.com/0"}
+    assert manager.count_message(tool) < 100
+
+
+def test_truncates_oldest_whole_turns():
+    """超出预算时丢弃最旧的完整回合，保留的 tool 消息总有对应的 tool_calls"""
+    history = [m for i in range(30) for m in _turn(i, with_search=i % 2 == 0)]
+    manager = ContextManager(token_budget=800)
+    messages = manager.build("系统", history, "新问题")
+
+    assert messages[0]["role"] == "system"
+    assert messages[-1] == {"role": "user", "content": "新问题"}
+    assert messages[1]["role"] == "user"
+    assert manager.count_messages(messages) <= 800
+    # 保留的是最新的回合
+    assert messages[-2]["content"].startswith("第 29 个回答")
+
+    call_ids = {c["id"] for m in messages for c in m.get("tool_calls") or []}
+    assert all(m["tool_call_id"] in call_ids for m in messages if m["role"] == "tool")
+
+
+def test_token_counts_are_cached_per_message():
+    """同一段历史的第二次构建只计算新增消息"""
+    history = [m for i in range(10) for m in _turn(i)]
+    manager = ContextManager(token_budget=100000)
+    manager.build("系统", history, "问题一")
+    misses = manager.cache_misses
+
+    history += _turn(10)
+    manager.build("系统", history, "问题二")
+    # 新回合 4 条消息 + 新的用户消息
+    assert manager.cache_misses - misses == 5
+
+
+def test_caches_are_safe_across_threads():
+    """线程池中的非流式路径和事件循环同时使用缓存：淘汰与读取交错时不抛出 KeyError"""
+    manager = ContextManager(cache_size=4)
+    messages = [{"role": "user", "content": f"问题 {i % 16}"} for i in range(2000)]
+    tool = lambda i: {"role": "tool", "tool_call_id": "c", "content": json.dumps({"query": str(i % 16), "results": []})}
+    errors = []
+
+    def worker():
+        try:
+            for i, message in enumerate(messages):
+                manager.count_message(message)
+                manager.compact_tool_message(tool(i))
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(manager._cache) <= 4 and len(manager._compact_cache) <= 4
@@ -0,0 +1,81 @@
+"""
+对话存储测试
+测试目标：验证分页读取、批量写入、持久化，以及多轮对话历史会发送给模型
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.conversation_store import MemoryConversationStore, SQLiteConversationStore
+from backend.services.openai_service import OpenAIService
+
+
+@pytest.mark.asyncio
+async def test_memory_store_pagination_and_eviction():
+    """按对话分页读取；超过对话数量上限时淘汰最久未访问的对话"""
+    store = MemoryConversationStore(max_conversations=2)
+    await store.append("a", [{"role": "user", "content": f"m{i}"} for i in range(5)])
+    await store.append("b", [{"role": "user", "content": "b"}])
+
+    page = await store.get_messages("a", offset=1, limit=2)
+    assert [m["content"] for m in page] == ["m1", "m2"]
+    assert all("timestamp" in m for m in page)
+    assert await store.count("a") == 5
+
+    await store.append("c", [{"role": "user", "content": "c"}])
+    assert await store.count("b") == 0
+    assert await store.count("a") == 5
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_batches_writes(tmp_path):
+    """多次 append 合并为一次提交；工具调用字段可以完整读回；重新打开后数据仍在"""
+    path = str(tmp_path / "conversations.db")
+    store = SQLiteConversationStore(path, flush_interval=60, batch_size=100)
+    tool_calls = [{"id": "call_1", "type": "function", "function": {"name": "search", "arguments": "{}"}}]
+    await store.append("a", [{"role": "user", "content": "你好"}])
+    await store.append("a", [
+        {"role": "assistant", "content": None, "tool_calls": tool_calls},
+        {"role": "tool", "tool_call_id": "call_1", "content": "{}"},
+    ])
+    await store.append("b", [{"role": "user", "content": "另一个对话"}])
+    assert store.flushes == 0
+
+    messages = await store.get_messages("a")
+    assert store.flushes == 1
+    assert [m["role"] for m in messages] == ["user", "assistant", "tool"]
+    assert messages[1]["tool_calls"] == tool_calls
+    assert messages[2]["tool_call_id"] == "call_1"
+    await store.close()
+
+    reopened = SQLiteConversationStore(path)
+    assert await reopened.count("a") == 3
+    assert [m["content"] for m in await reopened.get_messages("a", offset=2, limit=5)] == ["{}"]
+    await reopened.close()
+
+
+def test_multi_turn_history_round_trip(stub_env, monkeypatch):
+    """流式回合与非流式回合都会保存，下一轮请求会带上历史消息"""
+    llm_server, _ = stub_env
+    monkeypatch.setattr(main, "openai_service", OpenAIService())
+    monkeypatch.setattr(main, "conversation_store", MemoryConversationStore())
+    client = TestClient(main.app)
+
+    with client.stream("POST", "/api/chat/stream", json={"message": "请搜索北京天气", "conversation_id": "c1"}) as response:
+        assert response.headers["x-conversation-id"] == "c1"
+        events = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data: ")]
+    assert events[-1]["type"] == "done"
+
+    response = client.post("/api/chat", json={"message": "那明天呢", "conversation_id": "c1"})
+    assert response.status_code == 200
+
+    sent = llm_server.stats.bodies[-1]["messages"]
+    assert [m["role"] for m in sent] == ["system", "user", "assistant", "tool", "assistant", "user"]
+    assert all("timestamp" not in m for m in sent)
+
+    history = client.get("/api/conversations/c1", params={"offset": 0, "limit": 3}).json()
+    assert history["total"] == 6
+    assert [m["role"] for m in history["messages"]] == ["user", "assistant", "tool"]
@@ -0,0 +1,102 @@
+"""
+客户端断开测试
+测试目标：验证客户端断开后，进行中的上游 LLM 流和待执行的工具调用在限定时间内被取消，
+并发槽位被释放，取消次数记录到指标中
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.services.admission import AdmissionController
+from backend.services.openai_service import OpenAIService
+from backend.services.resumable_stream import StreamRegistry
+from backend.services.tracing import METRICS
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+# 断开后允许的最长清理时间
+CANCEL_DEADLINE = 1.0
+
+
+async def _wait_until(predicate, timeout: float) -> float:
+    start = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - start > timeout:
+            raise AssertionError("超时")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def _read_then_disconnect(client: httpx.AsyncClient, message: str, until, coalesce_ms=None) -> None:
+    body = {"message": message}
+    # None 表示不传，使用服务端默认的合并窗口
+    if coalesce_ms is not None:
+        body["coalesce_ms"] = coalesce_ms
+    async with client.stream("POST", "/api/chat/stream", json=body) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and until(json.loads(line[6:])):
+                break
+
+
+@pytest.fixture
+def disconnect_env(monkeypatch):
+    """慢速 LLM（60 个 token，每个 50ms）和慢速搜索（2 秒），断开后不等待重连"""
+    tokens = ["字"] * 60
+    with StubServer(create_llm_app(tokens=tokens, token_delay=0.05)) as llm, \
+            StubServer(create_search_app(latency=2.0)) as search, \
+            StubServer(main.app) as api:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm.url}/v1")
+        monkeypatch.setenv("TAVILY_BASE_URL", search.url)
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        monkeypatch.setattr(main, "openai_service", OpenAIService())
+        monkeypatch.setattr(main, "admission", AdmissionController(max_in_flight=2))
+        monkeypatch.setattr(main, "stream_registry", StreamRegistry(disconnect_grace=0))
+        yield llm, search, api
+
+
+# 分别覆盖关闭合并（0）和默认合并窗口两种路径
+COALESCE_CASES = pytest.mark.parametrize("coalesce_ms", [0, None], ids=["no_coalesce", "default_coalesce"])
+
+
+@pytest.mark.asyncio
+@COALESCE_CASES
+async def test_disconnect_cancels_upstream_generation(disconnect_env, coalesce_ms):
+    llm, _, api = disconnect_env
+
+    async with httpx.AsyncClient(base_url=api.url, timeout=10) as client:
+        await _read_then_disconnect(client, "你好", lambda e: e["type"] == "content", coalesce_ms)
+
+    # 上游流在限定时间内被关闭，而不是等 3 秒生成完
+    elapsed = await _wait_until(lambda: llm.stats.active == 0, CANCEL_DEADLINE)
+    assert elapsed < CANCEL_DEADLINE
+    assert llm.stats.cancelled == 1 and llm.stats.completed == 0
+    await _wait_until(lambda: main.admission.in_flight == 0, CANCEL_DEADLINE)
+    pool = main.openai_service.backend_pool
+    assert all(backend.in_flight == 0 for backend in pool.backends)
+    # 取消不算作后端故障
+    assert all(backend.consecutive_failures == 0 for backend in pool.backends)
+    assert 'chat_requests_total{mode="stream",status="cancelled"}' in METRICS.render()
+    assert 'stream_cancelled_total{reason="disconnect"}' in METRICS.render()
+
+
+@pytest.mark.asyncio
+@COALESCE_CASES
+async def test_disconnect_during_search_skips_final_generation(disconnect_env, coalesce_ms):
+    llm, search, api = disconnect_env
+
+    async with httpx.AsyncClient(base_url=api.url, timeout=10) as client:
+        await _read_then_disconnect(
+            client, "请搜索北京天气",
+            lambda e: e["type"] == "tool_call" and e.get("tool_status") == "started",
+            coalesce_ms
+        )
+
+    # 工具调用被取消，槽位立即释放，不会等到 2 秒的搜索结束后再请求最终回复
+    await _wait_until(lambda: main.admission.in_flight == 0, CANCEL_DEADLINE)
+    await asyncio.sleep(2.2)
+    assert llm.stats.requests == 1
+    assert search.stats.requests <= 1
@@ -0,0 +1,58 @@
+"""
+共享连接池测试
+测试目标：验证 LLM 后端、搜索共用按上游划分的连接池，连接在请求之间复用，
+连接池状态导出到统计和指标中
+"""
+
+import asyncio
+
+import pytest
+
+from backend.services.http_pool import HTTPClients
+from backend.services.openai_service import OpenAIService
+from backend.services.tracing import METRICS
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused_across_requests(stub_env):
+    llm_server, search_server = stub_env
+    service = OpenAIService()
+    http = service.http_clients
+    assert service.tavily_service.http_clients is http
+    assert service.backend_pool.backends[0].async_client._client is http.async_client("llm")
+
+    for i in range(3):
+        events = [e async for e in service.chat_completion_stream(f"请搜索第 {i} 条新闻")]
+        assert events[-1]["type"] == "done"
+
+    stats = http.stats()["upstreams"]
+    # 每次回答两次 LLM 请求、一次搜索，全部复用同一条连接
+    assert stats["llm"]["requests"] == 6 and stats["llm"]["connections_opened"] == 1
+    assert stats["search"]["requests"] == 3 and stats["search"]["connections_opened"] == 1
+    assert stats["llm"]["pools"]["async"] == {"active": 0, "idle": 1}
+
+    http.update_metrics()
+    text = METRICS.render()
+    assert 'http_pool_connections{state="idle",upstream="llm"} 1' in text
+    assert 'http_connect_seconds_count{upstream="search"}' in text
+
+    await http.aclose()
+    assert http.stats()["upstreams"] == {}
+
+
+@pytest.mark.asyncio
+async def test_pool_size_bounds_concurrent_connections(stub_env, monkeypatch):
+    """并发超过 HTTP_MAX_CONNECTIONS 时请求排队等待连接，而不是新建更多连接"""
+    monkeypatch.setenv("HTTP_MAX_CONNECTIONS", "2")
+    _, search_server = stub_env
+    http = HTTPClients()
+    client = http.async_client("search")
+
+    responses = await asyncio.gather(*(
+        client.post(f"{search_server.url}/search", json={"query": f"q{i}"}) for i in range(6)
+    ))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert search_server.stats.max_active <= 2
+    assert http.stats()["upstreams"]["search"]["connections_opened"] == 2
+    await http.aclose()
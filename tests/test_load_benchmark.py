@@ -0,0 +1,45 @@
+"""
+压测基准冒烟测试
+测试目标：验证压测脚本能在桩服务器上跑完一个小规模配置，并输出可对比的指标
+"""
+
+import backend.main as main
+from benchmarks.load_test import percentile, run_benchmark
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile([0.0, 10.0], 95) == 9.5
+
+
+def test_small_benchmark_run(monkeypatch):
+    """小规模压测：所有请求成功，流式模式有首 token 和 token 间隔统计"""
+    for key in ("OLLAMA_BASE_URL", "TAVILY_BASE_URL", "TAVILY_API_KEY",
+                "LLM_MAX_IN_FLIGHT_PER_BACKEND", "ADMISSION_MAX_QUEUE"):
+        monkeypatch.setenv(key, "")
+    monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+    monkeypatch.setattr(main, "openai_service", main.openai_service)
+    monkeypatch.setattr(main, "admission", main.admission)
+
+    report = run_benchmark({
+        "modes": ["stream", "chat"],
+        "concurrency": [2],
+        "requests": 4,
+        "tokens": 5,
+        "token_delay": 0.001,
+        "first_token_delay": 0.0,
+        "search_latency": 0.01,
+        "search_ratio": 0.5,
+        "max_in_flight": 2,
+        "max_queue": 16,
+        # 逐 token 发送，才能统计 token 间隔
+        "coalesce_ms": 0,
+    })
+
+    assert report["meta"]["config"]["requests"] == 4
+    stream, chat = report["results"]
+    assert stream["ok"] == 4 and chat["ok"] == 4
+    assert stream["first_token_p50_ms"] is not None
+    assert stream["inter_token_p95_ms"] is not None
+    assert stream["tokens_per_sec"] > 0
@@ -0,0 +1,77 @@
+"""
+低内存配置测试
+测试目标：验证配置的优先级（显式设置 > 内存预算 > 低内存默认值），
+每个流式增量使用紧凑的事件对象，对话历史有界，以及 /api/memory 的 tracemalloc 报告
+"""
+
+import sys
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.conversation_store import MemoryConversationStore
+from backend.services.http_pool import HTTPPoolConfig
+from backend.services.memory_profile import setting
+from backend.services.search_cache import create_search_cache
+from backend.services.sse import Delta
+
+
+def test_setting_precedence(monkeypatch):
+    assert setting("SEARCH_CACHE_MAX_ENTRIES", "512") == "512"
+
+    monkeypatch.setenv("MEMORY_PROFILE", "low")
+    assert HTTPPoolConfig().max_connections == 4
+    assert create_search_cache().max_entries == 64
+
+    # 预算的 10% 按每条约 8KB 计算
+    monkeypatch.setenv("MEMORY_BUDGET_MB", "16")
+    assert create_search_cache().max_entries == 204
+    assert setting("HTTP_MAX_CONNECTIONS", "32") == "4"
+
+    monkeypatch.setenv("SEARCH_CACHE_MAX_ENTRIES", "10")
+    assert create_search_cache().max_entries == 10
+
+
+def test_delta_is_compact_mapping():
+    delta = Delta("content", "你好")
+    assert delta == {"type": "content", "content": "你好"}
+    assert dict(delta) == {"type": "content", "content": "你好"} and delta.get("round") is None
+    assert sys.getsizeof(delta) < sys.getsizeof({"type": "content", "content": "你好"}) / 2
+    with pytest.raises(AttributeError):
+        delta.extra = 1
+
+
+@pytest.mark.asyncio
+async def test_conversation_history_is_bounded():
+    store = MemoryConversationStore(max_conversations=2, max_messages=5)
+    for i in range(3):
+        await store.append("c", [
+            {"role": "user", "content": f"问题 {i}"},
+            {"role": "assistant", "content": "", "tool_calls": [{"id": f"call_{i}"}]},
+            {"role": "tool", "tool_call_id": f"call_{i}", "content": "{}"},
+            {"role": "assistant", "content": f"回答 {i}"},
+        ])
+    # 超出时丢弃完整的回合，保留的历史以用户消息开头
+    messages = await store.get_messages("c")
+    assert [m["content"] for m in messages if m["role"] == "user"] == ["问题 2"]
+    assert len(messages) == 4
+
+
+def test_memory_endpoint_reports_allocations():
+    client = TestClient(main.app)
+    report = client.get("/api/memory").json()
+    assert report["profile"] == "default"
+    assert report["rss_bytes"] > 0 and report["peak_rss_bytes"] >= report["rss_bytes"]
+
+    tracemalloc.start()
+    try:
+        blob = [bytearray(1024) for _ in range(256)]
+        report = client.get("/api/memory", params={"limit": 5}).json()["tracemalloc"]
+    finally:
+        tracemalloc.stop()
+    assert report["tracing"] and report["current_bytes"] >= 256 * 1024
+    assert len(report["top"]) == 5
+    assert any(entry["location"].startswith(__file__) for entry in report["top"])
+    del blob
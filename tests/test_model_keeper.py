@@ -0,0 +1,106 @@
+"""
+模型预热与保活测试
+测试目标：验证启动预热之后第一个请求不再等待模型加载，每个请求带上 keep_alive，
+近期有流量时在卸载之前重新预热、没有流量时任由模型卸载，/health 区分 up 和 warm
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.model_keeper import parse_keep_alive
+from backend.services.openai_service import OpenAIService
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+LOAD_DELAY = 0.5
+
+
+@pytest.fixture
+def cold_env(monkeypatch):
+    """模型未加载时需要等待 LOAD_DELAY 的 LLM 桩"""
+    with StubServer(create_llm_app(token_delay=0.0, load_delay=LOAD_DELAY, keep_alive=1.0)) as llm, \
+            StubServer(create_search_app(latency=0.0)) as search:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm.url}/v1")
+        monkeypatch.setenv("TAVILY_BASE_URL", search.url)
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        yield llm
+
+
+def test_parse_keep_alive():
+    assert parse_keep_alive(None) is None and parse_keep_alive(" ") is None
+    assert parse_keep_alive("600") == 600 and parse_keep_alive("-1") == -1 and parse_keep_alive("1.5") == 1.5
+    assert parse_keep_alive("30m") == "30m"
+
+
+async def _first_token_seconds(service: OpenAIService) -> float:
+    start = time.perf_counter()
+    async for event in service.chat_completion_stream("你好"):
+        if event["type"] == "content":
+            return time.perf_counter() - start
+    raise AssertionError("没有收到回答")
+
+
+@pytest.mark.asyncio
+async def test_warm_up_avoids_cold_first_request(cold_env, monkeypatch):
+    monkeypatch.setenv("MODEL_KEEP_ALIVE", "120")
+    service = OpenAIService()
+    # SDK 的导入不计入首 token 时间
+    service.preload()
+    keeper = service.model_keeper
+    assert not keeper.is_warm()
+
+    await keeper.warm_up()
+    assert keeper.is_warm() and cold_env.stats.model_loads == 1
+    status = keeper.status()["models"][0]
+    assert status["loaded"] and 100 < status["expires_in"] <= 121
+    # 预热请求带上系统提示词和工具定义，与正式请求共享提示词前缀
+    warmup = cold_env.stats.native_bodies[0]
+    assert warmup["keep_alive"] == 120 and warmup["tools"] == service.tools
+    assert warmup["messages"][0]["content"] == service.system_prompt
+
+    assert await _first_token_seconds(service) < LOAD_DELAY
+    assert cold_env.stats.model_loads == 1
+    assert cold_env.stats.bodies[-1]["keep_alive"] == 120
+
+
+@pytest.mark.asyncio
+async def test_keeper_rewarms_only_while_traffic_expected(cold_env, monkeypatch):
+    monkeypatch.setenv("MODEL_KEEPER_INTERVAL", "0.2")
+    service = OpenAIService()
+    service.preload()
+    keeper = service.model_keeper
+    await keeper.warm_up()
+    keeper.start()
+    try:
+        # 桩服务器 1 秒后卸载模型，保活在剩余 0.4 秒以内时重新预热
+        await asyncio.sleep(2.0)
+        assert keeper.is_warm() and keeper.warmups >= 2
+        assert cold_env.stats.model_loads == 1
+
+        # 超出流量窗口后不再预热，模型按时卸载
+        keeper.traffic_window = 0
+        await asyncio.sleep(1.6)
+        assert not keeper.is_warm()
+        assert await _first_token_seconds(service) >= LOAD_DELAY
+        assert cold_env.stats.model_loads == 2
+    finally:
+        await keeper.stop()
+
+
+def test_health_reports_up_and_warm(cold_env, monkeypatch):
+    monkeypatch.setattr(main, "openai_service", None)
+    monkeypatch.setattr(main, "service_error", None)
+
+    with TestClient(main.app) as client:
+        health = client.get("/health").json()
+        assert health["up"] and health["status"] == "healthy"
+        deadline = time.monotonic() + 10
+        while not health["warm"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+            health = client.get("/health").json()
+        assert health["models"]["models"][0]["loaded"]
+        assert 'llm_model_warmups_total{reason="startup",result="ok"}' in client.get("/metrics").text
@@ -0,0 +1,96 @@
+"""
+按阶段选择模型测试
+测试目标：验证规划（工具决策）和回答使用各自配置的模型，长消息直接使用回答模型，
+规划模型直接回答时按策略交给回答模型或保留，两个模型相同时只调用一次
+"""
+
+import time
+
+import pytest
+
+from backend.services.model_router import ModelRouter, PLANNING, ANSWER
+from backend.services.openai_service import OpenAIService
+
+
+def test_route_rules():
+    router = ModelRouter("tiny", "big", long_message_chars=10)
+    assert router.route("你好", 0, True) == (PLANNING, "tiny")
+    assert router.route("这是一条超过十个字符的比较长的问题", 0, True) == (PLANNING, "big")
+    # 已有搜索结果或不再允许调用工具时使用回答模型
+    assert router.route("你好", 1, True) == (ANSWER, "big")
+    assert router.route("你好", 0, False) == (ANSWER, "big")
+    assert router.hands_off(PLANNING, "tiny") and not router.hands_off(PLANNING, "big")
+    assert router.models == ["tiny", "big"] and router.signature == "tiny|big"
+
+    same = ModelRouter("qwen3:1.7b", "qwen3:1.7b")
+    assert same.models == ["qwen3:1.7b"] and not same.hands_off(*same.route("你好", 0, True))
+    with pytest.raises(ValueError):
+        ModelRouter(planner_answers="other")
+
+
+@pytest.fixture
+def routed_env(monkeypatch, stub_env):
+    monkeypatch.setenv("PLANNER_MODEL", "tiny")
+    monkeypatch.setenv("ANSWER_MODEL", "big")
+    monkeypatch.setenv("ROUTE_LONG_MESSAGE_CHARS", "20")
+    llm_server, _ = stub_env
+    return llm_server
+
+
+async def _ask(service: OpenAIService, message: str):
+    events = [e async for e in service.chat_completion_stream(message)]
+    assert events[-1]["type"] == "done"
+    return "".join(e["content"] for e in events if e["type"] == "content")
+
+
+@pytest.mark.asyncio
+async def test_stream_routes_each_stage(routed_env):
+    service = OpenAIService()
+    assert service.model_keeper.models == ["tiny", "big"]
+    bodies = routed_env.stats.bodies
+
+    # 规划模型开始直接回答时被中止，回答只由回答模型生成一次，不再提供工具
+    assert await _ask(service, "你好") == "这是一个来自桩服务的回答。"
+    assert [b["model"] for b in bodies] == ["tiny", "big"]
+    assert bodies[1]["tool_choice"] == "none"
+
+    # 规划模型决定搜索，回答模型根据搜索结果回答
+    bodies.clear()
+    assert await _ask(service, "请搜索北京天气") == "这是一个来自桩服务的回答。"
+    assert [b["model"] for b in bodies] == ["tiny", "big"]
+    assert bodies[1]["messages"][-1]["role"] == "tool"
+
+    # 长消息直接使用回答模型
+    bodies.clear()
+    await _ask(service, "请搜索" + "北京明天的天气和空气质量怎么样" * 2)
+    assert [b["model"] for b in bodies] == ["big", "big"]
+
+
+@pytest.mark.asyncio
+async def test_keep_planner_answer(routed_env, monkeypatch):
+    monkeypatch.setenv("PLANNER_DIRECT_ANSWER", "keep")
+    service = OpenAIService()
+    assert await _ask(service, "你好") == "这是一个来自桩服务的回答。"
+    assert [b["model"] for b in routed_env.stats.bodies] == ["tiny"]
+
+
+def test_non_stream_hands_off(routed_env):
+    service = OpenAIService()
+    result = service.chat_completion("你好")
+    assert result["success"] and result["response"] == "这是一个来自桩服务的回答。"
+    bodies = routed_env.stats.bodies
+    assert [b["model"] for b in bodies] == ["tiny", "big"]
+    assert [m["role"] for m in result["messages"]] == ["user", "assistant"]
+    # 规划调用以流式请求发送，在第一个回答 token 处中止，不等待完整的回答
+    assert bodies[0]["stream"] and not bodies[1].get("stream")
+    deadline = time.monotonic() + 5
+    while routed_env.stats.cancelled < 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert routed_env.stats.completed == 1
+
+    # 规划模型决定搜索时照常执行工具调用
+    bodies.clear()
+    result = service.chat_completion("请搜索北京天气")
+    assert result["tool_calls_made"] == ["search"]
+    assert [b["model"] for b in bodies] == ["tiny", "big"]
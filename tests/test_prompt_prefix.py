@@ -0,0 +1,66 @@
+"""
+提示词前缀稳定性测试
+测试目标：验证消息规范化、前缀复用诊断、截断点对齐，以及多轮对话中上游可复用的前缀比例
+"""
+
+import asyncio
+
+from backend.services.context_manager import ContextManager
+from backend.services.openai_service import OpenAIService
+from backend.services.prompt_prefix import PrefixTracker, canonical_message
+
+
+def test_canonical_message_is_order_independent():
+    a = {"tool_call_id": "c1", "content": "x", "role": "tool", "timestamp": 1}
+    b = {"role": "tool", "content": "x", "tool_call_id": "c1"}
+    assert list(canonical_message(a).items()) == list(canonical_message(b).items())
+    assert canonical_message({"role": "assistant", "content": None})["content"] == ""
+
+
+def test_prefix_tracker_reports_reused_messages():
+    tracker = PrefixTracker()
+    first = [{"role": "system", "content": "s"}, {"role": "user", "content": "q1"}]
+    assert tracker.record("m", first)["reused_messages"] == 0
+
+    second = first + [{"role": "assistant", "content": "a1"}, {"role": "user", "content": "q2"}]
+    report = tracker.record("m", second)
+    assert report["reused_messages"] == 2
+    # 模型或工具不同则前缀不可复用
+    assert tracker.record("other", second)["reused_messages"] == 0
+    assert tracker.stats()["prefix_hits"] == 1
+
+
+def test_truncation_point_moves_in_steps():
+    """预算饱和后，截断点每 truncate_step 轮才移动一次"""
+    manager = ContextManager(token_budget=300, truncate_step=4)
+    history = []
+    first_kept = []
+    for i in range(30):
+        messages = manager.build("系统", history, f"问题 {i}")
+        first_kept.append(messages[1]["content"] if len(messages) > 2 else None)
+        history += [{"role": "user", "content": f"问题 {i}"}, {"role": "assistant", "content": "回答" * 20}]
+
+    saturated = [c for c in first_kept if c and c != "问题 0"]
+    changes = sum(1 for a, b in zip(saturated, saturated[1:]) if a != b)
+    assert saturated and changes <= len(saturated) // 4 + 1
+
+
+def test_multi_turn_conversation_reuses_prefix(stub_env):
+    """多轮对话中，每次请求都能复用上一次请求的大部分前缀"""
+    llm_server, _ = stub_env
+    service = OpenAIService()
+    history = []
+
+    async def conversation():
+        for i in range(6):
+            turn = []
+            message = f"请搜索第 {i} 条新闻" if i % 2 else f"第 {i} 个问题"
+            async for _ in service.chat_completion_stream(message, history, turn):
+                pass
+            history.extend(turn)
+
+    asyncio.run(conversation())
+
+    stats = service.prefix_tracker.stats()
+    assert stats["prefix_hits"] >= stats["requests"] - 1
+    assert llm_server.stats.prefix_reuse_rate > 0.5
@@ -0,0 +1,90 @@
+"""
+回答缓存测试
+测试目标：验证不调用工具的回答被缓存并按流式事件回放，只有全角字符和首尾空白不同的问题命中，
+符号不同的问题不命中，
+调用了工具的回答不缓存，默认关闭
+"""
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+from backend.services.response_cache import make_response_key
+from backend.services.search_cache import MemorySearchCache
+
+
+async def _stream(service: OpenAIService, message: str, history=None):
+    turn = []
+    events = [e async for e in service.chat_completion_stream(message, history, turn)]
+    return events, turn
+
+
+@pytest.mark.asyncio
+async def test_cached_answer_is_replayed_as_stream(stub_env):
+    llm_server, _ = stub_env
+    service = OpenAIService(response_cache=MemorySearchCache(ttl=60, max_entries=8))
+
+    first, first_turn = await _stream(service, "你好")
+    second, second_turn = await _stream(service, " 你好\n")
+
+    assert llm_server.stats.requests == 1
+    text = lambda events: "".join(e["content"] for e in events if e["type"] == "content")
+    assert text(second) == text(first) == "这是一个来自桩服务的回答。"
+    # 事件序列与模型输出一致：状态、分段内容、done
+    assert [e["type"] for e in second[:2]] == ["status", "status"]
+    assert second[-1]["type"] == "done"
+    assert len([e for e in second if e["type"] == "content"]) > 1
+    # 写入历史的是本轮的原始问题
+    assert second_turn == [
+        {"role": "user", "content": " 你好\n"},
+        {"role": "assistant", "content": "这是一个来自桩服务的回答。"},
+    ]
+    assert first_turn[-1] == second_turn[-1]
+
+    # 非流式接口共享同一份缓存
+    result = service.chat_completion("你好")
+    assert result["response"] == "这是一个来自桩服务的回答。"
+    assert llm_server.stats.requests == 1
+
+
+def test_questions_differing_in_symbols_do_not_share_answers():
+    key = lambda question: make_response_key("m", [{"role": "user", "content": question}], None)
+    assert key("1+1等于几") != key("11等于几")
+    assert key("3.14 是什么") != key("314 是什么")
+    assert key("-5 的绝对值") != key("5 的绝对值")
+    assert key("请问，你好？") != key("你好")
+    assert key(" １+１等于几\n") == key("1+1等于几")
+
+
+@pytest.mark.asyncio
+async def test_symbol_difference_misses_cache(stub_env):
+    llm_server, _ = stub_env
+    service = OpenAIService(response_cache=MemorySearchCache(ttl=60, max_entries=8))
+
+    await _stream(service, "1+1")
+    await _stream(service, "11")
+    assert llm_server.stats.requests == 2
+    assert len(service.response_cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_tool_answers_are_not_cached(stub_env):
+    llm_server, _ = stub_env
+    service = OpenAIService(response_cache=MemorySearchCache(ttl=60, max_entries=8))
+
+    await _stream(service, "请搜索北京天气")
+    await _stream(service, "请搜索北京天气")
+
+    assert llm_server.stats.requests == 4
+    assert len(service.response_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_response_cache_is_opt_in(stub_env, monkeypatch):
+    llm_server, _ = stub_env
+    monkeypatch.delenv("RESPONSE_CACHE", raising=False)
+    service = OpenAIService()
+    assert service.response_cache is None
+
+    await _stream(service, "你好")
+    await _stream(service, "你好")
+    assert llm_server.stats.requests == 2
@@ -0,0 +1,123 @@
+"""
+断点续传测试
+测试目标：验证事件带递增 id、断线后带 Last-Event-ID 重连可以重放缺失事件并继续接收，
+且不会重新请求模型；环形缓冲溢出时给出提示
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.services.openai_service import OpenAIService
+from backend.services.resumable_stream import ResumableStream, StreamRegistry, parse_last_event_id
+from stub_servers import StubServer, create_llm_app
+
+
+def _parse(frames):
+    """将 SSE 帧解析为 (id, 事件) 列表"""
+    events = []
+    for frame in b"".join(frames).decode("utf-8").split("\n\n"):
+        if not frame:
+            continue
+        fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((fields.get("id"), json.loads(fields["data"])))
+    return events
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("abc:12") == ("abc", 12)
+    assert parse_last_event_id("abc") is None
+    assert parse_last_event_id(None) is None
+
+
+@pytest.mark.asyncio
+async def test_replay_after_last_event_and_overflow():
+    stream = ResumableStream("s1", max_events=3)
+    for i in range(5):
+        stream.publish({"type": "content", "content": str(i)})
+    stream.finish()
+
+    replayed = _parse([frame async for frame in stream.subscribe(3)])
+    assert replayed == [("s1:4", {"type": "content", "content": "3"}), ("s1:5", {"type": "content", "content": "4"})]
+
+    # 序号 1 之后的事件只剩 3~5，先提示部分内容已过期
+    overflowed = _parse([frame async for frame in stream.subscribe(1)])
+    assert overflowed[0][1]["type"] == "status"
+    assert [event["content"] for _, event in overflowed[1:]] == ["2", "3", "4"]
+
+
+@pytest.mark.asyncio
+async def test_idle_streams_expire():
+    registry = StreamRegistry(idle_ttl=0.01)
+
+    async def forever():
+        while True:
+            await asyncio.sleep(1)
+            yield {"type": "status", "content": "..."}
+
+    stream = registry.start("s1", forever())
+    await asyncio.sleep(0.05)
+    assert registry.get("s1") is None
+    await asyncio.sleep(0)
+    assert stream.task.cancelled()
+    assert registry.stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sweeper_drops_finished_streams_without_traffic():
+    """后台清理：生成结束且无人连接的流在空闲超时后被删除，不需要新的请求触发"""
+    registry = StreamRegistry(idle_ttl=0.05)
+    registry.start_sweeper()
+
+    async def short():
+        yield {"type": "done"}
+
+    registry.start("s1", short())
+    await asyncio.sleep(0.2)
+    assert registry.stats()["streams"] == 0
+    assert registry.stats()["expired"] == 1
+    await registry.close()
+    assert registry._sweep_task is None
+
+
+@pytest.mark.asyncio
+async def test_reconnect_with_last_event_id(stub_env, monkeypatch):
+    """断线后重连继续接收同一次生成，拼出完整回答，上游只被请求一次"""
+    with StubServer(create_llm_app(token_delay=0.05)) as slow_llm, StubServer(main.app) as api:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{slow_llm.url}/v1")
+        monkeypatch.setattr(main, "openai_service", OpenAIService())
+        body = {"message": "你好", "coalesce_ms": 0}
+
+        async with httpx.AsyncClient(base_url=api.url, timeout=10) as client:
+            first = []
+            async with client.stream("POST", "/api/chat/stream", json=body) as response:
+                stream_id = response.headers["x-stream-id"]
+                async for line in response.aiter_lines():
+                    if line.startswith("id: "):
+                        last_id = line[4:]
+                    elif line.startswith("data: "):
+                        first.append(json.loads(line[6:]))
+                        if sum(e["type"] == "content" for e in first) == 2:
+                            break
+
+            assert last_id.startswith(f"{stream_id}:")
+            rest = []
+            async with client.stream("POST", "/api/chat/stream", json=body, headers={"Last-Event-ID": last_id}) as response:
+                assert response.headers["x-stream-id"] == stream_id
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        rest.append(json.loads(line[6:]))
+
+            # GET 接口从头重放已完成的流
+            replay = await client.get(f"/api/chat/stream/{stream_id}")
+            missing = await client.get("/api/chat/stream/unknown")
+
+    content = "".join(e["content"] for e in first + rest if e["type"] == "content")
+    assert content == "这是一个来自桩服务的回答。"
+    assert rest[-1]["type"] == "done"
+    assert slow_llm.stats.requests == 1
+    assert replay.text.count("data: ") == len(first) + len(rest)
+    assert missing.status_code == 404
@@ -0,0 +1,93 @@
+"""
+搜索缓存测试
+测试目标：验证查询规范化、TTL 过期、LRU 淘汰、SQLite 持久化以及 TavilyService 的缓存命中
+"""
+
+import time
+
+import pytest
+
+from backend.services.search_cache import (
+    MemorySearchCache,
+    SQLiteSearchCache,
+    make_cache_key,
+    normalize_query,
+)
+from backend.services.tavily_service import TavilyService
+
+
+def test_normalize_query():
+    """近似查询应当得到同一个键，不同的结果数量则不同"""
+    assert normalize_query("北京天气") == normalize_query("今天北京天气")
+    assert normalize_query("请问 北京天气？") == normalize_query("北京天气")
+    assert normalize_query("Python  News") == normalize_query("python news")
+    assert make_cache_key("北京天气", 5) != make_cache_key("北京天气", 3)
+    assert normalize_query("北京天气") != normalize_query("上海天气")
+    assert normalize_query("请问，今天天气怎么样？") == normalize_query("天气怎么样")
+
+
+def test_normalize_query_keeps_meaningful_symbols():
+    """符号、数字和查询中间的“填充词”不去掉"""
+    assert normalize_query("C++ 教程") != normalize_query("C 教程")
+    assert normalize_query("C# 教程") != normalize_query("C 教程")
+    assert normalize_query("3.14 是什么") != normalize_query("314 是什么")
+    assert normalize_query("-5 的绝对值") != normalize_query("5 的绝对值")
+    assert normalize_query("搜索引擎推荐") == "搜索引擎推荐"
+    assert normalize_query("一下子明白了") == "一下子明白了"
+    assert normalize_query("北京今天天气") == "北京今天天气"
+    assert normalize_query("今天") == "今天"
+
+
+def test_memory_cache_ttl_and_lru():
+    """过期条目不再命中；超过容量时淘汰最久未使用的条目"""
+    cache = MemorySearchCache(ttl=60, max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}  # a 变为最近使用
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.evictions == 1
+
+    cache.set("short", {"v": 4}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_persists(tmp_path):
+    """SQLite 缓存跨实例持久化，同步和异步接口互通，并按容量淘汰"""
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteSearchCache(path, ttl=60, max_entries=2)
+    cache.set("a", {"v": 1})
+    await cache.set_async("b", {"v": 2})
+    assert await cache.get_async("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    await cache.close()
+
+    reopened = SQLiteSearchCache(path, ttl=60, max_entries=2)
+    assert reopened.get("a") == {"v": 1}
+    assert await reopened.get_async("c") == {"v": 3}
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_tavily_service_uses_cache(stub_env):
+    """近似查询只访问一次上游，返回结果中的 query 仍是本次查询"""
+    _, search_server = stub_env
+    service = TavilyService(cache=MemorySearchCache(ttl=60, max_entries=16))
+
+    first = await service.search_async("北京天气", 3)
+    second = await service.search_async("今天北京天气", 3)
+    third = service.search("北京天气？", 3)
+
+    assert first["success"] and second["success"] and third["success"]
+    assert second["query"] == "今天北京天气"
+    assert second["results"] == first["results"]
+    assert search_server.stats.requests == 1
+    assert service.cache_stats()["hits"] == 2
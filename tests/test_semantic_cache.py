@@ -0,0 +1,91 @@
+"""
+近似查询缓存测试
+测试目标：验证相似度阈值、分区、过期与淘汰，以及 TavilyService 对改写查询的近似命中
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from backend.services.semantic_cache import EmbeddingClient, SemanticCache
+from backend.services.tavily_service import TavilyService
+
+
+def _unit(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_lookup_threshold_and_partition():
+    """只有同一分区内相似度达到阈值的条目才命中"""
+    cache = SemanticCache(max_entries=4, threshold=0.9)
+    cache.add(_unit(1, 0, 0), {"v": "a"}, partition=5)
+
+    assert cache.lookup(_unit(0.95, 0.05, 0), partition=5) == {"v": "a"}
+    assert cache.lookup(_unit(0.5, 0.5, 0), partition=5) is None
+    assert cache.lookup(_unit(1, 0, 0), partition=3) is None
+    # 维度不同（更换了模型）时不命中
+    assert cache.lookup(_unit(1, 0), partition=5) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+    value, score = cache.lookup_scored(_unit(1, 0, 0), partition=5)
+    assert value == {"v": "a"} and score == pytest.approx(1.0)
+
+
+def test_eviction_and_ttl():
+    """近似重复的写入覆盖原条目；已满时先淘汰过期条目，再淘汰最久未使用的条目"""
+    cache = SemanticCache(max_entries=2, threshold=0.9)
+    cache.add(_unit(1, 0, 0), {"v": "a"})
+    cache.add(_unit(0.99, 0.01, 0), {"v": "a2"})
+    assert len(cache) == 1 and cache.lookup(_unit(1, 0, 0)) == {"v": "a2"}
+
+    cache.add(_unit(0, 1, 0), {"v": "b"}, ttl=-1)
+    cache.add(_unit(0, 0, 1), {"v": "c"})
+    assert cache.lookup(_unit(1, 0, 0)) == {"v": "a2"}
+    assert cache.lookup(_unit(0, 0, 1)) == {"v": "c"}
+
+    cache.lookup(_unit(0, 0, 1))
+    cache.add(_unit(1, 1, 1), {"v": "d"})
+    assert cache.lookup(_unit(1, 0, 0)) is None
+    assert cache.lookup(_unit(0, 0, 1)) == {"v": "c"}
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["matrix_bytes"] == 2 * 3 * 4
+
+
+@pytest.mark.asyncio
+async def test_paraphrased_search_hits(stub_env):
+    """改写后的查询通过桩服务的嵌入接口命中近似缓存，不再访问搜索上游"""
+    llm_server, search_server = stub_env
+    embedder = EmbeddingClient(f"{llm_server.url}/v1", "stub-embed")
+    service = TavilyService(semantic_cache=SemanticCache(embedder, threshold=0.8))
+
+    first = await service.search_async("北京明天的天气怎么样")
+    second = await service.search_async("北京明天天气怎么样啊")
+    third = service.search("上海股市行情")
+
+    assert first["success"] and second["success"] and third["success"]
+    assert second["query"] == "北京明天天气怎么样啊"
+    # 结果标明来自哪个查询和相似度，不冒充为当前查询的结果
+    assert second["matched_query"] == "北京明天的天气怎么样" and second["semantic_hit"]
+    assert 0.8 <= second["similarity"] <= 1.0
+    assert "matched_query" not in first
+    assert second["results"] == first["results"]
+    assert search_server.stats.requests == 2
+    assert service.semantic_cache_stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_lookup_runs_off_event_loop():
+    """异步查找的矩阵乘法在线程中执行，不阻塞其他流"""
+    class Embedder:
+        async def embed_async(self, text):
+            return _unit(1, 0, 0)
+
+    cache = SemanticCache(Embedder(), threshold=0.9)
+    await cache.add_async(_unit(1, 0, 0), {"query": "北京天气"})
+    threads = []
+    lookup_scored = cache.lookup_scored
+    cache.lookup_scored = lambda *args: threads.append(threading.get_ident()) or lookup_scored(*args)
+
+    value, vector = await cache.get_async("北京今天的天气")
+    assert value == {"query": "北京天气", "similarity": 1.0} and vector is not None
+    assert threads and threads[0] != threading.get_ident()
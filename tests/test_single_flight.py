@@ -0,0 +1,154 @@
+"""
+请求合并测试
+测试目标：验证并发的相同调用只执行一次，所有等待者得到同一结果
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+from backend.services.single_flight import SingleFlight
+from backend.services.tavily_service import TavilyService
+
+
+@pytest.mark.asyncio
+async def test_async_calls_are_coalesced():
+    """并发相同 key 只执行一次；结束后再次调用会重新执行"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"value": calls}
+
+    results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(10)))
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"executed": 1, "shared": 9, "in_flight": 0}
+
+    await flight.do("k", fetch)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_async_errors_and_cancellation():
+    """异常共享给所有等待者；单个等待者取消不影响其他等待者"""
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("e", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    leader = asyncio.create_task(flight.do("s", slow))
+    follower = asyncio.create_task(flight.do("s", slow))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == "ok"
+
+    # 所有等待者都取消时，进行中的调用也被取消
+    started = asyncio.Event()
+    finished = []
+
+    async def tracked():
+        started.set()
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    waiter = asyncio.create_task(flight.do("c", tracked))
+    await started.wait()
+    waiter.cancel()
+    await asyncio.sleep(0.1)
+    assert finished == []
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_join_right_after_last_waiter_cancels():
+    """最后一个等待者取消后立即加入的调用者开始新的调用，不会得到被取消任务的 CancelledError"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    waiter = asyncio.create_task(flight.do("k", slow))
+    await started.wait()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    # 被取消的任务的完成回调还没有运行
+    assert await flight.do("k", slow) == "ok"
+    assert flight.executed == 2
+
+
+def test_sync_calls_are_coalesced():
+    """线程中的并发相同调用同样只执行一次"""
+    flight = SingleFlight()
+    calls = []
+    results = []
+    barrier = threading.Barrier(8)
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return "shared"
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do_sync("k", fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["shared"] * 8
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_upstream(stub_env):
+    """缓存未命中时，并发的相同搜索只访问一次 Tavily"""
+    _, search_server = stub_env
+    service = TavilyService()
+
+    results = await asyncio.gather(*(service.search_async("突发新闻", 3) for _ in range(20)))
+
+    assert all(r["success"] for r in results)
+    assert search_server.stats.requests == 1
+    assert service.single_flight.stats()["shared"] == 19
+
+
+def test_concurrent_identical_planning_calls_share_upstream(stub_env):
+    """并发的相同问题只发送一次规划请求"""
+    llm_server, _ = stub_env
+    service = OpenAIService()
+    barrier = threading.Barrier(5)
+
+    def worker():
+        barrier.wait()
+        service._create_planning_completion(service._prepare_messages("你好"), service.tools)
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert llm_server.stats.requests == 1
+    assert service.planning_flight.stats()["shared"] == 4
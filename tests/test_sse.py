@@ -0,0 +1,77 @@
+"""
+SSE 编码与合并测试
+测试目标：验证快速编码与 json.dumps 结果等价，时间窗口内的内容增量被合并，
+以及客户端可以按请求关闭合并
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.openai_service import OpenAIService
+from backend.services.sse import Delta, coalesce_content, encode_event
+
+
+@pytest.mark.parametrize("event", [
+    {"type": "content", "content": "你好\n\"世界\"\\"},
+    {"type": "status", "content": "正在生成回复..."},
+    {"type": "done"},
+    {"type": "tool_call", "tool_name": "search", "tool_args": {"query": "天气"}, "tool_status": "started"},
+    Delta("content", "逐 token 的\n增量"),
+    Delta("reasoning", "<推理>"),
+])
+def test_encode_event_matches_json(event):
+    frame = encode_event(event).decode("utf-8")
+    assert frame.startswith("data: ") and frame.endswith("\n\n")
+    assert json.loads(frame[6:]) == event
+
+
+async def _source(items):
+    for delay, event in items:
+        await asyncio.sleep(delay)
+        yield event
+
+
+@pytest.mark.asyncio
+async def test_coalesce_within_window_and_flush_on_other_events():
+    content = lambda text: {"type": "content", "content": text}
+    items = [
+        (0, {"type": "status", "content": "开始"}),
+        (0, content("a")), (0.001, content("b")), (0.001, content("c")),
+        # 超过窗口后到达的增量单独成帧
+        (0.1, content("d")),
+        (0, {"type": "done"}),
+    ]
+    merged = [e async for e in coalesce_content(_source(items), window_ms=30, max_bytes=1024)]
+    assert merged == [{"type": "status", "content": "开始"}, content("abc"), content("d"), {"type": "done"}]
+
+    # 字节阈值
+    items = [(0, content("xx")) for _ in range(5)]
+    merged = [e async for e in coalesce_content(_source(items), window_ms=1000, max_bytes=4)]
+    assert [e["content"] for e in merged] == ["xxxx", "xxxx", "xx"]
+
+    # 窗口为 0 时原样转发
+    items = [(0, content("a")), (0, content("b"))]
+    assert len([e async for e in coalesce_content(_source(items), window_ms=0)]) == 2
+
+
+def test_stream_endpoint_coalesce_opt_out(stub_env, monkeypatch):
+    """默认合并内容增量；coalesce_ms=0 时逐 token 发送"""
+    monkeypatch.setattr(main, "openai_service", OpenAIService())
+    client = TestClient(main.app)
+
+    def contents(body):
+        with client.stream("POST", "/api/chat/stream", json=body) as response:
+            events = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data: ")]
+        assert events[-1]["type"] == "done"
+        return [e["content"] for e in events if e["type"] == "content"]
+
+    # 桩服务每 20ms 一个 token，100ms 窗口内会合并多个
+    merged = contents({"message": "你好", "coalesce_ms": 100})
+    unmerged = contents({"message": "你好", "coalesce_ms": 0})
+    assert "".join(merged) == "".join(unmerged) == "这是一个来自桩服务的回答。"
+    assert len(unmerged) == 7
+    assert len(merged) < len(unmerged)
@@ -0,0 +1,63 @@
+"""
+冷启动测试
+测试目标：验证导入 backend.main 不导入上游 SDK，服务在 lifespan 中创建，
+SDK 客户端在后台预热，第一次请求之前 /health 就可以响应
+"""
+
+import subprocess
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from conftest import project_root
+
+
+def test_import_does_not_load_sdks():
+    code = (
+        "import sys, backend.main as main\n"
+        "print(main.openai_service, sorted(m for m in ('openai', 'tavily', 'requests', 'numpy') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "None []"
+
+
+def test_lifespan_creates_and_warms_service(monkeypatch, stub_env):
+    monkeypatch.setattr(main, "openai_service", None)
+    monkeypatch.setattr(main, "service_error", None)
+
+    with TestClient(main.app) as client:
+        assert client.get("/health").json()["status"] == "healthy"
+        service = main.openai_service
+        backend = service.backend_pool.backends[0]
+        deadline = time.monotonic() + 10
+        while backend._async_client is None or service.tavily_service._async_client is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        response = client.post("/api/chat", json={"message": "你好"})
+        assert response.status_code == 200
+        assert service.backend_pool._probe_task is not None
+
+
+def test_shutdown_closes_sqlite_caches(monkeypatch, stub_env, tmp_path):
+    """SQLite 缓存的异步连接在关闭时释放，否则其非守护线程使进程无法退出"""
+    monkeypatch.setattr(main, "openai_service", None)
+    monkeypatch.setattr(main, "service_error", None)
+    monkeypatch.setenv("SEARCH_CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("SEARCH_CACHE_PATH", str(tmp_path / "search.db"))
+    monkeypatch.setenv("RESPONSE_CACHE", "sqlite")
+    monkeypatch.setenv("RESPONSE_CACHE_PATH", str(tmp_path / "response.db"))
+
+    with TestClient(main.app) as client:
+        with client.stream("POST", "/api/chat/stream", json={"message": "请搜索北京天气"}) as response:
+            assert '"done"' in response.read().decode()
+        service = main.openai_service
+        assert service.tavily_service.cache._async_conn is not None
+        assert service.response_cache._async_conn is not None
+
+    assert service.tavily_service.cache._async_conn is None
+    assert service.response_cache._async_conn is None
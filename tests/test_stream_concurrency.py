@@ -0,0 +1,76 @@
+"""
+流式接口并发测试
+测试目标：验证 chat_completion_stream 不阻塞事件循环，多个流可以交错推进
+使用本地桩服务器，不需要 Ollama / Tavily
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+
+STREAM_COUNT = 5
+
+
+async def _consume(service: OpenAIService, index: int, message: str, log: list):
+    """消费一个流，记录每个内容事件的来源"""
+    events = []
+    async for event in service.chat_completion_stream(message):
+        events.append(event)
+        if event["type"] == "content":
+            log.append(index)
+    return events
+
+
+def _switches(log: list) -> int:
+    """统计事件日志中相邻事件来自不同流的次数"""
+    return sum(1 for a, b in zip(log, log[1:]) if a != b)
+
+
+@pytest.mark.asyncio
+async def test_streams_progress_interleaved(stub_env):
+    """多个直接回答的流应当交错输出 token，而不是逐个串行完成"""
+    llm_server, _ = stub_env
+    service = OpenAIService()
+    log = []
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        _consume(service, i, "你好", log) for i in range(STREAM_COUNT)
+    ))
+    elapsed = time.perf_counter() - start
+
+    for events in results:
+        assert events[-1]["type"] == "done"
+    # 串行执行时每个流的 token 会连续出现，只会切换 STREAM_COUNT - 1 次
+    assert _switches(log) > STREAM_COUNT * 2
+    assert llm_server.stats.max_active > 1
+
+    # 单个流约 7 个 token * 20ms，串行需要数倍时间
+    single_stream = 7 * 0.02
+    assert elapsed < single_stream * STREAM_COUNT * 0.6
+
+
+@pytest.mark.asyncio
+async def test_searches_run_concurrently(stub_env):
+    """多个需要搜索的流应当并发等待搜索，而不是累加搜索延迟"""
+    llm_server, search_server = stub_env
+    service = OpenAIService()
+    log = []
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        _consume(service, i, f"请搜索第 {i} 个城市的天气", log) for i in range(STREAM_COUNT)
+    ))
+    elapsed = time.perf_counter() - start
+
+    for events in results:
+        types = [e["type"] for e in events]
+        assert "tool_call" in types
+        assert types[-1] == "done"
+    assert search_server.stats.requests == STREAM_COUNT
+    assert search_server.stats.max_active > 1
+    # 搜索桩延迟 200ms，串行至少需要 1 秒
+    assert elapsed < 0.2 * STREAM_COUNT * 0.6
@@ -0,0 +1,62 @@
+"""
+流式规划测试
+测试目标：验证第一次调用直接流式输出；不需要搜索时只请求一次上游，需要搜索时正确累积工具调用增量
+"""
+
+import json
+
+import pytest
+from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCall, ChoiceDeltaToolCallFunction
+
+from backend.services.openai_service import OpenAIService
+
+
+def test_tool_call_deltas_are_accumulated():
+    """id、函数名和参数分散在多个增量中时可以拼出完整的工具调用"""
+    parts = {}
+    OpenAIService._accumulate_tool_call_deltas(parts, [
+        ChoiceDeltaToolCall(index=0, id="call_a", function=ChoiceDeltaToolCallFunction(name="search", arguments='{"qu')),
+        ChoiceDeltaToolCall(index=1, id="call_b", function=ChoiceDeltaToolCallFunction(name="search", arguments="{}")),
+    ])
+    OpenAIService._accumulate_tool_call_deltas(parts, [
+        ChoiceDeltaToolCall(index=0, function=ChoiceDeltaToolCallFunction(arguments='ery": "天气"}')),
+    ])
+    tool_calls = OpenAIService._build_tool_calls(parts)
+    assert [t.id for t in tool_calls] == ["call_a", "call_b"]
+    assert json.loads(tool_calls[0].function.arguments) == {"query": "天气"}
+
+
+@pytest.mark.asyncio
+async def test_direct_answer_uses_single_streamed_call(stub_env):
+    """不需要搜索时，内容来自第一次流式调用，不再发起第二次请求"""
+    llm_server, _ = stub_env
+    service = OpenAIService()
+    turn = []
+
+    events = [e async for e in service.chat_completion_stream("你好", None, turn)]
+
+    assert llm_server.stats.requests == 1
+    assert llm_server.stats.bodies[0]["stream"] is True
+    assert llm_server.stats.bodies[0]["tools"]
+    content = "".join(e["content"] for e in events if e["type"] == "content")
+    assert content == "这是一个来自桩服务的回答。"
+    assert events[-1]["type"] == "done"
+    assert turn[-1] == {"role": "assistant", "content": content}
+
+
+@pytest.mark.asyncio
+async def test_search_answer_dispatches_streamed_tool_calls(stub_env):
+    """需要搜索时，累积的工具调用被执行，最终回答来自第二次流式调用"""
+    llm_server, search_server = stub_env
+    service = OpenAIService()
+    turn = []
+
+    events = [e async for e in service.chat_completion_stream("请搜索北京天气", None, turn)]
+
+    assert llm_server.stats.requests == 2
+    assert search_server.stats.bodies[0]["query"] == "请搜索北京天气"
+    started = [e for e in events if e["type"] == "tool_call" and e["tool_status"] == "started"]
+    assert started[0]["tool_args"] == {"query": "请搜索北京天气"}
+    assert [m["role"] for m in turn] == ["user", "assistant", "tool", "assistant"]
+    assert turn[1]["tool_calls"][0]["id"] == started[0]["tool_call_id"]
+    assert events[-1]["type"] == "done"
@@ -0,0 +1,85 @@
+"""
+推理过滤测试
+测试目标：验证 <think> 块在任意切分的增量中都能和回答正确拆分，推理默认不发送也不写入历史，
+快速模式只在指定的调用上追加 /no_think
+"""
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+from backend.services.think_filter import ThinkStreamParser, split_reasoning, REASONING, CONTENT
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+
+def _split(chunks):
+    parser = ThinkStreamParser()
+    parts = [part for chunk in chunks for part in parser.feed(chunk)] + parser.flush()
+    return (
+        "".join(text for kind, text in parts if kind == REASONING),
+        "".join(text for kind, text in parts if kind == CONTENT)
+    )
+
+
+def test_parser_any_chunk_boundary():
+    """按任意长度切分，结果与整体拆分一致；回答中的 <think> 原样保留"""
+    text = "\n<think>\n先想一想 a<b 的情况\n</think>\n\n答案是 <think> 标签。"
+    expected = ("\n先想一想 a<b 的情况\n", "答案是 <think> 标签。")
+    assert split_reasoning(text) == expected
+    for size in range(1, len(text) + 1):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert _split(chunks) == expected, size
+
+    # 没有推理块、推理块未闭合、只有空的推理块
+    assert split_reasoning("直接回答") == ("", "直接回答")
+    assert _split(["<thi", "nk>还没想完"]) == ("还没想完", "")
+    assert split_reasoning("<think>\n\n</think>\n\n好的") == ("\n\n", "好的")
+    assert _split(["<", "b>加粗</b>"]) == ("", "<b>加粗</b>")
+
+
+@pytest.fixture
+def think_env(monkeypatch):
+    """回答前输出推理的 LLM 桩"""
+    with StubServer(create_llm_app(token_delay=0.0, think_tokens=["用户", "在问", "天气"])) as llm, \
+            StubServer(create_search_app(latency=0.0)) as search:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm.url}/v1")
+        monkeypatch.setenv("TAVILY_BASE_URL", search.url)
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        yield llm
+
+
+@pytest.mark.asyncio
+async def test_stream_drops_or_emits_reasoning(think_env):
+    service = OpenAIService()
+
+    turn = []
+    events = [e async for e in service.chat_completion_stream("你好", None, turn)]
+    assert events[-1]["type"] == "done"
+    assert not [e for e in events if e["type"] == "reasoning"]
+    assert "".join(e["content"] for e in events if e["type"] == "content") == "这是一个来自桩服务的回答。"
+    assert turn[-1]["content"] == "这是一个来自桩服务的回答。"
+
+    turn = []
+    events = [e async for e in service.chat_completion_stream("请搜索北京天气", None, turn, include_reasoning=True)]
+    reasoning = [e["content"] for e in events if e["type"] == "reasoning"]
+    # 规划和工具调用之后的回答各推理一次
+    assert "".join(reasoning) == "\n用户在问天气\n" * 2
+    assert all("think" not in (m.get("content") or "") for m in turn)
+
+    result = service.chat_completion("你好", include_reasoning=True)
+    assert result["response"] == "这是一个来自桩服务的回答。"
+    assert result["reasoning"] == "\n用户在问天气\n"
+
+
+@pytest.mark.asyncio
+async def test_fast_mode_disables_thinking_per_call(think_env):
+    service = OpenAIService()
+
+    for fast, expected in (("planning", [True, False]), ("final", [False, True]), ("all", [True, True])):
+        think_env.stats.bodies.clear()
+        turn = []
+        events = [e async for e in service.chat_completion_stream(f"请搜索{fast}", None, turn, fast=fast)]
+        assert events[-1]["type"] == "done"
+        switches = [body["messages"][1]["content"].endswith("/no_think") for body in think_env.stats.bodies]
+        assert switches == expected, fast
+        # 开关不写入对话历史
+        assert turn[0]["content"] == f"请搜索{fast}"
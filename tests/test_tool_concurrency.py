@@ -0,0 +1,74 @@
+"""
+工具调用并发测试
+测试目标：验证同一轮的多个工具调用并发执行、受并发上限约束，且结果按原始顺序回填
+"""
+
+import json
+import time
+
+import pytest
+
+from backend.services.openai_service import OpenAIService
+from stub_servers import StubServer, create_llm_app, create_search_app
+
+
+@pytest.fixture
+def multi_tool_env(monkeypatch):
+    """LLM 桩每轮返回 4 个工具调用，搜索桩让越靠前的查询越慢"""
+    llm_app = create_llm_app(token_delay=0.0, tool_calls_per_turn=4)
+    search_app = create_search_app(latency=lambda query: 0.25 - 0.05 * int(query.rsplit("#", 1)[-1]))
+    with StubServer(llm_app) as llm_server, StubServer(search_app) as search_server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", f"{llm_server.url}/v1")
+        monkeypatch.setenv("TAVILY_BASE_URL", search_server.url)
+        monkeypatch.setenv("TAVILY_API_KEY", "tvly-stub")
+        yield llm_server, search_server
+
+
+@pytest.mark.asyncio
+async def test_stream_tool_calls_fan_out(multi_tool_env):
+    """流式接口：并发执行、上限生效、每个调用都有开始和结束事件、结果顺序不变"""
+    llm_server, search_server = multi_tool_env
+    service = OpenAIService(max_concurrent_tools=2)
+    # 与 lifespan 一样预先导入 SDK，计时只包含请求本身
+    service.preload()
+
+    start = time.perf_counter()
+    events = [event async for event in service.chat_completion_stream("请搜索新闻")]
+    elapsed = time.perf_counter() - start
+
+    assert events[-1]["type"] == "done"
+    tool_events = [e for e in events if e["type"] == "tool_call"]
+    started = [e["tool_call_id"] for e in tool_events if e["tool_status"] == "started"]
+    completed = [e["tool_call_id"] for e in tool_events if e["tool_status"] == "completed"]
+    assert len(started) == 4 and sorted(started) == sorted(completed)
+
+    assert search_server.stats.max_active == 2
+    # 串行需要 0.25+0.2+0.15+0.1=0.7 秒
+    assert elapsed < 0.6
+
+    # 最终请求中的 tool 消息顺序与 assistant 的 tool_calls 顺序一致
+    final_messages = llm_server.stats.bodies[-1]["messages"]
+    assistant = next(m for m in final_messages if m.get("tool_calls"))
+    tool_ids = [m["tool_call_id"] for m in final_messages if m["role"] == "tool"]
+    assert tool_ids == [c["id"] for c in assistant["tool_calls"]]
+    queries = [json.loads(m["content"])["query"] for m in final_messages if m["role"] == "tool"]
+    assert queries == [f"请搜索新闻 #{i}" for i in range(4)]
+
+
+def test_sync_tool_calls_fan_out(multi_tool_env):
+    """非流式接口：同样并发执行并保持顺序"""
+    llm_server, search_server = multi_tool_env
+    service = OpenAIService(max_concurrent_tools=4)
+
+    start = time.perf_counter()
+    result = service.chat_completion("请搜索新闻")
+    elapsed = time.perf_counter() - start
+
+    assert result["success"]
+    assert result["tool_calls_made"] == ["search"] * 4
+    assert search_server.stats.max_active == 4
+    assert elapsed < 0.6
+
+    final_messages = llm_server.stats.bodies[-1]["messages"]
+    queries = [json.loads(m["content"])["query"] for m in final_messages if m["role"] == "tool"]
+    assert queries == [f"请搜索新闻 #{i}" for i in range(4)]
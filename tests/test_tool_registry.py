@@ -0,0 +1,106 @@
+"""
+工具注册表测试
+测试目标：验证注册时的定义校验、编译后的参数校验、同步 / 异步分发，
+以及未知工具以 tool 消息返回错误而不是被跳过
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from backend.services.context_manager import ContextManager
+from backend.services.openai_service import OpenAIService
+from backend.services.prompt_prefix import PrefixTracker
+from backend.services.response_cache import make_response_key
+from backend.services.tool_registry import ToolArgumentError, ToolRegistry, compile_schema, tools_json
+from backend.services.tavily_service import SEARCH_TOOL_DEFINITION
+
+
+def _definition(name, parameters):
+    return {"type": "function", "function": {"name": name, "description": name, "parameters": parameters}}
+
+
+def test_compiled_validator():
+    """补齐默认值、丢弃未声明字段、接受数字字符串，拒绝越界和缺少的必填参数"""
+    validate = compile_schema(SEARCH_TOOL_DEFINITION["function"]["parameters"])
+    assert validate({"query": "北京天气"}) == {"query": "北京天气", "max_results": 5}
+    assert validate({"query": "北京天气", "max_results": "3", "extra": 1}) == {"query": "北京天气", "max_results": 3}
+    for bad in ({}, {"query": 1}, {"query": "x", "max_results": 20}, {"query": "x", "max_results": True}):
+        with pytest.raises(ToolArgumentError):
+            validate(bad)
+
+    with pytest.raises(ValueError):
+        compile_schema({"type": "object", "properties": {}, "required": ["query"]})
+    with pytest.raises(ValueError):
+        compile_schema({"type": "object", "properties": {"q": {"type": "str"}}})
+
+
+def test_definitions_serialized_once_at_registration(monkeypatch):
+    """工具定义在注册时序列化；token 计数、回答缓存键和前缀诊断直接使用，不再序列化工具列表"""
+    registry = ToolRegistry()
+    registry.register(SEARCH_TOOL_DEFINITION, handler=lambda **kwargs: {"success": True})
+    definitions = registry.definitions
+    assert json.loads(definitions.json) == [SEARCH_TOOL_DEFINITION]
+
+    serialized = []
+    dumps = json.dumps
+    monkeypatch.setattr(json, "dumps", lambda obj, **kwargs: serialized.append(obj) or dumps(obj, **kwargs))
+    assert tools_json(definitions) is definitions.json
+    assert ContextManager().count_tools(definitions) > 0
+    make_response_key("m", [{"role": "user", "content": "你好"}], definitions)
+    PrefixTracker().record("m", [{"role": "user", "content": "你好"}], definitions)
+    assert serialized
+    assert not any(obj is definitions or (isinstance(obj, dict) and obj.get("tools") is definitions) for obj in serialized)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_sync_and_async_tools():
+    """只有同步实现或只有异步实现的工具在两条路径上都可以调用"""
+    registry = ToolRegistry()
+    registry.register(
+        _definition("add", {"type": "object", "properties": {"a": {"type": "integer"}, "b": {"type": "integer"}}}),
+        handler=lambda a, b: {"success": True, "sum": a + b}
+    )
+
+    async def echo(text):
+        await asyncio.sleep(0)
+        return {"success": True, "text": text}
+
+    registry.register(_definition("echo", {"type": "object", "properties": {"text": {"type": "string"}}}), echo)
+    assert [d["function"]["name"] for d in registry.definitions] == ["add", "echo"]
+    with pytest.raises(ValueError):
+        registry.register(_definition("add", {"type": "object"}), handler=lambda: {})
+
+    assert (await registry.call_async("add", '{"a": 1, "b": 2}'))["sum"] == 3
+    assert (await registry.call_async("echo", '{"text": "hi"}'))["text"] == "hi"
+    assert (await asyncio.to_thread(registry.call, "echo", '{"text": "hi"}'))["text"] == "hi"
+
+    unknown = await registry.call_async("weather", "{}")
+    assert unknown["success"] is False and "weather" in unknown["error"]
+    broken = registry.call("add", "{not json")
+    assert broken["success"] is False and "ToolArgumentError" in broken["error"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_tool_returns_tool_message(stub_env):
+    """模型调用未注册的工具时，返回带错误信息的 tool 消息并继续生成最终回复"""
+    llm_server, search_server = stub_env
+    service = OpenAIService()
+    original = service._build_tool_calls
+
+    def rename(parts):
+        calls = original(parts)
+        calls[0].function.name = "weather"
+        return calls
+
+    service._build_tool_calls = rename
+    turn = []
+    events = [e async for e in service.chat_completion_stream("请搜索北京天气", None, turn)]
+
+    statuses = [e["tool_status"] for e in events if e["type"] == "tool_call"]
+    assert statuses == ["started", "failed"]
+    assert events[-1]["type"] == "done"
+    tool_message = next(m for m in turn if m["role"] == "tool")
+    assert "未知的工具: weather" in json.loads(tool_message["content"])["error"]
+    assert search_server.stats.requests == 0
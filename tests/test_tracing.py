@@ -0,0 +1,75 @@
+"""
+耗时追踪测试
+测试目标：验证各阶段 span、首 token 时间和生成速度的记录，/metrics 的导出格式，
+以及流式接口的请求 ID 和可选的 timing 事件
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.services.openai_service import OpenAIService
+from backend.services.tracing import MetricsRegistry, Trace
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.describe("latency_seconds", "histogram", "延迟", (0.1, 1))
+    registry.inc("requests_total", mode="stream")
+    registry.inc("requests_total", mode="stream")
+    for value in (0.05, 0.5, 3):
+        registry.observe("latency_seconds", value, stage="planning")
+
+    text = registry.render()
+    assert 'requests_total{mode="stream"} 2' in text
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{stage="planning",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="planning",le="1"} 2' in text
+    assert 'latency_seconds_bucket{stage="planning",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{stage="planning"} 3' in text
+
+
+@pytest.mark.asyncio
+async def test_stream_records_stage_spans(stub_env):
+    """需要搜索的流式回合记录规划、工具调用、搜索上游和生成阶段"""
+    service = OpenAIService()
+    trace = Trace("req-1", registry=MetricsRegistry())
+
+    events = [e async for e in service.chat_completion_stream("请搜索北京天气", trace=trace)]
+    assert events[-1]["type"] == "done"
+
+    summary = trace.summary()
+    names = [span["name"] for span in summary["spans"]]
+    assert names == ["llm.planning", "search.upstream", "tool.search", "llm.generation"]
+    tool_span = summary["spans"][2]
+    assert tool_span["success"] is True and tool_span["tool_call_id"]
+    # 搜索桩延迟 0.2 秒
+    assert tool_span["duration_ms"] >= 150
+    assert summary["ttft_ms"] >= tool_span["start_ms"] + tool_span["duration_ms"]
+    assert summary["tokens"] == 7
+    assert summary["tokens_per_second"] > 0
+    assert trace.finished_at is not None
+
+
+def test_metrics_endpoint_and_timing_event(stub_env, monkeypatch):
+    """/metrics 导出请求计数；开启后流式响应在 done 之前发送 timing 事件"""
+    monkeypatch.setattr(main, "openai_service", OpenAIService())
+    monkeypatch.setattr(main, "SSE_TIMING_EVENT", True)
+    client = TestClient(main.app)
+
+    with client.stream("POST", "/api/chat/stream", json={"message": "你好"}, headers={"X-Request-Id": "abc123"}) as response:
+        assert response.headers["x-request-id"] == "abc123"
+        events = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data: ")]
+    assert [e["type"] for e in events[-2:]] == ["timing", "done"]
+    timing = events[-2]
+    assert timing["request_id"] == "abc123"
+    assert [span["name"] for span in timing["timing"]["spans"]] == ["llm.planning"]
+    assert timing["timing"]["ttft_ms"] is not None
+
+    text = client.get("/metrics").text
+    assert 'chat_requests_total{mode="stream",status="ok"}' in text
+    assert 'chat_span_seconds_count{span="llm.planning"}' in text
+    assert "chat_time_to_first_token_seconds_bucket" in text
+    assert "admission_in_flight 0" in text